@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import UserProfile, PharmacyProfile, ClinicProfile, DoctorProfile
+from .models import (
+    UserProfile,
+    PharmacyProfile,
+    ClinicProfile,
+    DoctorProfile,
+    UserDeletionJob,
+)
 
 
 @admin.register(UserProfile)
@@ -149,3 +155,22 @@ class DoctorProfileAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related("user")
+
+
+@admin.register(UserDeletionJob)
+class UserDeletionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "username",
+        "status",
+        "progress",
+        "rows_deleted",
+        "files_deleted",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "created_at")
+    search_fields = ("username",)
+    readonly_fields = [field.name for field in UserDeletionJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
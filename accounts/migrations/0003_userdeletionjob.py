@@ -0,0 +1,120 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_alter_clinicprofile_options_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserDeletionJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "user_id",
+                    models.PositiveIntegerField(verbose_name="identifiant utilisateur"),
+                ),
+                (
+                    "username",
+                    models.CharField(max_length=150, verbose_name="nom d'utilisateur"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "En attente"),
+                            ("running", "En cours"),
+                            ("done", "Terminée"),
+                            ("failed", "En échec"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="statut",
+                    ),
+                ),
+                (
+                    "steps_total",
+                    models.PositiveIntegerField(default=0, verbose_name="étapes"),
+                ),
+                (
+                    "steps_done",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="étapes terminées"
+                    ),
+                ),
+                (
+                    "current_step",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="étape en cours"
+                    ),
+                ),
+                (
+                    "rows_deleted",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="lignes supprimées"
+                    ),
+                ),
+                (
+                    "files_deleted",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="fichiers supprimés"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="erreur")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="créé le"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="mis à jour le"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="terminé le"
+                    ),
+                ),
+                (
+                    "requested_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="demandé par",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "suppression d'utilisateur",
+                "verbose_name_plural": "suppressions d'utilisateurs",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["user_id", "status"],
+                        name="accounts_us_user_id_1837f3_idx",
+                    )
+                ],
+            },
+        ),
+    ]
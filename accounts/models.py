@@ -135,3 +135,66 @@ class DoctorProfile(models.Model):
 
     def __str__(self):
         return f"Dr. {self.user.get_full_name()} - {self.get_specialty_display()}"
+
+
+class UserDeletionJob(models.Model):
+    """Suppression d'un compte utilisateur par lots, exécutée en arrière-plan"""
+
+    STATUS_CHOICES = [
+        ("pending", "En attente"),
+        ("running", "En cours"),
+        ("done", "Terminée"),
+        ("failed", "En échec"),
+    ]
+
+    # Pas de clé étrangère : le job doit survivre à la suppression de l'utilisateur
+    user_id = models.PositiveIntegerField(verbose_name="identifiant utilisateur")
+    username = models.CharField(max_length=150, verbose_name="nom d'utilisateur")
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="demandé par",
+    )
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="pending", verbose_name="statut"
+    )
+    steps_total = models.PositiveIntegerField(default=0, verbose_name="étapes")
+    steps_done = models.PositiveIntegerField(default=0, verbose_name="étapes terminées")
+    current_step = models.CharField(
+        max_length=100, blank=True, verbose_name="étape en cours"
+    )
+    rows_deleted = models.PositiveIntegerField(
+        default=0, verbose_name="lignes supprimées"
+    )
+    files_deleted = models.PositiveIntegerField(
+        default=0, verbose_name="fichiers supprimés"
+    )
+    error = models.TextField(blank=True, verbose_name="erreur")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="créé le")
+    updated_at = models.DateTimeField(
+        default=timezone.now, verbose_name="mis à jour le"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="terminé le")
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user_id", "status"])]
+        verbose_name = "suppression d'utilisateur"
+        verbose_name_plural = "suppressions d'utilisateurs"
+
+    def __str__(self):
+        return f"Suppression de {self.username} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        """Avancement en pourcentage"""
+        if self.status == "done":
+            return 100
+        if not self.steps_total:
+            return 0
+        return int(self.steps_done * 100 / self.steps_total)
@@ -0,0 +1,197 @@
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from payments.services import CounterService, NotificationService
+from .models import UserDeletionJob
+
+
+class UserDeletionService:
+    """Service for deleting a user and everything attached to it in chunks"""
+
+    CHUNK_SIZE = 500
+
+    # A running job whose progress has not moved for this long is taken over
+    STALE_SECONDS = 120
+
+    _plan = None
+
+    @staticmethod
+    def request(user, requested_by=None):
+        """Deactivate the user and schedule the deletion job.
+
+        Returns the job already pending or running for that user, if any.
+        The job starts after commit in the deferred task runner.
+        """
+        job = UserDeletionJob.objects.filter(
+            user_id=user.pk, status__in=["pending", "running"]
+        ).first()
+        if job:
+            return job
+
+        with transaction.atomic():
+            deactivated = User.objects.filter(pk=user.pk, is_active=True).update(
+                is_active=False
+            )
+            CounterService.adjust(
+                {"active_users": -deactivated, "pending_approvals": deactivated}
+            )
+            job = UserDeletionJob.objects.create(
+                user_id=user.pk,
+                username=user.username,
+                requested_by=requested_by,
+                steps_total=len(UserDeletionService.get_plan()),
+            )
+        NotificationService.invalidate_staff_recipients()
+        return job
+
+    @staticmethod
+    def get_plan():
+        """Deletion steps for a user, children before their parents.
+
+        Each step is ``(model, lookup, field)``: rows of ``model`` whose
+        ``lookup`` equals the user id are deleted, or get ``field`` set to
+        NULL for ``SET_NULL`` relations. Hidden relations such as
+        many-to-many tables are included, like Django's own collector does.
+        """
+        if UserDeletionService._plan is None:
+            steps = []
+
+            def visit(model, lookup, ancestors):
+                for relation in model._meta.get_fields(include_hidden=True):
+                    if not (
+                        relation.auto_created
+                        and not relation.concrete
+                        and (relation.one_to_many or relation.one_to_one)
+                    ):
+                        continue
+                    field = relation.field
+                    related_model = relation.related_model
+                    child_lookup = f"{field.name}__{lookup}"
+                    on_delete = field.remote_field.on_delete
+
+                    if on_delete is models.DO_NOTHING:
+                        continue
+                    if on_delete is models.SET_NULL:
+                        steps.append((related_model, child_lookup, field.name))
+                    elif on_delete is models.CASCADE:
+                        if related_model in ancestors:
+                            raise ValueError(
+                                f"Cyclic cascade through {related_model._meta.label}"
+                            )
+                        visit(related_model, child_lookup, ancestors | {related_model})
+                    else:
+                        raise ValueError(
+                            f"{related_model._meta.label}.{field.name} prevents "
+                            f"deleting users ({on_delete.__name__})"
+                        )
+                steps.append((model, lookup, None))
+
+            visit(User, "pk", {User})
+            UserDeletionService._plan = steps
+        return UserDeletionService._plan
+
+    @staticmethod
+    def run(job_id, chunk_size=None):
+        """Run or resume a deletion job.
+
+        Every chunk is its own transaction, so the job can be resumed after
+        a crash. Raises ``RuntimeError`` when another runner is still
+        working on the job.
+        """
+        chunk_size = chunk_size or UserDeletionService.CHUNK_SIZE
+        now = timezone.now()
+        stale = now - timedelta(seconds=UserDeletionService.STALE_SECONDS)
+        claimed = (
+            UserDeletionJob.objects.filter(pk=job_id)
+            .filter(Q(status="pending") | Q(status="running", updated_at__lt=stale))
+            .update(status="running", updated_at=now, steps_done=0)
+        )
+        if not claimed:
+            if UserDeletionJob.objects.filter(pk=job_id, status="running").exists():
+                raise RuntimeError(f"User deletion job {job_id} is already running")
+            return
+
+        job = UserDeletionJob.objects.get(pk=job_id)
+        plan = UserDeletionService.get_plan()
+        try:
+            for model, lookup, null_field in plan:
+                UserDeletionJob.objects.filter(pk=job.pk).update(
+                    current_step=model._meta.label, updated_at=timezone.now()
+                )
+                while UserDeletionService._run_chunk(
+                    job, model, lookup, null_field, chunk_size
+                ):
+                    pass
+                UserDeletionJob.objects.filter(pk=job.pk).update(
+                    steps_done=F("steps_done") + 1
+                )
+        except Exception as e:
+            # Deleting the user again starts a new job that resumes from here
+            UserDeletionJob.objects.filter(pk=job.pk).update(
+                status="failed", error=f"{type(e).__name__}: {e}"[:2000]
+            )
+            return
+
+        UserDeletionJob.objects.filter(pk=job.pk).update(
+            status="done",
+            steps_total=len(plan),
+            steps_done=len(plan),
+            current_step="",
+            finished_at=timezone.now(),
+        )
+        NotificationService.invalidate_staff_recipients()
+
+    @staticmethod
+    def _run_chunk(job, model, lookup, null_field, chunk_size):
+        """Delete (or detach) one chunk of rows; returns the number handled"""
+        queryset = model._base_manager.filter(**{lookup: job.user_id})
+        ids = list(queryset.values_list("pk", flat=True)[:chunk_size])
+        if not ids:
+            return 0
+
+        chunk = model._base_manager.filter(pk__in=ids)
+        with transaction.atomic():
+            if null_field:
+                chunk.update(**{null_field: None})
+                UserDeletionJob.objects.filter(pk=job.pk).update(
+                    updated_at=timezone.now()
+                )
+                return len(ids)
+
+            file_fields = [
+                field
+                for field in model._meta.concrete_fields
+                if isinstance(field, models.FileField)
+            ]
+            files = []
+            if file_fields:
+                for row in chunk.values_list(*[field.attname for field in file_fields]):
+                    files.extend(
+                        (field.storage, name)
+                        for field, name in zip(file_fields, row)
+                        if name
+                    )
+
+            # A regular delete, so the post_delete handlers take the rows out
+            # of the unread counters, sales rollups and customer stats. The
+            # plan already removed the children: nothing else cascades.
+            deleted, _ = chunk.delete()
+            UserDeletionJob.objects.filter(pk=job.pk).update(
+                rows_deleted=F("rows_deleted") + deleted,
+                files_deleted=F("files_deleted") + len(files),
+                updated_at=timezone.now(),
+            )
+            if files:
+                transaction.on_commit(lambda: UserDeletionService._delete_files(files))
+        return len(ids)
+
+    @staticmethod
+    def _delete_files(files):
+        for storage, name in files:
+            try:
+                storage.delete(name)
+            except OSError:
+                # Already gone or not reachable; the row is what mattered
+                pass
@@ -1,39 +1,17 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
-from django.conf import settings
 
-from payments.models import Notification
+from payments.services import NotificationService
+from payments.tasks import deferred
 from products.models import ProductReview, ProductQuestion
 from pages.models import ContactMessage
+from .models import UserDeletionJob
 
 
 def notify_admins(notification_type, title, message, **extra_data):
-    """Notifier tous les administrateurs actifs"""
-    admin_users = User.objects.filter(is_staff=True, is_active=True)
-    for admin in admin_users:
-        Notification.objects.create(
-            user=admin,
-            notification_type=notification_type,
-            title=title,
-            message=message,
-            **extra_data,
-        )
-
-
-def send_notification_email(user, title, message):
-    """Fonction auxiliaire pour envoyer des emails de notification"""
-    try:
-        send_mail(
-            subject=title,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=True,
-        )
-    except Exception:
-        pass
+    """Notifier tous les administrateurs actifs par notification et email"""
+    NotificationService.notify_staff(notification_type, title, message, **extra_data)
 
 
 @receiver(post_save, sender=User)
@@ -45,11 +23,6 @@ def notify_on_user_registration(sender, instance, created, **kwargs):
 
         notify_admins(notification_type="user_registered", title=title, message=message)
 
-        # Envoyer un email aux administrateurs
-        admin_users = User.objects.filter(is_staff=True, is_active=True)
-        for admin in admin_users:
-            send_notification_email(admin, title, message)
-
 
 @receiver(post_save, sender=ProductReview)
 def notify_on_review_submission(sender, instance, created, **kwargs):
@@ -62,11 +35,6 @@ def notify_on_review_submission(sender, instance, created, **kwargs):
             notification_type="review_submitted", title=title, message=message
         )
 
-        # Envoyer un email aux administrateurs
-        admin_users = User.objects.filter(is_staff=True, is_active=True)
-        for admin in admin_users:
-            send_notification_email(admin, title, message)
-
 
 @receiver(post_save, sender=ProductQuestion)
 def notify_on_question_submission(sender, instance, created, **kwargs):
@@ -79,11 +47,6 @@ def notify_on_question_submission(sender, instance, created, **kwargs):
             notification_type="question_submitted", title=title, message=message
         )
 
-        # Envoyer un email aux administrateurs
-        admin_users = User.objects.filter(is_staff=True, is_active=True)
-        for admin in admin_users:
-            send_notification_email(admin, title, message)
-
 
 @receiver(post_save, sender=ContactMessage)
 def notify_on_contact_message(sender, instance, created, **kwargs):
@@ -94,7 +57,12 @@ def notify_on_contact_message(sender, instance, created, **kwargs):
 
         notify_admins(notification_type="contact_message", title=title, message=message)
 
-        # Envoyer un email aux administrateurs
-        admin_users = User.objects.filter(is_staff=True, is_active=True)
-        for admin in admin_users:
-            send_notification_email(admin, title, message)
+
+@receiver(post_save, sender=UserDeletionJob)
+@deferred(atomic=False, fields=())
+def run_user_deletion_job(sender, instance, created, **kwargs):
+    """Supprimer l'utilisateur par lots, en arrière-plan"""
+    if created:
+        from .services import UserDeletionService
+
+        UserDeletionService.run(instance.pk)
@@ -0,0 +1,306 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError, models
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from payments.models import (
+    Cart,
+    CartItem,
+    CustomerStats,
+    Order,
+    OrderItem,
+    OutgoingEmail,
+)
+from payments.services import (
+    CounterService,
+    CustomerStatsService,
+    EmailTemplateService,
+    NotificationService,
+    SalesRollupService,
+)
+from payments.tests.factories import make_order, make_product, make_user
+
+from .models import UserDeletionJob
+from .services import UserDeletionService
+from .utils import BULK_STATUS_MAX_USERS, send_account_status_emails, set_users_active
+
+
+class BulkUserStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com")
+        self.pending = [
+            User.objects.create_user(f"clinique{i}", f"clinique{i}@example.com")
+            for i in range(3)
+        ]
+        self.without_email = User.objects.create_user("pharmacie")
+        self.active = User.objects.create_user("medecin", "medecin@example.com")
+        self.not_selected = User.objects.create_user("autre", "autre@example.com")
+        User.objects.exclude(pk__in=[self.admin.pk, self.active.pk]).update(
+            is_active=False
+        )
+        OutgoingEmail.objects.all().delete()
+
+    def active_usernames(self):
+        return set(
+            User.objects.filter(is_active=True).values_list("username", flat=True)
+        )
+
+    def test_only_selected_users_change(self):
+        selected = [*self.pending, self.without_email, self.active, self.admin]
+        CounterService.get_counters()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = set_users_active([user.pk for user in selected], True)
+
+        self.assertEqual(
+            summary,
+            {
+                "requested": 6,
+                "updated": 4,
+                "skipped": 2,
+                "emails_queued": 3,
+                "without_email": 1,
+            },
+        )
+        self.assertEqual(
+            self.active_usernames(),
+            {"admin", "medecin", "pharmacie", "clinique0", "clinique1", "clinique2"},
+        )
+        counters = CounterService.get_counters()
+        self.assertEqual(counters["active_users"], 6)
+        self.assertEqual(counters["pending_approvals"], 1)
+
+    def test_one_email_per_updated_user(self):
+        set_users_active([user.pk for user in self.pending], True)
+
+        emails = OutgoingEmail.objects.order_by("id")
+        self.assertEqual(
+            [email.recipients for email in emails],
+            [[user.email] for user in self.pending],
+        )
+        self.assertTrue(all("Activated" in email.subject for email in emails))
+        self.assertIn("clinique1", emails[1].body)
+
+        # Already active: nothing changes and nothing is sent again
+        summary = set_users_active([user.pk for user in self.pending], True)
+        self.assertEqual((summary["updated"], summary["emails_queued"]), (0, 0))
+        self.assertEqual(OutgoingEmail.objects.count(), 3)
+
+    def test_superusers_are_never_deactivated(self):
+        summary = set_users_active([self.admin.pk, self.active.pk], False)
+
+        self.assertEqual(summary["updated"], 1)
+        self.assertEqual(self.active_usernames(), {"admin"})
+        self.assertEqual(
+            list(OutgoingEmail.objects.values_list("recipients", flat=True)),
+            [["medecin@example.com"]],
+        )
+
+    def test_status_emails_render_in_one_batch(self):
+        EmailTemplateService.site_context()
+        # Site information comes from the cache; the emails take one insert
+        with self.assertNumQueries(1):
+            send_account_status_emails(self.pending, True)
+        self.assertEqual(OutgoingEmail.objects.count(), 3)
+
+
+class BulkUserStatusViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com")
+        self.user = User.objects.create_user("clinique", "clinique@example.com")
+        self.user.is_active = False
+        self.user.save()
+        self.url = reverse("accounts:admin_bulk_user_status")
+        self.client.force_login(self.admin)
+
+    def post(self, payload):
+        return self.client.post(
+            self.url, json.dumps(payload), content_type="application/json"
+        ).json()
+
+    def test_summary(self):
+        response = self.post({"action": "activate", "user_ids": [self.user.pk]})
+
+        self.assertTrue(response["success"])
+        self.assertEqual(response["updated"], 1)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_invalid_requests(self):
+        for payload, message in [
+            ({"action": "supprimer", "user_ids": [self.user.pk]}, "Unknown action"),
+            ({"action": "activate", "user_ids": []}, "No user selected"),
+            ({"action": "activate", "user_ids": ["x"]}, "Invalid request"),
+            (
+                {
+                    "action": "activate",
+                    "user_ids": list(range(BULK_STATUS_MAX_USERS + 1)),
+                },
+                f"At most {BULK_STATUS_MAX_USERS} users per request",
+            ),
+        ]:
+            response = self.post(payload)
+            self.assertEqual(
+                (response["success"], response["message"]), (False, message)
+            )
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+    def test_customers_are_refused(self):
+        self.client.force_login(
+            User.objects.create_user("medecin", "medecin@example.com")
+        )
+        response = self.client.post(
+            self.url,
+            json.dumps({"action": "activate", "user_ids": [self.user.pk]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+
+class AdminReportsViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com")
+        )
+
+    def test_unknown_periods_fall_back_to_thirty_days(self):
+        for value, period in [("90", 90), ("abc", 30), ("1000000", 30)]:
+            with self.subTest(period=value):
+                response = self.client.get(
+                    reverse("accounts:admin_reports"), {"period": value}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context["period"], period)
+
+
+@override_settings(DEFERRED_TASKS_EAGER=True)
+class UserDeletionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.object(UserDeletionService, "CHUNK_SIZE", 2))
+        self.admin = User.objects.create_superuser("admin", "admin@example.com")
+        self.victim = make_user("clinique", user_type="clinic")
+        self.other = make_user("pharmacie", user_type="pharmacy")
+        gloves, masks = make_product("GANTS"), make_product("MASQUES")
+        for user in (self.victim, self.other):
+            make_order(user, [(gloves, None, 2)], status="paid")
+            make_order(user, [(masks, None, 1)], status="delivered")
+            make_order(user, [(gloves, None, 1)])
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=masks, quantity=3)
+            NotificationService.create_notification(user, "order_created", "-", "-")
+        CustomerStatsService.refresh([self.victim.pk, self.other.pk])
+        self.other_stats = CustomerStats.objects.values().get(user=self.other)
+        self.other_orders = set(self.other.orders.values_list("pk", flat=True))
+        self.assertEqual(SalesRollupService.reconcile(), 0)
+        CounterService.get_counters()
+
+    def request(self):
+        # The job runs from a deferred task once the request commits
+        with self.captureOnCommitCallbacks(execute=True):
+            job = UserDeletionService.request(self.victim, requested_by=self.admin)
+        job.refresh_from_db()
+        return job
+
+    def assertOnlyVictimIsGone(self):
+        self.assertFalse(User.objects.filter(pk=self.victim.pk).exists())
+        self.assertEqual(
+            set(self.other.orders.values_list("pk", flat=True)), self.other_orders
+        )
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertTrue(CartItem.objects.filter(cart__user=self.other).exists())
+        self.assertEqual(self.other.notification_counter.unread_count, 1)
+        self.assertEqual(SalesRollupService.reconcile(), 0)
+        self.assertEqual(list(CustomerStats.objects.values()), [self.other_stats])
+        cached = CounterService.get_counters()
+        fresh = CounterService.recount()
+        self.assertEqual({name: cached[name] for name in fresh}, fresh)
+
+    def test_plan_deletes_children_before_their_parents(self):
+        plan = UserDeletionService.get_plan()
+        steps = {
+            (model, lookup): index for index, (model, lookup, _) in enumerate(plan)
+        }
+
+        self.assertEqual(plan[-1], (User, "pk", None))
+        for index, (model, lookup, null_field) in enumerate(plan):
+            if null_field:
+                continue
+            for relation in model._meta.related_objects:
+                child = (relation.related_model, f"{relation.field.name}__{lookup}")
+                if relation.on_delete is models.CASCADE:
+                    self.assertLess(steps[child], index)
+                elif relation.on_delete is models.SET_NULL:
+                    self.assertIn(child + (relation.field.name,), plan)
+        self.assertLess(
+            steps[(OrderItem, "order__user__pk")], steps[(Order, "user__pk")]
+        )
+        self.assertIn((UserDeletionJob, "requested_by__pk", "requested_by"), plan)
+
+    def test_job_deletes_only_the_user(self):
+        job = self.request()
+
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.steps_done, job.steps_total)
+        self.assertEqual(job.current_step, "")
+        self.assertGreater(job.rows_deleted, 10)
+        self.assertOnlyVictimIsGone()
+
+    def test_failed_job_is_resumed_by_a_new_request(self):
+        run_chunk = UserDeletionService._run_chunk
+
+        def fail_on_orders(job, model, *args):
+            if model is Order:
+                raise DatabaseError("connexion perdue")
+            return run_chunk(job, model, *args)
+
+        with mock.patch.object(
+            UserDeletionService, "_run_chunk", side_effect=fail_on_orders
+        ):
+            job = self.request()
+
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "DatabaseError: connexion perdue")
+        self.assertEqual(job.current_step, "payments.Order")
+        self.assertLess(job.steps_done, job.steps_total)
+        self.assertFalse(User.objects.get(pk=self.victim.pk).is_active)
+        self.assertFalse(OrderItem.objects.filter(order__user=self.victim).exists())
+        self.assertEqual(SalesRollupService.reconcile(), 0)
+
+        retry = self.request()
+        self.assertNotEqual(retry.pk, job.pk)
+        self.assertEqual(retry.status, "done")
+        self.assertOnlyVictimIsGone()
+
+    def test_running_job_is_not_run_twice(self):
+        job = UserDeletionJob.objects.create(
+            user_id=self.victim.pk, username=self.victim.username, status="running"
+        )
+
+        self.assertEqual(self.request(), job)
+        with self.assertRaises(RuntimeError):
+            UserDeletionService.run(job.pk)
+        self.assertTrue(User.objects.filter(pk=self.victim.pk).exists())
+
+        # Taken over once the runner has been silent for too long
+        UserDeletionJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now()
+            - timedelta(seconds=UserDeletionService.STALE_SECONDS + 1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            UserDeletionService.run(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertFalse(User.objects.filter(pk=self.victim.pk).exists())
@@ -60,6 +60,11 @@ urlpatterns = [
     path("admin/dashboard/", views.admin_dashboard, name="admin_dashboard"),
     # User Management
     path("admin/users/", views.admin_users_management, name="admin_users_management"),
+    path(
+        "admin/users/bulk-status/",
+        views.admin_bulk_user_status,
+        name="admin_bulk_user_status",
+    ),
     path(
         "admin/user/<int:user_id>/", views.admin_user_detail, name="admin_user_detail"
     ),
@@ -73,6 +78,11 @@ urlpatterns = [
         views.admin_delete_user,
         name="admin_delete_user",
     ),
+    path(
+        "admin/user-deletion/<int:job_id>/",
+        views.admin_user_deletion_status,
+        name="admin_user_deletion_status",
+    ),
     # Orders Management
     path(
         "admin/orders/", views.admin_orders_management, name="admin_orders_management"
@@ -191,4 +201,19 @@ urlpatterns = [
     ),
     # Reports
     path("admin/reports/", views.admin_reports, name="admin_reports"),
+    path(
+        "admin/reports/exports/",
+        views.admin_report_exports,
+        name="admin_report_exports",
+    ),
+    path(
+        "admin/reports/exports/<int:export_id>/status/",
+        views.admin_report_export_status,
+        name="admin_report_export_status",
+    ),
+    path(
+        "admin/reports/exports/<int:export_id>/download/",
+        views.admin_report_export_download,
+        name="admin_report_export_download",
+    ),
 ]
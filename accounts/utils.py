@@ -1,21 +1,46 @@
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.conf import settings
-from datetime import datetime
-from pages.models import SiteInformation
+from django.contrib.auth.models import User
+from django.db import transaction
+from payments.services import (
+    CounterService,
+    EmailTemplateService,
+    MailService,
+    NotificationService,
+)
+
+# Users handled per bulk status request; the page sends larger selections in
+# several requests to report progress
+BULK_STATUS_MAX_USERS = 500
 
 
 def send_account_status_email(user, is_active):
     """
-    Send an email notification when user account status is toggled
+    Queue an email notification when user account status is toggled
 
     Args:
         user: User object
         is_active: Boolean indicating if account is now active
     """
-    # Get site information
-    site_info = SiteInformation.get_instance()
+    return send_account_status_emails([user], is_active) == 1
+
+
+def send_account_status_emails(users, is_active):
+    """
+    Queue the account status email for several users at once
+
+    The template is rendered from the cache with one shared context and all
+    emails are queued with a single insert.
+
+    Args:
+        users: User objects whose account status changed
+        is_active: Boolean indicating if the accounts are now active
+
+    Returns:
+        Number of emails queued (users without an address are skipped)
+    """
+    users = [user for user in users if user.email]
+    if not users:
+        return 0
 
     # Determine which template to use
     template_name = (
@@ -23,36 +48,64 @@ def send_account_status_email(user, is_active):
         if is_active
         else "emails/account_deactivated.html"
     )
+    rendered = EmailTemplateService.render_batch(
+        template_name, [{"user": user} for user in users]
+    )
+
+    site_info = EmailTemplateService.site_context()["site_info"]
     subject = f'{site_info.site_name} - Your Account Has Been {"Activated" if is_active else "Deactivated"}'
 
-    # Context for the email template
-    context = {
-        "user": user,
-        "site_info": site_info,
-        "site_url": getattr(settings, "SITE_URL", "http://localhost:8000"),
-        "current_year": datetime.now().year,
-    }
+    # Queue emails; the mail worker delivers them
+    emails = MailService.enqueue_bulk(
+        [
+            (subject, text, html, user.email)
+            for user, (html, text) in zip(users, rendered)
+        ],
+        from_email=site_info.email if site_info.email else settings.DEFAULT_FROM_EMAIL,
+    )
+    return len(emails)
+
+
+def set_users_active(user_ids, is_active):
+    """
+    Activate or deactivate several users with one UPDATE and queue their emails
+
+    Superusers and users already in the requested state are left untouched.
+    The update bypasses the User post_save signals, so the cached staff
+    recipient list and the admin counters are updated here.
+
+    Args:
+        user_ids: ids of the selected users
+        is_active: Boolean, the new status
 
-    # Render HTML content
-    html_message = render_to_string(template_name, context)
-
-    # Create plain text version (fallback)
-    plain_message = strip_tags(html_message)
-
-    # Send email
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=(
-                site_info.email if site_info.email else settings.DEFAULT_FROM_EMAIL
-            ),
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
+    Returns:
+        dict summary with the number of requested, updated, skipped users
+        and queued emails
+    """
+    user_ids = set(user_ids)
+    with transaction.atomic():
+        users = list(
+            User.objects.select_for_update()
+            .filter(id__in=user_ids, is_superuser=False)
+            .exclude(is_active=is_active)
+            .only("id", "username", "email")
+        )
+        updated = User.objects.filter(id__in=[user.id for user in users]).update(
+            is_active=is_active
         )
-        return True
-    except Exception as e:
-        # Log the error in production
-        print(f"Error sending email: {str(e)}")
-        return False
+        emails_queued = send_account_status_emails(users, is_active)
+        CounterService.adjust(
+            {
+                "active_users": updated if is_active else -updated,
+                "pending_approvals": -updated if is_active else updated,
+            }
+        )
+
+    NotificationService.invalidate_staff_recipients()
+    return {
+        "requested": len(user_ids),
+        "updated": updated,
+        "skipped": len(user_ids) - updated,
+        "emails_queued": emails_queued,
+        "without_email": updated - emails_queued,
+    }
@@ -1,4 +1,5 @@
 import json
+import os
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -7,13 +8,13 @@ from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
 from datetime import timedelta
-from django.db.models import Sum, Count, Avg, F, Q, DecimalField
-from django.db.models.functions import TruncDate
+from django.db.models import Sum, Count, Avg, Q
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import get_object_or_404
-from .utils import send_account_status_email
+from .services import UserDeletionService
+from .utils import BULK_STATUS_MAX_USERS, send_account_status_email, set_users_active
 
 from .models import *
 from .forms import (
@@ -27,6 +28,8 @@ from .forms import (
 from pages.models import ContactMessage
 from products.models import *
 from payments.models import *
+from payments.reports import build_report, parse_period
+from payments.services import CounterService, MailService
 
 from django.contrib.auth.views import (
     PasswordResetView,
@@ -34,7 +37,7 @@ from django.contrib.auth.views import (
     PasswordResetConfirmView,
     PasswordResetCompleteView,
 )
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 
 
 # ========== USER VIEWS ==========
@@ -225,14 +228,10 @@ def dashboard(request):
     except Wishlist.DoesNotExist:
         wishlist_items_count = 0
 
-    # Calculate statistics
-    total_orders = Order.objects.filter(user=request.user).count()
-    total_spent = (
-        Order.objects.filter(
-            user=request.user, status__in=["delivered", "shipped"]
-        ).aggregate(total=Sum("total_amount"))["total"]
-        or 0
-    )
+    # Statistics, kept up to date in CustomerStats as orders change
+    customer_stats = CustomerStats.objects.filter(user=request.user).first()
+    total_orders = customer_stats.order_count if customer_stats else 0
+    total_spent = customer_stats.total_spent if customer_stats else 0
 
     # Recent activity (last 30 days)
     thirty_days_ago = timezone.now() - timedelta(days=30)
@@ -573,15 +572,16 @@ def admin_dashboard(request):
     """Main admin dashboard with all management sections"""
     tab = request.GET.get("tab", "overview")
 
-    # Overview statistics
+    # Overview statistics, from the cached admin counters
+    counters = CounterService.get_counters()
     stats = {
-        "total_users": User.objects.count(),
-        "active_users": User.objects.filter(is_active=True).count(),
-        "pending_approvals": User.objects.filter(is_active=False).count(),
-        "total_orders": Order.objects.count(),
-        "pending_payments": PaymentProof.objects.filter(verified=False).count(),
-        "open_complaints": Complaint.objects.filter(status="open").count(),
-        "pending_refunds": Refund.objects.filter(status="refund_pending").count(),
+        "total_users": counters["total_users"],
+        "active_users": counters["active_users"],
+        "pending_approvals": counters["pending_approvals"],
+        "total_orders": counters["total_orders"],
+        "pending_payments": counters["unverified_payments"],
+        "open_complaints": counters["open_complaints"],
+        "pending_refunds": counters["pending_refunds"],
     }
 
     # Recent activity
@@ -632,8 +632,15 @@ def admin_users_management(request):
 
     users = users.order_by("-date_joined")
 
+    # Users being deleted in the background, with the URL to follow progress
+    deletion_jobs = {
+        job.user_id: reverse("accounts:admin_user_deletion_status", args=[job.id])
+        for job in UserDeletionJob.objects.filter(status__in=["pending", "running"])
+    }
+
     context = {
         "users": users,
+        "deletion_jobs": deletion_jobs,
         "status_filter": status_filter,
         "user_type_filter": user_type_filter,
         "search": search,
@@ -649,14 +656,10 @@ def admin_user_detail(request, user_id):
     user = get_object_or_404(User, id=user_id)
     user_profile = user.profile
 
-    # Get user statistics
-    total_orders = Order.objects.filter(user=user).count()
-    total_spent = (
-        Order.objects.filter(user=user, status__in=["delivered", "shipped"]).aggregate(
-            total=Sum("total_amount")
-        )["total"]
-        or 0
-    )
+    # Get user statistics, kept up to date in CustomerStats as orders change
+    customer_stats = CustomerStats.objects.filter(user=user).first()
+    total_orders = customer_stats.order_count if customer_stats else 0
+    total_spent = customer_stats.total_spent if customer_stats else 0
 
     orders = Order.objects.filter(user=user).order_by("-created_at")[:10]
 
@@ -665,6 +668,7 @@ def admin_user_detail(request, user_id):
         "user_profile": user_profile,
         "total_orders": total_orders,
         "total_spent": total_spent,
+        "customer_stats": customer_stats,
         "orders": orders,
     }
 
@@ -693,7 +697,7 @@ def admin_toggle_user_status(request, user_id):
         else:
             messages.warning(
                 request,
-                f"User {user.username} has been {status}, but email notification failed.",
+                f"User {user.username} has been {status}, but has no email address to notify.",
             )
 
         return JsonResponse(
@@ -703,6 +707,36 @@ def admin_toggle_user_status(request, user_id):
     return JsonResponse({"success": False})
 
 
+@login_required
+@user_passes_test(is_admin)
+def admin_bulk_user_status(request):
+    """Activate or deactivate the selected users in one batch"""
+    if request.method != "POST":
+        return JsonResponse({"success": False, "message": "Invalid request"})
+
+    try:
+        data = json.loads(request.body)
+        action = data.get("action")
+        user_ids = [int(user_id) for user_id in data.get("user_ids", [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({"success": False, "message": "Invalid request"})
+
+    if action not in ("activate", "deactivate"):
+        return JsonResponse({"success": False, "message": "Unknown action"})
+    if not user_ids:
+        return JsonResponse({"success": False, "message": "No user selected"})
+    if len(user_ids) > BULK_STATUS_MAX_USERS:
+        return JsonResponse(
+            {
+                "success": False,
+                "message": f"At most {BULK_STATUS_MAX_USERS} users per request",
+            }
+        )
+
+    summary = set_users_active(user_ids, action == "activate")
+    return JsonResponse({"success": True, "action": action, **summary})
+
+
 @login_required
 @user_passes_test(is_admin)
 def admin_delete_user(request, user_id):
@@ -714,13 +748,35 @@ def admin_delete_user(request, user_id):
             messages.error(request, "Cannot delete superuser accounts.")
             return redirect("accounts:admin_users_management")
 
-        username = user.username
-        user.delete()
-        messages.success(request, f"User {username} has been deleted.")
+        # Large accounts take a while: the deletion runs in the background
+        job = UserDeletionService.request(user, requested_by=request.user)
+        messages.success(
+            request,
+            f"User {job.username} has been deactivated and is being deleted.",
+        )
 
     return redirect("accounts:admin_users_management")
 
 
+@login_required
+@user_passes_test(is_admin)
+def admin_user_deletion_status(request, job_id):
+    """Progress of a background user deletion"""
+    job = get_object_or_404(UserDeletionJob, id=job_id)
+    return JsonResponse(
+        {
+            "success": True,
+            "status": job.status,
+            "status_display": job.get_status_display(),
+            "progress": job.progress,
+            "current_step": job.current_step,
+            "rows_deleted": job.rows_deleted,
+            "files_deleted": job.files_deleted,
+            "error": job.error,
+        }
+    )
+
+
 @login_required
 @user_passes_test(is_admin)
 def admin_orders_management(request):
@@ -875,14 +931,13 @@ def admin_payments_list(request):
 
     payments = payments.order_by("-uploaded_at")
 
-    # Payment statistics
+    # Payment statistics, from the cached admin counters
+    counters = CounterService.get_counters()
     payment_stats = {
-        "total": PaymentProof.objects.count(),
-        "pending": PaymentProof.objects.filter(
-            verified=False, rejection_reason=""
-        ).count(),
-        "verified": PaymentProof.objects.filter(verified=True).count(),
-        "rejected": PaymentProof.objects.exclude(rejection_reason="").count(),
+        "total": counters["total_payments"],
+        "pending": counters["pending_payments"],
+        "verified": counters["verified_payments"],
+        "rejected": counters["rejected_payments"],
     }
 
     context = {
@@ -1250,12 +1305,10 @@ def admin_question_reply(request, question_id):
 
             # Send email notification
             try:
-                send_mail(
+                MailService.enqueue(
                     subject=f"Answer to your question about {question.product.name}",
-                    message=f"Hello {question.user.username},\n\nYour question: {question.question}\n\nAnswer: {answer}\n\nView product: {request.build_absolute_uri(question.product.get_absolute_url())}",
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[question.user.email],
-                    fail_silently=True,
+                    body=f"Hello {question.user.username},\n\nYour question: {question.question}\n\nAnswer: {answer}\n\nView product: {request.build_absolute_uri(question.product.get_absolute_url())}",
+                    recipients=[question.user.email],
                 )
             except:
                 pass
@@ -1332,12 +1385,10 @@ def admin_review_reply(request, review_id):
 
             # Send email notification
             try:
-                send_mail(
+                MailService.enqueue(
                     subject=f"Reply to your review on {review.product.name}",
-                    message=f"Hello {review.user.username},\n\n{reply.comment}\n\nView product: {request.build_absolute_uri(review.product.get_absolute_url())}",
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[review.user.email],
-                    fail_silently=True,
+                    body=f"Hello {review.user.username},\n\n{reply.comment}\n\nView product: {request.build_absolute_uri(review.product.get_absolute_url())}",
+                    recipients=[review.user.email],
                 )
             except:
                 pass
@@ -1385,338 +1436,98 @@ class DecimalEncoder(DjangoJSONEncoder):
 @staff_member_required
 def admin_reports(request):
     # Get period from query params (default 30 days)
-    period_days = int(request.GET.get("period", "30"))
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=period_days)
-
-    # ========== FINANCIAL ANALYTICS ==========
-    orders_in_period = Order.objects.filter(created_at__gte=start_date)
-
-    # Revenue breakdown by status
-    revenue_by_status = (
-        orders_in_period.values("status")
-        .annotate(total=Sum("total_amount"), count=Count("id"))
-        .order_by("-total")
-    )
-
-    # Payment method statistics
-    payment_methods = (
-        PaymentProof.objects.filter(uploaded_at__gte=start_date)
-        .values("payment_method")
-        .annotate(count=Count("id"), total_amount=Sum("invoice__total_amount"))
-        .order_by("-count")
-    )
-
-    # Daily revenue trend
-    daily_revenue = (
-        orders_in_period.filter(
-            status__in=["paid", "processing", "shipped", "delivered"]
-        )
-        .annotate(day=TruncDate("created_at"))
-        .values("day")
-        .annotate(revenue=Sum("total_amount"), orders=Count("id"))
-        .order_by("day")
-    )
-
-    # Financial summary
-    total_revenue = (
-        orders_in_period.filter(
-            status__in=["paid", "processing", "shipped", "delivered"]
-        ).aggregate(total=Sum("total_amount"))["total"]
-        or 0
-    )
+    period_days = parse_period(request.GET.get("period"))
+    # Sections run concurrently and are cached per period (see payments.reports)
+    context = build_report(period_days, refresh="refresh" in request.GET)
+
+    # Chart data is handed to the page's JavaScript as JSON
+    for key in (
+        "revenue_by_status",
+        "daily_revenue",
+        "category_performance",
+        "user_registrations",
+        "user_types",
+        "review_trend",
+        "rating_distribution",
+        "cohort_curves",
+    ):
+        context[key] = json.dumps(context[key], cls=DecimalEncoder)
 
-    total_refunded = (
-        Refund.objects.filter(
-            created_at__gte=start_date, status="refund_completed"
-        ).aggregate(total=Sum("amount"))["total"]
-        or 0
-    )
+    return render(request, "accounts/admin/reports.html", context)
 
-    net_revenue = total_revenue - total_refunded
 
-    # Average transaction metrics
-    avg_order_value = orders_in_period.aggregate(avg=Avg("total_amount"))["avg"] or 0
-    avg_items_per_order = (
-        OrderItem.objects.filter(order__created_at__gte=start_date)
-        .values("order")
-        .annotate(items=Sum("quantity"))
-        .aggregate(avg=Avg("items"))["avg"]
-        or 0
-    )
-
-    # ========== PRODUCT ANALYTICS ==========
-    # Top products by revenue
-    top_products = (
-        OrderItem.objects.filter(
-            order__created_at__gte=start_date,
-            order__status__in=["paid", "processing", "shipped", "delivered"],
-        )
-        .values("product__name", "product__id")
-        .annotate(
-            total_quantity=Sum("quantity"),
-            total_revenue=Sum(F("quantity") * F("price"), output_field=DecimalField()),
-        )
-        .order_by("-total_revenue")[:10]
-    )
+@login_required
+@staff_member_required
+def admin_report_exports(request):
+    """Queue CSV/XLSX exports of the reports and list the recent ones"""
+    from payments.forms import ReportExportForm
 
-    for item in top_products:
-        product = Product.objects.get(id=item["product__id"])
-        item["categories"] = ", ".join(
-            [cat.name for cat in product.categories.all()[:2]]
-        )
-    # Category performance
-    category_performance = {}
-    order_items = OrderItem.objects.filter(
-        order__created_at__gte=start_date,
-        order__status__in=["paid", "processing", "shipped", "delivered"],
-    ).select_related("product")
-
-    for item in order_items:
-        for category in item.product.categories.all():
-            if category.name not in category_performance:
-                category_performance[category.name] = {
-                    "product__category__name": category.name,
-                    "total_quantity": 0,
-                    "total_revenue": Decimal("0"),
-                    "unique_products": set(),
-                }
-            category_performance[category.name]["total_quantity"] += item.quantity
-            category_performance[category.name]["total_revenue"] += (
-                item.quantity * item.price
+    if request.method == "POST":
+        form = ReportExportForm(request.POST)
+        if form.is_valid():
+            job = form.save(commit=False)
+            job.requested_by = request.user
+            job.save()
+            messages.success(
+                request, "Export queued, the file will be ready in a few moments."
             )
-            category_performance[category.name]["unique_products"].add(item.product.id)
-
-    # Convert to list and add unique_products count
-    category_performance = [
-        {
-            "product__category__name": k,
-            "total_quantity": v["total_quantity"],
-            "total_revenue": v["total_revenue"],
-            "unique_products": len(v["unique_products"]),
-        }
-        for k, v in category_performance.items()
-    ]
-    category_performance.sort(key=lambda x: x["total_revenue"], reverse=True)
-
-    # Specialty performance
-    specialty_performance = (
-        OrderItem.objects.filter(
-            order__created_at__gte=start_date,
-            order__status__in=["paid", "processing", "shipped", "delivered"],
-            product__specialty__isnull=False,
-        )
-        .exclude(product__specialty="")
-        .values("product__specialty")
-        .annotate(
-            total_revenue=Sum(F("quantity") * F("price"), output_field=DecimalField()),
-            total_orders=Count("order", distinct=True),
+            return redirect("accounts:admin_report_exports")
+    else:
+        # Default to the period shown on the reports page
+        period_days = parse_period(request.GET.get("period"))
+        today = timezone.localdate()
+        form = ReportExportForm(
+            initial={
+                "date_from": today - timedelta(days=period_days),
+                "date_to": today,
+            }
         )
-        .order_by("-total_revenue")
-    )
-
-    # Inventory insights
-    low_stock_products = Product.objects.filter(
-        stock_quantity__lte=10, availability_status="in_stock"
-    ).order_by("stock_quantity")[:10]
-
-    out_of_stock_count = Product.objects.filter(
-        Q(stock_quantity=0) | Q(availability_status="out_of_stock")
-    ).count()
-
-    # ========== USER ANALYTICS ==========
-    # User registrations over time
-    user_registrations = (
-        User.objects.filter(date_joined__gte=start_date)
-        .annotate(day=TruncDate("date_joined"))
-        .values("day")
-        .annotate(count=Count("id"))
-        .order_by("day")
-    )
 
-    # User type distribution
-    from accounts.models import UserProfile
+    exports = ReportExportJob.objects.select_related("requested_by")[:50]
 
-    user_types = (
-        UserProfile.objects.values("user_type")
-        .annotate(count=Count("id"))
-        .order_by("-count")
-    )
-
-    # Active users (placed order in period)
-    active_users = (
-        Order.objects.filter(created_at__gte=start_date)
-        .values("user")
-        .distinct()
-        .count()
-    )
-
-    # Customer lifetime value (top customers)
-    top_customers = (
-        Order.objects.filter(status__in=["paid", "processing", "shipped", "delivered"])
-        .values("user__username", "user__email")
-        .annotate(total_spent=Sum("total_amount"), order_count=Count("id"))
-        .order_by("-total_spent")[:10]
-    )
+    context = {
+        "form": form,
+        "exports": exports,
+        "has_unfinished": any(job.status in ("pending", "running") for job in exports),
+    }
 
-    # ========== REVIEW ANALYTICS ==========
-    # Average rating by category
-    ratings_by_category = {}
-    reviews = ProductReview.objects.filter(created_at__gte=start_date).select_related(
-        "product"
-    )
+    return render(request, "accounts/admin/report_exports.html", context)
 
-    for review in reviews:
-        for category in review.product.categories.all():
-            if category.name not in ratings_by_category:
-                ratings_by_category[category.name] = {
-                    "product__category__name": category.name,
-                    "ratings": [],
-                    "review_count": 0,
-                }
-            ratings_by_category[category.name]["ratings"].append(review.rating)
-            ratings_by_category[category.name]["review_count"] += 1
 
-    # Calculate averages
-    ratings_by_category = [
+@login_required
+@staff_member_required
+def admin_report_export_status(request, export_id):
+    """Progress of a background report export"""
+    job = get_object_or_404(ReportExportJob, id=export_id)
+    return JsonResponse(
         {
-            "product__category__name": k,
-            "avg_rating": sum(v["ratings"]) / len(v["ratings"]) if v["ratings"] else 0,
-            "review_count": v["review_count"],
+            "success": True,
+            "status": job.status,
+            "status_display": job.get_status_display(),
+            "rows_written": job.rows_written,
+            "download_url": (
+                reverse("accounts:admin_report_export_download", args=[job.id])
+                if job.status == "done"
+                else None
+            ),
+            "error": job.error,
         }
-        for k, v in ratings_by_category.items()
-    ]
-    ratings_by_category.sort(key=lambda x: x["avg_rating"], reverse=True)
-
-    # Review volume trend
-    review_trend = (
-        ProductReview.objects.filter(created_at__gte=start_date)
-        .annotate(day=TruncDate("created_at"))
-        .values("day")
-        .annotate(count=Count("id"), avg_rating=Avg("rating"))
-        .order_by("day")
     )
 
-    # Rating distribution
-    rating_distribution = (
-        ProductReview.objects.filter(created_at__gte=start_date)
-        .values("rating")
-        .annotate(count=Count("id"))
-        .order_by("rating")
-    )
 
-    # ========== CONTACT & SUPPORT ANALYTICS ==========
-    # Contact messages by type
-    contact_by_type = (
-        ContactMessage.objects.filter(created_at__gte=start_date)
-        .values("inquiry_type")
-        .annotate(count=Count("id"), responded=Count("id", filter=Q(responded=True)))
-        .order_by("-count")
-    )
-
-    # Complaint resolution rate
-    total_complaints = Complaint.objects.filter(created_at__gte=start_date).count()
-    resolved_complaints = Complaint.objects.filter(
-        created_at__gte=start_date, status="resolved"
-    ).count()
-    complaint_resolution_rate = (
-        (resolved_complaints / total_complaints * 100) if total_complaints > 0 else 0
-    )
-
-    # Average complaint resolution time
-    resolved_with_time = Complaint.objects.filter(
-        created_at__gte=start_date, status="resolved", resolved_at__isnull=False
+@login_required
+@staff_member_required
+def admin_report_export_download(request, export_id):
+    """Download a finished export; files are only served to staff"""
+    job = get_object_or_404(ReportExportJob, id=export_id, status="done")
+    try:
+        file = job.file.open("rb")
+    except FileNotFoundError:
+        raise Http404("Export file not found")
+    return FileResponse(
+        file, as_attachment=True, filename=os.path.basename(job.file.name)
     )
 
-    avg_resolution_time = None
-    if resolved_with_time.exists():
-        total_time = sum(
-            [
-                (c.resolved_at - c.created_at).total_seconds() / 3600
-                for c in resolved_with_time
-            ]
-        )
-        avg_resolution_time = total_time / resolved_with_time.count()
-
-    # ========== ORDER STATISTICS ==========
-    order_stats = {
-        "total_orders": orders_in_period.count(),
-        "total_revenue": total_revenue,
-        "net_revenue": net_revenue,
-        "average_order_value": avg_order_value,
-        "by_status": orders_in_period.values("status").annotate(count=Count("id")),
-    }
-
-    # Payment statistics
-    payment_stats = {
-        "pending_verifications": PaymentProof.objects.filter(verified=False).count(),
-        "verified_payments": PaymentProof.objects.filter(verified=True).count(),
-        "rejected_payments": PaymentProof.objects.exclude(rejection_reason="").count(),
-    }
-
-    # Complaint statistics
-    complaint_stats = {
-        "open_complaints": Complaint.objects.filter(status="open").count(),
-        "in_review": Complaint.objects.filter(status="in_review").count(),
-        "resolved_complaints": resolved_complaints,
-        "resolution_rate": complaint_resolution_rate,
-        "avg_resolution_time": avg_resolution_time,
-        "by_reason": Complaint.objects.filter(created_at__gte=start_date)
-        .values("reason__name")
-        .annotate(count=Count("id"))
-        .order_by("-count"),
-    }
-
-    # Refund statistics
-    refund_stats = {
-        "pending_refunds": Refund.objects.filter(status="refund_pending").count(),
-        "completed_refunds": Refund.objects.filter(status="refund_completed").count(),
-        "total_refunded": total_refunded,
-    }
-
-    context = {
-        "period": period_days,
-        "start_date": start_date,
-        "end_date": end_date,
-        # Financial
-        "order_stats": order_stats,
-        "revenue_by_status": json.dumps(list(revenue_by_status), cls=DecimalEncoder),
-        "payment_methods": list(payment_methods),
-        "daily_revenue": json.dumps(list(daily_revenue), cls=DecimalEncoder),
-        "total_revenue": total_revenue,
-        "total_refunded": total_refunded,
-        "net_revenue": net_revenue,
-        "avg_order_value": avg_order_value,
-        "avg_items_per_order": avg_items_per_order,
-        # Products
-        "top_products": top_products,
-        "category_performance": json.dumps(
-            list(category_performance), cls=DecimalEncoder
-        ),
-        "specialty_performance": specialty_performance,
-        "low_stock_products": low_stock_products,
-        "out_of_stock_count": out_of_stock_count,
-        # Users
-        "user_registrations": json.dumps(list(user_registrations), cls=DecimalEncoder),
-        "user_types": json.dumps(list(user_types), cls=DecimalEncoder),
-        "active_users": active_users,
-        "top_customers": top_customers,
-        "total_users": User.objects.count(),
-        # Reviews
-        "ratings_by_category": ratings_by_category,
-        "review_trend": json.dumps(list(review_trend), cls=DecimalEncoder),
-        "rating_distribution": json.dumps(
-            list(rating_distribution), cls=DecimalEncoder
-        ),
-        # Support
-        "contact_by_type": contact_by_type,
-        "payment_stats": payment_stats,
-        "complaint_stats": complaint_stats,
-        "refund_stats": refund_stats,
-    }
-
-    return render(request, "accounts/admin/reports.html", context)
-
 
 # Add these views to accounts/views.py
 
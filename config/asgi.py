@@ -3,6 +3,15 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live notification stream (payments:notification_stream) holds one
+long-lived connection per open page, so it is only enabled, with
+NOTIFICATION_STREAM_ENABLED=True, when the site is served through ASGI, e.g.:
+
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+
+With more than one worker, set NOTIFICATION_STREAM_POLL_INTERVAL so each
+stream also picks up notifications created by the other workers.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -56,10 +56,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "pages.context_processors.site_info",
-                "accounts.context_processors.wishlist_items",
-                "payments.context_processors.notifications",  # Add this
-                "payments.context_processors.cart_items_count",  # Add this
+                "pages.context_processors.user_chrome",
             ],
         },
     },
@@ -86,9 +83,81 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # Take the write lock when a transaction starts, on every
+                # connection. SQLite cannot upgrade a transaction that has
+                # already read to a writing one once another connection has
+                # written: it fails at once with "database is locked", whatever
+                # the timeout. Checkout, cart batches, rollups and counters all
+                # read then write in one transaction, so the mode is not scoped
+                # to checkout. Development only: PostgreSQL has row locks.
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
+            # A file rather than shared memory, where concurrent writers fail
+            # with "database table is locked" instead of waiting. Deleted after
+            # the run and ignored by git.
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
+# Cache - shared Redis cache when REDIS_URL is set (needs the redis package),
+# per-process memory cache otherwise
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "fennecmed",
+        }
+    }
+
+# Seconds a worker serves its in-memory SiteInformation (TVA rate, contact
+# details) before reading it again. Without a shared cache, a save reaches the
+# other workers only through this limit.
+SITE_INFORMATION_MAX_AGE = int(
+    os.environ.get(
+        "SITE_INFORMATION_MAX_AGE", 600 if os.environ.get("REDIS_URL") else 30
+    )
+)
+
+# Seconds the cohort section of the admin reports stays cached. Run
+# refresh_cohort_report more often than this (with a shared cache: the memory
+# cache is per process) so that no page load has to compute it.
+COHORT_REPORT_CACHE_TIMEOUT = int(os.environ.get("COHORT_REPORT_CACHE_TIMEOUT", 21600))
+
+# Seconds the active staff recipient list stays cached
+STAFF_RECIPIENTS_CACHE_TIMEOUT = int(
+    os.environ.get("STAFF_RECIPIENTS_CACHE_TIMEOUT", 300)
+)
+
+# Days read notifications are kept before prune_notifications archives them
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get("NOTIFICATION_RETENTION_DAYS", 90))
+
+# Live notification stream (Server-Sent Events). Each open page holds a
+# connection for as long as it stays open, so only enable it when the site is
+# served through config.asgi: under WSGI the endpoint answers 204 and pages do
+# not connect. Set a poll interval when running several worker processes so
+# events written by another process are picked up from the database.
+NOTIFICATION_STREAM_ENABLED = (
+    os.environ.get("NOTIFICATION_STREAM_ENABLED", "False") == "True"
+)
+NOTIFICATION_STREAM_HEARTBEAT = int(os.environ.get("NOTIFICATION_STREAM_HEARTBEAT", 15))
+NOTIFICATION_STREAM_POLL_INTERVAL = int(
+    os.environ.get("NOTIFICATION_STREAM_POLL_INTERVAL", 0)
+)
+
+# Seconds a user's cached navbar notifications may be served
+NOTIFICATION_NAVBAR_CACHE_TIMEOUT = int(
+    os.environ.get("NOTIFICATION_NAVBAR_CACHE_TIMEOUT", 300)
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -142,6 +211,22 @@ EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
 DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "noreply@example.com")
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
+
+# Outbox delivery (python manage.py run_mail_worker)
+MAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("MAIL_OUTBOX_BATCH_SIZE", 50))
+MAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("MAIL_OUTBOX_MAX_ATTEMPTS", 5))
+MAIL_OUTBOX_BACKOFF_SECONDS = int(os.environ.get("MAIL_OUTBOX_BACKOFF_SECONDS", 60))
+
+# Deferred signal handlers (payments.tasks). They run in a thread pool after
+# commit; python manage.py run_deferred_tasks retries what a crashed process
+# left behind. Eager mode runs them in the request, right after commit.
+DEFERRED_TASKS_WORKERS = int(os.environ.get("DEFERRED_TASKS_WORKERS", 2))
+DEFERRED_TASKS_EAGER = os.environ.get("DEFERRED_TASKS_EAGER", "False") == "True"
+DEFERRED_TASKS_MAX_ATTEMPTS = int(os.environ.get("DEFERRED_TASKS_MAX_ATTEMPTS", 5))
+DEFERRED_TASKS_BACKOFF_SECONDS = int(
+    os.environ.get("DEFERRED_TASKS_BACKOFF_SECONDS", 30)
+)
+
 # Add this for password reset
 PASSWORD_RESET_TIMEOUT = 86400  # 24 hours in seconds
 
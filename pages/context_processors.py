@@ -1,10 +1,107 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.utils.functional import SimpleLazyObject
+
+from payments.models import CartItem, NotificationCounter
+from payments.services import CounterService, NotificationService
+from products.models import Product, Wishlist
+
 from .models import SiteInformation
 
 
-def site_info(request):
-    """Make site information available to all templates"""
-    site_info = SiteInformation.get_instance()
-    return {
-        "site_info": site_info,
-        "tva_rate": site_info.tva_rate,
+def user_chrome(request):
+    """Site information and the user's navbar data for all templates.
+
+    Everything user-specific is lazy: a template that never shows the
+    navbar costs no query. The first use of a cart, wishlist or unread
+    count loads all three with one query. Administrators also get the
+    cached admin counters for the navbar badge.
+    """
+    context = {
+        # Served from the per-process cache, see SiteInformation.get_instance
+        "site_info": SiteInformation.get_instance(),
+        "tva_rate": SiteInformation.get_tva_rate(),
+        "notification_stream_enabled": getattr(
+            settings, "NOTIFICATION_STREAM_ENABLED", False
+        ),
     }
+    user = request.user
+    if not user.is_authenticated:
+        context.update(
+            {
+                "cart_items_count": 0,
+                "wishlist_count": 0,
+                "wishlist_products": [],
+                "unread_notifications_count": 0,
+                "notifications": [],
+            }
+        )
+        return context
+
+    counts = SimpleLazyObject(lambda: _user_counts(user))
+    context.update(
+        {
+            "cart_items_count": SimpleLazyObject(lambda: counts["cart"]),
+            "wishlist_count": SimpleLazyObject(lambda: counts["wishlist"]),
+            "wishlist_products": SimpleLazyObject(lambda: _wishlist_products(user)),
+            "unread_notifications_count": SimpleLazyObject(lambda: counts["unread"]),
+            "notifications": SimpleLazyObject(lambda: _navbar_notifications(user)),
+        }
+    )
+    if user.is_superuser:
+        context["admin_counters"] = SimpleLazyObject(CounterService.get_counters)
+    return context
+
+
+def _user_counts(user):
+    """Cart items, wishlist products and unread notifications in one query"""
+
+    def scalar(queryset, group_by, aggregate):
+        return Subquery(
+            queryset.order_by()
+            .values(group_by)
+            .annotate(value=aggregate)
+            .values("value")[:1],
+            output_field=IntegerField(),
+        )
+
+    row = (
+        User.objects.filter(pk=user.pk)
+        .annotate(
+            cart_count=scalar(
+                CartItem.objects.filter(cart__user=OuterRef("pk")),
+                "cart__user",
+                Sum("quantity"),
+            ),
+            wishlist_count=scalar(
+                Wishlist.products.through.objects.filter(wishlist__user=OuterRef("pk")),
+                "wishlist__user",
+                Count("id"),
+            ),
+            unread_count=Subquery(
+                NotificationCounter.objects.filter(user=OuterRef("pk")).values(
+                    "unread_count"
+                )[:1]
+            ),
+        )
+        .values("cart_count", "wishlist_count", "unread_count")
+        .first()
+    ) or {}
+    counts = {
+        "cart": row.get("cart_count") or 0,
+        "wishlist": row.get("wishlist_count") or 0,
+        "unread": row.get("unread_count"),
+    }
+    if counts["unread"] is None:
+        # No counter yet: the navbar loader builds it
+        counts["unread"] = NotificationService.get_navbar_data(user)[0]
+    return counts
+
+
+def _wishlist_products(user):
+    return list(Product.objects.filter(wishlist__user=user))
+
+
+def _navbar_notifications(user):
+    return NotificationService.get_navbar_data(user)[1]
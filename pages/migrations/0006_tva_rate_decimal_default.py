@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:41
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pages", "0005_alter_siteinformation_map_embed_url"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="siteinformation",
+            name="tva_rate",
+            field=models.DecimalField(
+                decimal_places=4,
+                default=Decimal("0.05"),
+                help_text="Taux de TVA en décimal (ex. : 0,19 pour 19%)",
+                max_digits=5,
+                verbose_name="Taux de TVA",
+            ),
+        ),
+    ]
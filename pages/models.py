@@ -1,4 +1,11 @@
-from django.db import models
+import copy
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
 
 
 class ContactMessage(models.Model):
@@ -185,7 +192,7 @@ class SiteInformation(models.Model):
     tva_rate = models.DecimalField(
         max_digits=5,
         decimal_places=4,
-        default=0.05,
+        default=Decimal("0.05"),
         help_text="Taux de TVA en décimal (ex. : 0,19 pour 19%)",
         verbose_name="Taux de TVA",
     )
@@ -217,16 +224,68 @@ class SiteInformation(models.Model):
     def __str__(self):
         return self.site_name
 
+    # Version partagée entre les processus, changée à chaque enregistrement
+    VERSION_CACHE_KEY = "site_information:version"
+    # Secondes pendant lesquelles un processus ne revérifie pas la version
+    VERSION_CHECK_INTERVAL = 1.0
+    # Âge maximal par défaut de l'instance d'un processus, en secondes (voir
+    # SITE_INFORMATION_MAX_AGE)
+    DEFAULT_MAX_AGE = 30
+
+    # (version, instance, dernière vérification, chargement) propre au processus
+    _cached = None
+
     def save(self, *args, **kwargs):
         # Ensure only one instance exists
         if not self.pk and SiteInformation.objects.exists():
             raise ValueError("Une seule instance de SiteInformation est autorisée")
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        transaction.on_commit(SiteInformation.invalidate_cache)
+        return result
+
+    @classmethod
+    def invalidate_cache(cls):
+        """Forcer tous les processus à recharger l'instance"""
+        cls._cached = None
+        cache.set(cls.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
 
     @classmethod
     def get_instance(cls):
-        """Obtenir ou créer l'instance singleton"""
+        """Obtenir ou créer l'instance singleton.
+
+        L'instance est gardée en mémoire dans chaque processus ; chaque appel
+        en renvoie une copie, qui peut être modifiée et enregistrée sans
+        toucher celle des autres requêtes. Elle est rechargée quand la version
+        du cache partagé change (voir ``invalidate_cache``), et dans tous les
+        cas après ``SITE_INFORMATION_MAX_AGE`` secondes.
+        """
+        return copy.copy(cls._shared_instance())
+
+    @classmethod
+    def get_tva_rate(cls):
+        """Taux de TVA courant, en Decimal"""
+        return Decimal(cls._shared_instance().tva_rate)
+
+    @classmethod
+    def _shared_instance(cls):
+        """Instance partagée du processus, à ne lire que dans cette classe"""
+        cached = cls._cached
+        now = time.monotonic()
+        max_age = getattr(settings, "SITE_INFORMATION_MAX_AGE", cls.DEFAULT_MAX_AGE)
+        fresh = cached and now - cached[3] < max_age
+        if fresh and now - cached[2] < cls.VERSION_CHECK_INTERVAL:
+            return cached[1]
+
+        version = cache.get(cls.VERSION_CACHE_KEY)
+        if fresh and version == cached[0]:
+            cls._cached = (version, cached[1], now, cached[3])
+            return cached[1]
+
+        if version is None:
+            cache.add(cls.VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+            version = cache.get(cls.VERSION_CACHE_KEY)
         obj, created = cls.objects.get_or_create(pk=1)
+        cls._cached = (version, obj, now, now)
         return obj
 
 
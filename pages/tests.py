@@ -0,0 +1,110 @@
+import importlib
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from accounts.models import UserProfile
+from payments.models import Cart, CartItem, ShippingType
+from products.models import Brand, Category, Product, Wishlist
+
+from .models import SiteInformation
+
+
+class SiteInformationCacheTests(TestCase):
+    def setUp(self):
+        SiteInformation._cached = None
+        self.addCleanup(setattr, SiteInformation, "_cached", None)
+        SiteInformation.get_instance()
+
+    def save_from_another_process(self, tva_rate):
+        # A queryset update neither clears this process's copy nor the version,
+        # like a save made by a worker that does not share this cache
+        SiteInformation.objects.filter(pk=1).update(tva_rate=tva_rate)
+
+    @override_settings(SITE_INFORMATION_MAX_AGE=3600)
+    def test_instance_is_served_from_memory(self):
+        self.save_from_another_process(Decimal("9"))
+        with self.assertNumQueries(0):
+            SiteInformation.get_instance()
+        self.assertNotEqual(SiteInformation.get_tva_rate(), Decimal("9"))
+
+    @override_settings(SITE_INFORMATION_MAX_AGE=0)
+    def test_instance_is_reloaded_after_max_age(self):
+        self.save_from_another_process(Decimal("9"))
+        self.assertEqual(SiteInformation.get_tva_rate(), Decimal("9"))
+
+    @override_settings(SITE_INFORMATION_MAX_AGE=3600)
+    def test_each_caller_gets_its_own_copy(self):
+        site_info = SiteInformation.get_instance()
+        site_info.site_name = "Brouillon"
+
+        with self.assertNumQueries(0):
+            self.assertNotEqual(SiteInformation.get_instance().site_name, "Brouillon")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            site_info.save()
+        self.assertEqual(SiteInformation.get_instance().site_name, "Brouillon")
+
+    def test_server_entry_points_do_not_query_at_import(self):
+        # They are imported before migrate has run on a fresh deploy
+        for module in ("config.wsgi", "config.asgi"):
+            with self.assertNumQueries(0):
+                importlib.reload(importlib.import_module(module))
+
+
+class NavbarQueryCountTests(TestCase):
+    """Query counts of pages showing the navbar to a signed-in customer.
+
+    The navbar data (cart, wishlist, notifications) is loaded lazily by
+    ``user_chrome``: these counts go up if a context processor starts
+    querying on every page again.
+    """
+
+    def setUp(self):
+        cache.clear()
+        SiteInformation._cached = None
+        self.addCleanup(setattr, SiteInformation, "_cached", None)
+        SiteInformation.get_instance()
+
+        brand = Brand.objects.create(name="Marque")
+        category = Category.objects.create(name="Catégorie", slug="categorie")
+        product = Product.objects.create(
+            name="Tensiomètre",
+            slug="tensiometre",
+            sku="TENS-1",
+            brand=brand,
+            description="-",
+            short_description="-",
+            price=Decimal("1000"),
+            stock_quantity=10,
+        )
+        product.categories.add(category)
+        ShippingType.objects.create(
+            name="Standard", estimated_days=3, cost=Decimal("500")
+        )
+
+        user = User.objects.create_user("client", "client@example.com", "-")
+        UserProfile.objects.get_or_create(user=user)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=product, quantity=2)
+        Wishlist.objects.create(user=user).products.add(product)
+        self.client.force_login(user)
+
+    def assertPageQueries(self, url, count):
+        with self.assertNumQueries(count):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_home(self):
+        self.assertPageQueries("/", 7)
+
+    def test_product_list(self):
+        self.assertPageQueries("/products/", 16)
+
+    def test_cart(self):
+        self.assertPageQueries("/payments/cart/", 10)
+
+    def test_checkout(self):
+        self.assertPageQueries("/payments/checkout/", 11)
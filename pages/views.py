@@ -1,9 +1,9 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
 from .models import FAQ, Testimonial, SiteInformation, TeamMember
 from .forms import ContactForm
+from payments.services import MailService
 from products.models import Product, Category
 
 
@@ -57,12 +57,10 @@ Message:
 Reply to: {contact_message.email}
                 """
 
-                send_mail(
+                MailService.enqueue(
                     subject=f"New Contact Message: {contact_message.subject}",
-                    message=admin_message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[site_info.email],
-                    fail_silently=True,
+                    body=admin_message,
+                    recipients=[site_info.email],
                 )
 
                 # Send confirmation email to user
@@ -82,12 +80,10 @@ Best regards,
 {site_info.site_name}
                 """
 
-                send_mail(
+                MailService.enqueue(
                     subject=f"Message Received: {contact_message.subject}",
-                    message=user_message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[contact_message.email],
-                    fail_silently=True,
+                    body=user_message,
+                    recipients=[contact_message.email],
                 )
             except Exception:
                 pass
@@ -5,6 +5,8 @@ from .models import (
     ShippingType,
     Order,
     OrderItem,
+    CheckoutSubmission,
+    DeferredTask,
     OrderNote,
     OrderNoteAttachment,
     Invoice,
@@ -17,7 +19,13 @@ from .models import (
     RefundProof,
     RefundReceipt,
     Notification,
+    NotificationArchive,
+    NotificationCounter,
+    NotificationPreference,
+    OutgoingEmail,
+    ReportExportJob,
 )
+from .services import CounterService, SalesRollupService
 
 
 class CartItemInline(admin.TabularInline):
@@ -205,8 +213,10 @@ class OrderAdmin(admin.ModelAdmin):
     def mark_as_confirmed(self, request, queryset):
         from django.utils import timezone
 
-        updated = queryset.filter(status="pending_confirmation").update(
-            status="confirmed", confirmed_at=timezone.now()
+        updated = SalesRollupService.update_status(
+            queryset.filter(status="pending_confirmation"),
+            "confirmed",
+            confirmed_at=timezone.now(),
         )
         self.message_user(request, f"{updated} commande(s) confirmée(s).")
 
@@ -215,13 +225,15 @@ class OrderAdmin(admin.ModelAdmin):
     def mark_as_paid(self, request, queryset):
         from django.utils import timezone
 
-        updated = queryset.update(status="paid", paid_at=timezone.now())
+        updated = SalesRollupService.update_status(
+            queryset, "paid", paid_at=timezone.now()
+        )
         self.message_user(request, f"{updated} commande(s) marquée(s) comme payée(s).")
 
     mark_as_paid.short_description = "Marquer comme payée"
 
     def mark_as_processing(self, request, queryset):
-        updated = queryset.update(status="processing")
+        updated = SalesRollupService.update_status(queryset, "processing")
         self.message_user(request, f"{updated} commande(s) marquée(s) en traitement.")
 
     mark_as_processing.short_description = "Marquer en traitement"
@@ -229,7 +241,9 @@ class OrderAdmin(admin.ModelAdmin):
     def mark_as_shipped(self, request, queryset):
         from django.utils import timezone
 
-        updated = queryset.update(status="shipped", shipped_at=timezone.now())
+        updated = SalesRollupService.update_status(
+            queryset, "shipped", shipped_at=timezone.now()
+        )
         self.message_user(
             request, f"{updated} commande(s) marquée(s) comme expédiée(s)."
         )
@@ -239,7 +253,9 @@ class OrderAdmin(admin.ModelAdmin):
     def mark_as_delivered(self, request, queryset):
         from django.utils import timezone
 
-        updated = queryset.update(status="delivered", delivered_at=timezone.now())
+        updated = SalesRollupService.update_status(
+            queryset, "delivered", delivered_at=timezone.now()
+        )
         self.message_user(request, f"{updated} commande(s) marquée(s) comme livrée(s).")
 
     mark_as_delivered.short_description = "Marquer comme livrée"
@@ -268,6 +284,13 @@ class OrderItemAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related("order", "product")
 
 
+@admin.register(CheckoutSubmission)
+class CheckoutSubmissionAdmin(admin.ModelAdmin):
+    list_display = ("key", "user", "order", "created_at")
+    search_fields = ("key", "user__username", "order__order_id")
+    readonly_fields = ("key", "created_at")
+
+
 class OrderNoteAttachmentInline(admin.TabularInline):
     model = OrderNoteAttachment
     extra = 0
@@ -329,6 +352,8 @@ class PaymentProofAdmin(admin.ModelAdmin):
         updated = queryset.update(
             verified=True, verified_by=request.user, verified_at=timezone.now()
         )
+        # The update skips the post_save signals that move the counters
+        CounterService.invalidate(PaymentProof)
         self.message_user(request, f"{updated} paiement(s) approuvé(s).")
 
     approve_payments.short_description = "Approuver les paiements sélectionnés"
@@ -433,3 +458,99 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ("user__username", "title", "message")
     readonly_fields = ("created_at",)
     date_hierarchy = "created_at"
+
+
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    list_display = ("user", "notification_type", "title", "created_at", "archived_at")
+    list_filter = ("notification_type", "created_at")
+    search_fields = ("user__username", "title", "message")
+    readonly_fields = ("created_at", "archived_at")
+    date_hierarchy = "created_at"
+
+
+@admin.register(NotificationCounter)
+class NotificationCounterAdmin(admin.ModelAdmin):
+    list_display = ("user", "unread_count")
+    search_fields = ("user__username",)
+    readonly_fields = ("user", "unread_count")
+    actions = ["recount"]
+
+    def recount(self, request, queryset):
+        from .services import NotificationService
+
+        count = NotificationService.recount_unread(
+            queryset.values_list("user_id", flat=True)
+        )
+        self.message_user(request, f"{count} compteur(s) recalculé(s).")
+
+    recount.short_description = "Recalculer depuis les notifications"
+
+
+@admin.register(NotificationPreference)
+class NotificationPreferenceAdmin(admin.ModelAdmin):
+    list_display = ("user", "notification_type", "delivery")
+    list_filter = ("notification_type", "delivery")
+    search_fields = ("user__username",)
+
+
+@admin.register(DeferredTask)
+class DeferredTaskAdmin(admin.ModelAdmin):
+    list_display = ("handler", "status", "attempts", "next_attempt_at", "created_at")
+    list_filter = ("status", "handler")
+    readonly_fields = ("created_at", "last_error")
+    actions = ["retry_tasks"]
+
+    def retry_tasks(self, request, queryset):
+        from django.utils import timezone
+
+        count = queryset.update(
+            status="pending", attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{count} tâche(s) remise(s) en file d'attente.")
+
+    retry_tasks.short_description = "Remettre en file d'attente"
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "created_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("subject", "recipients")
+    readonly_fields = ("created_at", "sent_at", "last_error")
+    actions = ["retry_emails"]
+
+    def retry_emails(self, request, queryset):
+        from django.utils import timezone
+
+        count = queryset.exclude(status="sent").update(
+            status="pending", attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{count} email(s) remis en file d'attente.")
+
+    retry_emails.short_description = "Remettre en file d'attente"
+
+
+@admin.register(ReportExportJob)
+class ReportExportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "kind",
+        "file_format",
+        "date_from",
+        "date_to",
+        "status",
+        "rows_written",
+        "requested_by",
+        "created_at",
+    )
+    list_filter = ("status", "kind", "file_format")
+    readonly_fields = (
+        "status",
+        "rows_written",
+        "file",
+        "error",
+        "created_at",
+        "updated_at",
+        "started_at",
+        "finished_at",
+    )
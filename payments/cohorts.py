@@ -0,0 +1,239 @@
+"""Monthly registration cohorts: repeat purchases and revenue, computed with NumPy.
+
+Customers are grouped by the month they registered in (``User.date_joined``)
+and by ``UserProfile.user_type``. Two queries are read with ``fetchmany``
+straight into NumPy arrays: the customers registered over the last
+``months`` months, as ``(user_id, cohort, user_type)``, and the paid orders
+of the same months, as ``(user_id, month, amount)``. Months are counted
+from the first cohort with ``CASE`` comparisons against precomputed local
+month boundaries, so the database runs no per-row date function, and
+neither query joins or groups: on large tables those dominate the run
+time. Orders are matched to their customer, and all matrices computed,
+with array operations instead of Python loops.
+
+The admin reports show the result as their "cohorts" section, cached with
+the other sections for ``COHORT_REPORT_CACHE_TIMEOUT`` seconds and
+refreshed by the ``refresh_cohort_report`` command (see payments.reports).
+"""
+
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models import Case, FloatField, IntegerField, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from accounts.models import UserProfile
+
+from .models import Order
+from .services import SalesRollupService
+
+# Rows fetched per database round trip
+CHUNK_SIZE = 10000
+
+CUSTOMER_DTYPE = np.dtype([("user", np.int64), ("cohort", np.int32), ("kind", np.int8)])
+ORDER_DTYPE = np.dtype(
+    [("user", np.int64), ("month", np.int32), ("amount", np.float64)]
+)
+
+
+def build_cohorts(months=12):
+    """Cohort table and retention curves for the last ``months`` cohorts"""
+    started = time.perf_counter()
+    now = timezone.localtime()
+    first = now.year * 12 + now.month - 1 - months + 1
+    # Local midnight on the first day of each month
+    bounds = [
+        now.replace(
+            year=month // 12,
+            month=month % 12 + 1,
+            day=1,
+            hour=0,
+            minute=0,
+            second=0,
+            microsecond=0,
+        )
+        for month in range(first, first + months)
+    ]
+
+    customers = fetch_customers(bounds)
+    orders = fetch_orders(bounds)
+    fetched = time.perf_counter()
+
+    # Orders of older customers are left out; customers come sorted by id,
+    # so the others are found by bisection
+    orders = orders[np.isin(orders["user"], customers["user"])]
+    position = np.searchsorted(customers["user"], orders["user"])
+    cohort = customers["cohort"][position].astype(np.int64)
+    kind = customers["kind"][position]
+    age = orders["month"] - cohort
+    # Orders dated before registration (imported data) are left out
+    valid = age >= 0
+    orders, cohort, kind, age = orders[valid], cohort[valid], kind[valid], age[valid]
+
+    # Registrations per [user type, cohort]; row 0 is users without profile
+    sizes = np.zeros((len(UserProfile.USER_TYPES) + 1, months), dtype=np.int64)
+    np.add.at(sizes, (customers["kind"], customers["cohort"]), 1)
+
+    segments = [("all", "Tous les clients", np.ones(len(orders), dtype=bool))]
+    segments += [
+        (code, label, kind == index + 1)
+        for index, (code, label) in enumerate(UserProfile.USER_TYPES)
+    ]
+    # Only cohort/age pairs already reached: cohort c has seen months - c months
+    observable = np.add.outer(np.arange(months), np.arange(months)) < months
+
+    tables, curves = {}, []
+    for code, label, mask in segments:
+        size = sizes.sum(axis=0) if code == "all" else sizes[_kind(code)]
+        table = cohort_table(
+            orders["user"][mask],
+            cohort[mask],
+            age[mask],
+            orders["amount"][mask],
+            months,
+        )
+        active = np.where(observable, table["active"], 0)
+        reached = np.where(observable, size[:, None], 0).sum(axis=0)
+        curves.append(
+            {
+                "user_type": code,
+                "label": label,
+                "retention": [
+                    round(float(count) / float(total) * 100, 2) if total else None
+                    for count, total in zip(active.sum(axis=0), reached)
+                ],
+            }
+        )
+        tables[code] = (size, table)
+
+    size, table = tables["all"]
+    cohorts = []
+    for index in range(months):
+        month = first + index
+        registered = int(size[index])
+        revenue = float(table["revenue"][index].sum())
+        cohorts.append(
+            {
+                "label": f"{month // 12}-{month % 12 + 1:02d}",
+                "registered": registered,
+                "buyers": int(table["buyers"][index]),
+                "repeat_buyers": int(table["repeat_buyers"][index]),
+                "revenue": round(revenue, 2),
+                "revenue_per_user": round(revenue / registered, 2) if registered else 0,
+                "retention": [
+                    (
+                        round(float(table["active"][index, age]) / registered * 100, 1)
+                        if registered
+                        else 0
+                    )
+                    for age in range(months - index)
+                ],
+            }
+        )
+
+    return {
+        "months": months,
+        "cohorts": cohorts,
+        "curves": curves,
+        "orders": int(len(orders)),
+        "fetch_seconds": fetched - started,
+        "compute_seconds": time.perf_counter() - fetched,
+    }
+
+
+def cohort_table(users, cohort, age, amount, months):
+    """Matrices indexed by ``[cohort, months since registration]``.
+
+    ``active`` counts distinct customers who paid an order that month and
+    ``revenue`` sums their orders. ``buyers`` and ``repeat_buyers`` count,
+    per cohort, customers with at least one and at least two paid orders.
+    """
+    cells = cohort * months + age
+    revenue = np.bincount(cells, weights=amount, minlength=months * months)
+
+    # First order of each (customer, month) pair: one active customer
+    _, first_in_month = np.unique(users * months + age, return_index=True)
+    active = np.bincount(cells[first_in_month], minlength=months * months)
+
+    _, first_order, order_counts = np.unique(
+        users, return_index=True, return_counts=True
+    )
+    buyer_cohorts = cohort[first_order]
+    return {
+        "active": active.reshape(months, months),
+        "revenue": revenue.reshape(months, months),
+        "buyers": np.bincount(buyer_cohorts, minlength=months),
+        "repeat_buyers": np.bincount(buyer_cohorts[order_counts > 1], minlength=months),
+    }
+
+
+def fetch_customers(bounds):
+    """Customers registered since the first bound, sorted by id"""
+    return _fetch_array(
+        User.objects.filter(date_joined__gte=bounds[0])
+        .annotate(
+            cohort=_month_index("date_joined", bounds),
+            kind=_kind_code("profile__user_type"),
+        )
+        .order_by("id")
+        .values_list("id", "cohort", "kind"),
+        CUSTOMER_DTYPE,
+    )
+
+
+def fetch_orders(bounds):
+    """Paid orders placed since the first bound, by any customer"""
+    return _fetch_array(
+        Order.objects.filter(
+            status__in=SalesRollupService.PAID_STATUSES, created_at__gte=bounds[0]
+        )
+        .annotate(
+            month=_month_index("created_at", bounds),
+            amount=Cast("total_amount", FloatField()),
+        )
+        .order_by()
+        .values_list("user_id", "month", "amount"),
+        ORDER_DTYPE,
+    )
+
+
+def _fetch_array(queryset, dtype):
+    # The columns are plain numbers: a cursor skips the ORM's per-row work
+    sql, params = queryset.query.sql_with_params()
+    chunks = []
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(CHUNK_SIZE):
+            chunks.append(np.array(rows, dtype=dtype))
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+
+
+def _month_index(field, bounds):
+    # Position of the month in ``bounds``; dates from the first bound onward
+    return Case(
+        *[
+            When(**{f"{field}__lt": bound}, then=Value(index))
+            for index, bound in enumerate(bounds[1:])
+        ],
+        default=Value(len(bounds) - 1),
+        output_field=IntegerField(),
+    )
+
+
+def _kind_code(field):
+    # Position in UserProfile.USER_TYPES plus one; 0 without profile
+    return Case(
+        *[
+            When(**{field: code}, then=Value(_kind(code)))
+            for code, _ in UserProfile.USER_TYPES
+        ],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _kind(code):
+    return [value for value, _ in UserProfile.USER_TYPES].index(code) + 1
@@ -0,0 +1,79 @@
+"""In-process publish/subscribe for live notification streams.
+
+Each open Server-Sent Events connection subscribes an ``asyncio.Queue`` for
+its user. Publishers run in request threads (from ``transaction.on_commit``)
+and hand events to the subscriber's event loop with
+``call_soon_threadsafe``, so an idle connection is just a parked coroutine.
+
+The broker only reaches connections served by the same process; with
+several workers, the stream view also polls the database (see
+``NOTIFICATION_STREAM_POLL_INTERVAL``).
+"""
+
+import asyncio
+import threading
+
+
+class NotificationBroker:
+    """Routes notification events to the queues of subscribed users"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Register a queue on the running event loop and return it"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscription = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if not subscriptions:
+                return
+            subscriptions.difference_update(
+                {item for item in subscriptions if item[1] is queue}
+            )
+            if not subscriptions:
+                del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(items) for items in self._subscribers.values())
+
+    def publish(self, user_id, event):
+        """Deliver an event to every connection of a user; safe from any thread"""
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscriptions:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # The loop was closed under us; the connection is gone
+                self.unsubscribe(user_id, queue)
+
+
+def _offer(queue, event):
+    """Enqueue without blocking; a client that stopped reading loses events"""
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+broker = NotificationBroker()
+
+
+def notification_event(notification):
+    """Payload sent to the browser for a notification"""
+    return {
+        "id": notification.id,
+        "notification_type": notification.notification_type,
+        "title": notification.title,
+        "message": notification.message,
+        "created_at": notification.created_at.isoformat(),
+    }
@@ -0,0 +1,286 @@
+"""CSV and XLSX exports of the admin reports, written by a background worker.
+
+Staff queue a ``ReportExportJob`` from the reports page and the
+``run_export_worker`` command writes the file under ``MEDIA_ROOT``. Rows
+are read with ``.iterator()`` and written one at a time; XLSX files use
+openpyxl's write-only mode. Memory stays flat whatever the number of rows.
+
+A job that stalls is taken over by another worker. Each claim is
+identified by the ``started_at`` it sets: the worker writes to a partial
+file of its own and only saves progress or the outcome while the job
+still carries its claim, so a superseded worker stops at its next write.
+"""
+
+import csv
+import logging
+import os
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import DailySalesByStatus, Order, ReportExportJob
+from .services import ReportService, SalesRollupService
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per database round trip
+CHUNK_SIZE = 2000
+
+# The job's progress is saved every this many rows
+PROGRESS_ROWS = 5000
+
+# A running job whose progress has not moved for this long is taken over
+STALE_SECONDS = 600
+
+_exports = {}
+
+
+class Superseded(Exception):
+    """The job was claimed again by another worker"""
+
+
+def export(kind, headers):
+    """Register the rows of an export; ``kind`` is one of the job's KIND_CHOICES"""
+
+    def register(rows):
+        _exports[kind] = (headers, rows)
+        return rows
+
+    return register
+
+
+def claim_next_job():
+    """Reserve the oldest pending job, or a stalled one, for this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            ReportExportJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status="pending")
+                | Q(
+                    status="running",
+                    updated_at__lt=now - timedelta(seconds=STALE_SECONDS),
+                )
+            )
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "running"
+        job.started_at = job.updated_at = now
+        job.rows_written = 0
+        job.error = ""
+        job.save(
+            update_fields=[
+                "status",
+                "started_at",
+                "updated_at",
+                "rows_written",
+                "error",
+            ]
+        )
+    return job
+
+
+def run_job(job):
+    """Write the export file of a claimed job and record the outcome"""
+    name = (
+        f"report_exports/{job.pk}-{job.kind}-{job.date_from}-{job.date_to}"
+        f".{job.file_format}"
+    )
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    partial = f"{path}.{job.started_at:%Y%m%d%H%M%S%f}.part"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    claim = _claimed(job)
+
+    start = timezone.make_aware(datetime.combine(job.date_from, time.min))
+    end = timezone.make_aware(datetime.combine(job.date_to, time.max))
+    headers, rows = _exports[job.kind]
+    writer = write_xlsx if job.file_format == "xlsx" else write_csv
+    try:
+        written = writer(
+            partial,
+            job.get_kind_display(),
+            headers,
+            _track_progress(job, rows(start, end)),
+        )
+        with transaction.atomic():
+            # The lock keeps another worker from claiming the job meanwhile
+            if not claim.select_for_update().exists():
+                raise Superseded
+            os.replace(partial, path)
+            claim.update(
+                status="done",
+                file=name,
+                rows_written=written,
+                updated_at=timezone.now(),
+                finished_at=timezone.now(),
+            )
+    except Superseded:
+        logger.warning("Report export %s was taken over by another worker", job.pk)
+        _remove(partial)
+        return False
+    except Exception as e:
+        logger.exception("Report export %s failed", job.pk)
+        _remove(partial)
+        claim.update(
+            status="failed",
+            error=f"{type(e).__name__}: {e}"[:2000],
+            updated_at=timezone.now(),
+            finished_at=timezone.now(),
+        )
+        return False
+    return True
+
+
+def write_csv(path, title, headers, rows):
+    # utf-8-sig so that Excel detects the encoding of accented names
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8-sig") as output:
+        writer = csv.writer(output)
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    return written
+
+
+def write_xlsx(path, title, headers, rows):
+    # Write-only workbooks flush each row to disk instead of keeping cells
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title[:31])
+    sheet.append(headers)
+    written = 0
+    for row in rows:
+        sheet.append(row)
+        written += 1
+    workbook.save(path)
+    return written
+
+
+def _claimed(job):
+    # The job, as long as it still carries this worker's claim
+    return ReportExportJob.objects.filter(
+        pk=job.pk, status="running", started_at=job.started_at
+    )
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _track_progress(job, rows):
+    """Pass rows through, saving the count every PROGRESS_ROWS rows.
+
+    Raises ``Superseded`` when another worker has claimed the job since.
+    """
+    written = 0
+    for row in rows:
+        yield [_cell(value) for value in row]
+        written += 1
+        if written % PROGRESS_ROWS == 0:
+            if not _claimed(job).update(
+                rows_written=written, updated_at=timezone.now()
+            ):
+                raise Superseded
+
+
+def _cell(value):
+    # Neither format keeps time zones: write local times
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None, microsecond=0)
+    return value
+
+
+@export(
+    "orders",
+    [
+        "Commande",
+        "Date",
+        "Client",
+        "Email",
+        "Statut",
+        "Sous-total",
+        "TVA",
+        "Livraison",
+        "Total",
+    ],
+)
+def orders(start, end):
+    statuses = dict(Order.STATUS_CHOICES)
+    for row in (
+        Order.objects.filter(created_at__gte=start, created_at__lte=end)
+        .order_by("created_at", "id")
+        .values_list(
+            "order_id",
+            "created_at",
+            "user__username",
+            "user__email",
+            "status",
+            "subtotal",
+            "tax_amount",
+            "shipping_cost",
+            "total_amount",
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    ):
+        yield row[:4] + (statuses.get(row[4], row[4]),) + row[5:]
+
+
+@export("daily_revenue", ["Jour", "Commandes payées", "Articles", "Revenu"])
+def daily_revenue(start, end):
+    # One row per day from the rollups, whatever the number of orders
+    return (
+        DailySalesByStatus.objects.filter(
+            day__gte=timezone.localdate(start),
+            day__lte=timezone.localdate(end),
+            status__in=SalesRollupService.PAID_STATUSES,
+        )
+        .values("day")
+        .annotate(
+            orders=Sum("order_count"), items=Sum("item_count"), revenue=Sum("revenue")
+        )
+        .filter(orders__gt=0)
+        .order_by("day")
+        .values_list("day", "orders", "items", "revenue")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+@export("top_customers", ["Client", "Email", "Commandes payées", "Total dépensé"])
+def top_customers(start, end):
+    return (
+        Order.objects.filter(
+            created_at__gte=start,
+            created_at__lte=end,
+            status__in=SalesRollupService.PAID_STATUSES,
+        )
+        .values("user", "user__username", "user__email")
+        .annotate(order_count=Count("id"), total_spent=Sum("total_amount"))
+        .order_by("-total_spent", "user")
+        .values_list("user__username", "user__email", "order_count", "total_spent")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+@export(
+    "category_performance",
+    ["Catégorie", "Quantité vendue", "Revenu", "Produits distincts"],
+)
+def category_performance(start, end):
+    # One row per category
+    for row in ReportService.get_category_performance(
+        timezone.localdate(start), timezone.localdate(end)
+    ):
+        yield (
+            row["product__category__name"],
+            row["total_quantity"],
+            row["total_revenue"],
+            row["unique_products"],
+        )
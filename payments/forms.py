@@ -6,10 +6,16 @@ from .models import (
     RefundProof,
     ComplaintReason,
     ShippingType,
+    Notification,
+    NotificationPreference,
+    ReportExportJob,
 )
 
 
 class CheckoutForm(forms.Form):
+    # Issued on GET and echoed back so that retried submissions are idempotent
+    idempotency_key = forms.UUIDField(widget=forms.HiddenInput)
+
     shipping_type = forms.ModelChoiceField(
         queryset=ShippingType.objects.filter(is_active=True),
         widget=forms.RadioSelect,
@@ -103,6 +109,42 @@ class PaymentProofUploadForm(forms.ModelForm):
         return file
 
 
+class CartImportForm(forms.Form):
+    file = forms.FileField(
+        label="Fichier CSV",
+        help_text="Colonnes : sku, variant (facultatif), quantity",
+        widget=forms.ClearableFileInput(
+            attrs={"class": "form-control", "accept": ".csv,text/csv"}
+        ),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data.get("file")
+        if file:
+            if file.size > 1024 * 1024:
+                raise forms.ValidationError(
+                    "La taille du fichier doit être inférieure à 1 Mo."
+                )
+            if not file.name.lower().endswith(".csv"):
+                raise forms.ValidationError("Seuls les fichiers CSV sont autorisés.")
+        return file
+
+
+class NotificationPreferenceForm(forms.Form):
+    """One delivery choice per notification type"""
+
+    def __init__(self, *args, preferences=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        preferences = preferences or {}
+        for value, label in Notification.TYPE_CHOICES:
+            self.fields[value] = forms.ChoiceField(
+                choices=NotificationPreference.DELIVERY_CHOICES,
+                initial=preferences.get(value, "instant"),
+                label=label,
+                widget=forms.Select(attrs={"class": "form-select"}),
+            )
+
+
 class PaymentVerificationForm(forms.Form):
     action = forms.ChoiceField(
         choices=[
@@ -442,3 +484,37 @@ class ShippingTypeForm(forms.ModelForm):
             "is_active": "Actif",
             "display_order": "Ordre d'affichage",
         }
+
+
+class ReportExportForm(forms.ModelForm):
+    class Meta:
+        model = ReportExportJob
+        fields = ["kind", "file_format", "date_from", "date_to"]
+        widgets = {
+            "kind": forms.Select(attrs={"class": "form-select"}),
+            "file_format": forms.Select(attrs={"class": "form-select"}),
+            "date_from": forms.DateInput(
+                attrs={"class": "form-control", "type": "date"}, format="%Y-%m-%d"
+            ),
+            "date_to": forms.DateInput(
+                attrs={"class": "form-control", "type": "date"}, format="%Y-%m-%d"
+            ),
+        }
+        labels = {
+            "kind": "Rapport",
+            "file_format": "Format",
+            "date_from": "Du",
+            "date_to": "Au",
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get("date_from")
+        date_to = cleaned_data.get("date_to")
+
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError(
+                "La date de début doit précéder la date de fin."
+            )
+
+        return cleaned_data
@@ -0,0 +1,232 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from payments.models import Order, OrderItem
+from payments.services import ReportService, SalesRollupService
+from products.models import Brand, Category, Product, ProductReview
+
+PAID_STATUSES = ["paid", "processing", "shipped", "delivered"]
+
+
+def legacy_category_performance(start_date):
+    """Per-line loop used by admin_reports before the grouped query"""
+    category_performance = {}
+    order_items = OrderItem.objects.filter(
+        order__created_at__gte=start_date, order__status__in=PAID_STATUSES
+    ).select_related("product")
+    for item in order_items:
+        for category in item.product.categories.all():
+            row = category_performance.setdefault(
+                category.name,
+                {"total_quantity": 0, "total_revenue": Decimal("0"), "products": set()},
+            )
+            row["total_quantity"] += item.quantity
+            row["total_revenue"] += item.quantity * item.price
+            row["products"].add(item.product.id)
+    return category_performance
+
+
+def legacy_ratings_by_category(start_date):
+    """Per-review loop used by admin_reports before the grouped query"""
+    ratings = {}
+    reviews = ProductReview.objects.filter(created_at__gte=start_date).select_related(
+        "product"
+    )
+    for review in reviews:
+        for category in review.product.categories.all():
+            ratings.setdefault(category.name, []).append(review.rating)
+    return {name: sum(values) / len(values) for name, values in ratings.items()}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-row category loops of the reports with the grouped "
+        "queries for growing numbers of order lines and reviews. Category "
+        "performance is read from the daily rollups, rebuilt after seeding. "
+        "All writes are rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="100,1000,10000",
+            help="Comma-separated numbers of order lines (and reviews) to test",
+        )
+        parser.add_argument(
+            "--products", type=int, default=50, help="Products to spread lines over"
+        )
+        parser.add_argument(
+            "--categories",
+            type=int,
+            default=8,
+            help="Categories to spread products over",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        self.stdout.write(f"{'Lignes':>8}  {'Variante':<28}{'requêtes':>10}{'ms':>10}")
+        for size in sizes:
+            with transaction.atomic():
+                self.seed(size, options["products"], options["categories"])
+                start_date = timezone.now() - timedelta(days=30)
+                start_day = timezone.localdate(start_date)
+                rows = [
+                    (
+                        "Boucle (performance)",
+                        lambda: legacy_category_performance(start_date),
+                    ),
+                    (
+                        "SQL groupé (performance)",
+                        lambda: ReportService.get_category_performance(start_day),
+                    ),
+                    ("Boucle (notes)", lambda: legacy_ratings_by_category(start_date)),
+                    (
+                        "SQL groupé (notes)",
+                        lambda: ReportService.get_ratings_by_category(start_date),
+                    ),
+                ]
+                for name, run in rows:
+                    queries, elapsed = self.measure(run)
+                    self.stdout.write(
+                        f"{size:>8}  {name:<28}{queries:>10}{elapsed * 1000:>10.1f}"
+                    )
+                self.check_results(start_date)
+                transaction.set_rollback(True)
+
+    def check_results(self, start_date):
+        """Make sure both implementations agree before trusting the timings"""
+        legacy = legacy_category_performance(start_date)
+        grouped = {
+            row["product__category__name"]: row
+            for row in ReportService.get_category_performance(
+                timezone.localdate(start_date)
+            )
+        }
+        same_performance = legacy.keys() == grouped.keys() and all(
+            row["total_quantity"] == grouped[name]["total_quantity"]
+            and row["total_revenue"] == grouped[name]["total_revenue"]
+            and len(row["products"]) == grouped[name]["unique_products"]
+            for name, row in legacy.items()
+        )
+        legacy_ratings = legacy_ratings_by_category(start_date)
+        grouped_ratings = {
+            row["product__category__name"]: row["avg_rating"]
+            for row in ReportService.get_ratings_by_category(start_date)
+        }
+        same_ratings = legacy_ratings.keys() == grouped_ratings.keys() and all(
+            abs(value - grouped_ratings[name]) < 1e-9
+            for name, value in legacy_ratings.items()
+        )
+        if same_performance and same_ratings:
+            self.stdout.write(self.style.SUCCESS("          résultats identiques"))
+        else:
+            self.stdout.write(self.style.ERROR("          résultats différents"))
+
+    def seed(self, lines, product_count, category_count):
+        """Create orders with ``lines`` paid lines and as many reviews"""
+        run = uuid.uuid4().hex[:8]
+        brand = Brand.objects.create(name=f"benchmark-{run}")
+        categories = Category.objects.bulk_create(
+            [
+                Category(name=f"Benchmark {run} {i}", slug=f"benchmark-{run}-{i}")
+                for i in range(category_count)
+            ]
+        )
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f"Benchmark {i}",
+                    slug=f"benchmark-{run}-{i}",
+                    sku=f"BENCH-{run}-{i}",
+                    brand=brand,
+                    description="-",
+                    short_description="-",
+                    price=Decimal("100.00"),
+                    stock_quantity=1000,
+                )
+                for i in range(product_count)
+            ]
+        )
+        Product.categories.through.objects.bulk_create(
+            [
+                Product.categories.through(product=product, category=category)
+                for product in products
+                for category in random.sample(categories, 2)
+            ]
+        )
+
+        # One customer per batch of reviews: a user reviews a product once
+        users = User.objects.bulk_create(
+            [
+                User(username=f"benchmark-{run}-{i}")
+                for i in range(lines // product_count + 1)
+            ]
+        )
+        orders = Order.objects.bulk_create(
+            [
+                Order(
+                    order_id=f"BENCH-{run}-{i}",
+                    user=users[i % len(users)],
+                    status=random.choice(PAID_STATUSES),
+                    shipping_address="-",
+                    shipping_city="-",
+                    shipping_state="-",
+                    shipping_zip="-",
+                    subtotal=Decimal("0"),
+                    total_amount=Decimal("0"),
+                )
+                for i in range(max(lines // 3, 1))
+            ],
+            batch_size=1000,
+        )
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=orders[i % len(orders)],
+                    product=random.choice(products),
+                    quantity=random.randint(1, 5),
+                    price=Decimal("100.00"),
+                )
+                for i in range(lines)
+            ],
+            batch_size=1000,
+        )
+        ProductReview.objects.bulk_create(
+            [
+                ProductReview(
+                    product=products[i % product_count],
+                    user=users[i // product_count],
+                    rating=random.randint(1, 5),
+                    title="-",
+                    comment="-",
+                )
+                for i in range(lines)
+            ],
+            batch_size=1000,
+        )
+        # bulk_create sends no signal to keep the rollups in step
+        SalesRollupService.reconcile(timezone.localdate())
+
+    def measure(self, run):
+        """Return (queries, seconds) for one call"""
+        # Counted by a wrapper: the debug query log keeps only 9000 entries
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+        return queries, elapsed
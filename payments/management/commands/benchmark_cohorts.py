@@ -0,0 +1,177 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from payments.cohorts import build_cohorts
+from payments.models import Order
+from payments.services import SalesRollupService
+
+STATUSES = list(SalesRollupService.PAID_STATUSES) + ["pending", "cancelled"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le calcul des cohortes d'inscription sur un jeu de commandes "
+        "généré (1 million par défaut). Toutes les écritures sont annulées "
+        "à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--orders", type=int, default=1_000_000, help="Orders to generate"
+        )
+        parser.add_argument(
+            "--customers",
+            type=int,
+            default=50_000,
+            help="Customers to spread them over",
+        )
+        parser.add_argument(
+            "--months", type=int, default=12, help="Registration months analysed"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=5000, help="Rows inserted per query"
+        )
+
+    def handle(self, *args, **options):
+        months = options["months"]
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.seed(
+                options["orders"], options["customers"], months, options["batch_size"]
+            )
+            self.stdout.write(
+                f"Jeu de données généré en {time.perf_counter() - started:.1f}s"
+            )
+
+            queries, elapsed, report = self.measure(lambda: build_cohorts(months))
+            self.stdout.write(
+                f"Cohortes : {report['orders']} commandes payées, {queries} requête(s), "
+                f"{elapsed:.2f}s (lecture {report['fetch_seconds']:.2f}s, "
+                f"calcul {report['compute_seconds']:.2f}s)"
+            )
+            self.check_results(report)
+            transaction.set_rollback(True)
+
+    def check_results(self, report):
+        """Compare the totals of the cohort table with plain aggregates"""
+        since = self.month_starts[0]
+        paid = Order.objects.filter(
+            status__in=SalesRollupService.PAID_STATUSES, user__date_joined__gte=since
+        ).aggregate(revenue=Sum("total_amount"), buyers=Count("user", distinct=True))
+        revenue = sum(cohort["revenue"] for cohort in report["cohorts"])
+        buyers = sum(cohort["buyers"] for cohort in report["cohorts"])
+        registered = sum(cohort["registered"] for cohort in report["cohorts"])
+        if (
+            abs(revenue - float(paid["revenue"] or 0)) < 0.01 * len(report["cohorts"])
+            and buyers == paid["buyers"]
+            and registered == User.objects.filter(date_joined__gte=since).count()
+        ):
+            self.stdout.write(self.style.SUCCESS("Totaux identiques aux agrégats SQL"))
+        else:
+            self.stdout.write(self.style.ERROR("Totaux différents des agrégats SQL"))
+
+    def seed(self, order_count, customer_count, months, batch_size):
+        """Customers registered over ``months`` months and their orders"""
+        run = uuid.uuid4().hex[:8]
+        now = timezone.localtime()
+        current = now.year * 12 + now.month - 1
+        self.month_starts = [
+            now.replace(
+                year=month // 12,
+                month=month % 12 + 1,
+                day=1,
+                hour=0,
+                minute=0,
+                second=0,
+                microsecond=0,
+            )
+            for month in range(current - months + 1, current + 1)
+        ]
+
+        rng = np.random.default_rng()
+        cohorts = rng.integers(0, months, customer_count)
+        users = []
+        for start in range(0, customer_count, batch_size):
+            users += User.objects.bulk_create(
+                [
+                    User(
+                        username=f"cohort-{run}-{i}",
+                        date_joined=min(
+                            self.month_starts[cohorts[i]]
+                            + timedelta(hours=int(rng.integers(0, 27 * 24))),
+                            now,
+                        ),
+                    )
+                    for i in range(start, min(start + batch_size, customer_count))
+                ]
+            )
+        user_types = [code for code, _ in UserProfile.USER_TYPES]
+        UserProfile.objects.bulk_create(
+            [
+                UserProfile(user=user, user_type=random.choice(user_types))
+                for user in users
+            ],
+            batch_size=batch_size,
+        )
+
+        # Fewer orders as customers age: a geometric number of months after
+        # registration, capped at the current month
+        buyers = rng.integers(0, customer_count, order_count)
+        ages = rng.geometric(0.35, order_count) - 1
+        order_months = np.minimum(cohorts[buyers] + ages, months - 1)
+        by_month = np.argsort(order_months, kind="stable")
+
+        sequence = 0
+        for month in range(months):
+            placed_at = min(self.month_starts[month] + timedelta(days=14), now)
+            indexes = by_month[order_months[by_month] == month]
+            for start in range(0, len(indexes), batch_size):
+                batch = []
+                for index in indexes[start : start + batch_size]:
+                    amount = Decimal(int(rng.integers(1_000, 200_000)))
+                    batch.append(
+                        Order(
+                            order_id=f"COH-{run}-{sequence}",
+                            user=users[buyers[index]],
+                            status=random.choice(STATUSES),
+                            shipping_address="-",
+                            shipping_city="-",
+                            shipping_state="-",
+                            shipping_zip="-",
+                            subtotal=amount,
+                            total_amount=amount,
+                        )
+                    )
+                    sequence += 1
+                created = Order.objects.bulk_create(batch)
+                # created_at is auto_now_add: date the orders afterwards
+                Order.objects.filter(pk__in=[order.pk for order in created]).update(
+                    created_at=placed_at
+                )
+
+    def measure(self, run):
+        """Return (queries, seconds, result) for one call"""
+        # Counted by a wrapper: the debug query log keeps only 9000 entries
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - started
+        return queries, elapsed, result
@@ -0,0 +1,94 @@
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.utils.html import strip_tags
+
+from pages.models import SiteInformation
+from payments.services import EmailTemplateService
+
+
+def legacy_render(template_name, user):
+    """Per-recipient rendering used before the template service"""
+    context = {
+        "user": user,
+        "site_info": SiteInformation.get_instance(),
+        "site_url": getattr(settings, "SITE_URL", "http://localhost:8000"),
+        "current_year": datetime.now().year,
+    }
+    html = render_to_string(template_name, context)
+    return html, strip_tags(html)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering account status emails one by one with "
+        "render_to_string against the cached batch renderer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipients", type=int, default=500, help="Emails to render"
+        )
+        parser.add_argument(
+            "--template",
+            default="emails/account_activated.html",
+            help="Email template to render",
+        )
+
+    def handle(self, *args, **options):
+        template_name = options["template"]
+        users = [
+            SimpleNamespace(username=f"user_{i}", email=f"user_{i}@example.com")
+            for i in range(options["recipients"])
+        ]
+        SiteInformation.get_instance()
+        EmailTemplateService.clear_cache()
+
+        rows = [
+            (
+                "render_to_string + strip_tags",
+                self.measure(
+                    lambda: [legacy_render(template_name, user) for user in users]
+                ),
+            ),
+            (
+                "Service (cache froid)",
+                self.measure(
+                    lambda: EmailTemplateService.render_batch(
+                        template_name, [{"user": user} for user in users]
+                    )
+                ),
+            ),
+            (
+                "Service (cache chaud)",
+                self.measure(
+                    lambda: EmailTemplateService.render_batch(
+                        template_name, [{"user": user} for user in users]
+                    )
+                ),
+            ),
+        ]
+
+        self.stdout.write(f"{len(users)} emails — {template_name}")
+        self.stdout.write(
+            f"{'Variante':<32}{'total ms':>10}{'ms/email':>10}{'requêtes':>10}"
+        )
+        for name, (elapsed, queries) in rows:
+            self.stdout.write(
+                f"{name:<32}{elapsed * 1000:>10.1f}"
+                f"{elapsed * 1000 / len(users):>10.3f}{queries:>10}"
+            )
+
+    def measure(self, render):
+        """Return (seconds, queries) for one rendering pass"""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            render()
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries.captured_queries)
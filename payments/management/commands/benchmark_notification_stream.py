@@ -0,0 +1,135 @@
+import asyncio
+import gc
+import itertools
+import random
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from payments.events import broker
+from payments.management.commands.loadtest_checkout import percentile
+from payments.views import notification_stream
+
+
+def fake_request(user_id):
+    """The smallest request the stream view accepts, without a session or DB"""
+    user = SimpleNamespace(id=user_id, is_authenticated=True)
+
+    async def auser():
+        return user
+
+    return SimpleNamespace(auser=auser, headers={})
+
+
+class Command(BaseCommand):
+    help = (
+        "Open thousands of idle notification streams in one event loop and "
+        "report memory per subscriber, idle CPU and publish-to-delivery latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--subscribers", type=int, default=5000, help="Concurrent streams"
+        )
+        parser.add_argument(
+            "--events", type=int, default=2000, help="Events published from a thread"
+        )
+        parser.add_argument(
+            "--rate", type=int, default=1000, help="Events published per second"
+        )
+        parser.add_argument(
+            "--idle", type=float, default=3.0, help="Seconds to measure idle cost"
+        )
+
+    def handle(self, *args, **options):
+        # No polling and no heartbeat during the run: only the broker is measured
+        with override_settings(
+            NOTIFICATION_STREAM_ENABLED=True,
+            NOTIFICATION_STREAM_POLL_INTERVAL=0,
+            NOTIFICATION_STREAM_HEARTBEAT=3600,
+        ):
+            asyncio.run(self.run(options))
+
+    async def run(self, options):
+        subscribers = options["subscribers"]
+        sent_at = {}
+        latencies = []
+        delivered = asyncio.Event()
+        expected = options["events"]
+
+        async def consume(user_id):
+            response = await notification_stream(fake_request(user_id))
+            async for chunk in response.streaming_content:
+                if chunk.startswith(b"id: "):
+                    event_id = int(chunk[4 : chunk.index(b"\n")])
+                    latencies.append(time.perf_counter() - sent_at[event_id])
+                    if len(latencies) == expected:
+                        delivered.set()
+
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        tasks = [
+            asyncio.create_task(consume(user_id)) for user_id in range(subscribers)
+        ]
+        while broker.subscriber_count() < subscribers:
+            await asyncio.sleep(0.01)
+        connect_time = time.perf_counter() - started
+        gc.collect()
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - baseline) / subscribers
+        tracemalloc.stop()
+
+        self.stdout.write(
+            f"{subscribers} flux ouverts en {connect_time:.2f}s, "
+            f"{per_subscriber / 1024:.1f} Kio par abonné"
+        )
+
+        cpu = time.process_time()
+        await asyncio.sleep(options["idle"])
+        idle_cpu = time.process_time() - cpu
+        self.stdout.write(
+            f"Inactivité : {idle_cpu * 1000:.0f} ms CPU en {options['idle']:.0f}s "
+            f"pour {subscribers} abonnés"
+        )
+
+        def publish():
+            # Publishers run in request threads in production
+            ids = itertools.count(1)
+            interval = 1 / options["rate"]
+            for _ in range(expected):
+                time.sleep(interval)
+                event_id = next(ids)
+                sent_at[event_id] = time.perf_counter()
+                broker.publish(
+                    random.randrange(subscribers),
+                    {"id": event_id, "title": "Benchmark", "message": ""},
+                )
+
+        started = time.perf_counter()
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        await asyncio.wait_for(delivered.wait(), timeout=60)
+        elapsed = time.perf_counter() - started
+        publisher.join()
+
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        self.stdout.write(
+            f"{expected} événements livrés en {elapsed:.2f}s "
+            f"({expected / elapsed:.0f}/s) — latence p50 "
+            f"{percentile(latencies_ms, 0.50):.2f} ms, p99 "
+            f"{percentile(latencies_ms, 0.99):.2f} ms"
+        )
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Flux fermés, {broker.subscriber_count()} abonné(s) restant(s)"
+            )
+        )
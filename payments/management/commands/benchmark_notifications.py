@@ -0,0 +1,137 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from payments.models import Notification, OutgoingEmail
+from payments.services import MailService, NotificationService
+
+
+def legacy_notify_admins(notification_type, title, message):
+    """The per-admin loop used before the fan-out service"""
+    for admin in User.objects.filter(is_staff=True, is_active=True):
+        Notification.objects.create(
+            user=admin,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+        )
+        send_mail(
+            subject=title,
+            message=message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[admin.email],
+            fail_silently=True,
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-event database and email cost of the legacy staff "
+        "notification loop with the bulk fan-out service. All writes are "
+        "rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--staff", type=int, default=20, help="Staff users to add for the run"
+        )
+        parser.add_argument(
+            "--events", type=int, default=50, help="Events to notify per variant"
+        )
+
+    def handle(self, *args, **options):
+        events = options["events"]
+
+        with override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"
+        ):
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    [
+                        User(
+                            username=f"benchmark_staff_{i}",
+                            email=f"benchmark_staff_{i}@example.com",
+                            is_staff=True,
+                        )
+                        for i in range(options["staff"])
+                    ]
+                )
+                NotificationService.invalidate_staff_recipients()
+                staff = User.objects.filter(is_staff=True, is_active=True).count()
+                self.stdout.write(
+                    f"{staff} administrateurs actifs, {events} événements"
+                )
+
+                mail.outbox = []
+                legacy = self.measure(
+                    events,
+                    lambda i: legacy_notify_admins(
+                        "order_created", f"Commande {i}", "Nouvelle commande"
+                    ),
+                )
+                legacy_sessions = len(mail.outbox)
+
+                NotificationService.invalidate_staff_recipients()
+                cold = self.measure(
+                    1,
+                    lambda i: NotificationService.notify_staff(
+                        "order_created", "Commande", "Nouvelle commande"
+                    ),
+                )
+                warm = self.measure(
+                    events,
+                    lambda i: NotificationService.notify_staff(
+                        "order_created", f"Commande {i}", "Nouvelle commande"
+                    ),
+                )
+
+                # Cost of draining what the fan-out queued, paid by the worker
+                queued = OutgoingEmail.objects.filter(status="pending").count()
+                mail.outbox = []
+                batches = 0
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    while True:
+                        sent, failed = MailService.deliver_batch(backoff_seconds=0)
+                        if not (sent or failed):
+                            break
+                        batches += 1
+                    drain_time = time.perf_counter() - started
+
+                transaction.set_rollback(True)
+            NotificationService.invalidate_staff_recipients()
+
+        self.stdout.write("")
+        self.stdout.write(f"{'Variante':<28}{'requêtes/évt':>14}{'ms/évt':>10}")
+        self.stdout.write(
+            f"{'Boucle par administrateur':<28}{legacy[0]:>14.1f}{legacy[1]:>10.2f}"
+        )
+        self.stdout.write(
+            f"{'Fan-out (cache froid)':<28}{cold[0]:>14.1f}{cold[1]:>10.2f}"
+        )
+        self.stdout.write(
+            f"{'Fan-out (cache chaud)':<28}{warm[0]:>14.1f}{warm[1]:>10.2f}"
+        )
+        self.stdout.write("")
+        self.stdout.write(
+            f"Emails : boucle = {legacy_sessions} connexion(s) SMTP pendant les requêtes "
+            f"({legacy_sessions / events:.0f}/évt) ; fan-out = 0 pendant les requêtes, "
+            f"{queued} email(s) distribué(s) par le worker en {batches} connexion(s), "
+            f"{len(queries.captured_queries)} requêtes, {drain_time * 1000:.0f} ms"
+        )
+
+    def measure(self, count, notify):
+        """Return (queries per event, milliseconds per event)"""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for i in range(count):
+                notify(i)
+            elapsed = time.perf_counter() - started
+        return len(queries.captured_queries) / count, elapsed * 1000 / count
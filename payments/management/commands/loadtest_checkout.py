@@ -0,0 +1,320 @@
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.shortcuts import resolve_url
+from django.urls import reverse
+from django.utils import timezone
+
+from payments.models import Cart, CartItem, DeferredTask, Order, ShippingType
+from payments.tasks import wait_for_pool
+from products.models import Brand, Category, Product
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the cart and checkout flow: seeds N users and carts, drives "
+        "add-to-cart, update, checkout and admin confirmation concurrently "
+        "and reports throughput, latency percentiles and queries per request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=20, help="Number of simulated customers"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Number of worker threads"
+        )
+        parser.add_argument(
+            "--products", type=int, default=20, help="Number of seeded products"
+        )
+        parser.add_argument(
+            "--lines", type=int, default=5, help="Cart lines per customer"
+        )
+        parser.add_argument(
+            "--prefix", default="loadtest", help="Prefix for the seeded records"
+        )
+        parser.add_argument(
+            "--real-email",
+            action="store_true",
+            help="Keep the configured email backend instead of the in-memory one",
+        )
+        parser.add_argument(
+            "--cleanup",
+            action="store_true",
+            help="Delete the seeded users, orders and products afterwards",
+        )
+
+    def handle(self, *args, **options):
+        self.prefix = options["prefix"]
+        self.lines = max(1, min(options["lines"], options["products"]))
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+        self.stdout.write(
+            f"Base de données : {connection.vendor} — "
+            f"{options['users']} clients, {options['concurrency']} threads"
+        )
+        overrides = {}
+        if not options["real_email"]:
+            overrides["EMAIL_BACKEND"] = "django.core.mail.backends.locmem.EmailBackend"
+
+        try:
+            with override_settings(**overrides):
+                self.seed(options["users"], options["products"])
+                started_at = timezone.now()
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                    futures = [
+                        pool.submit(self.run_scenario, index, user)
+                        for index, user in enumerate(self.users)
+                    ]
+                    failures = 0
+                    for future in as_completed(futures):
+                        try:
+                            future.result()
+                        except Exception as e:
+                            failures += 1
+                            self.stderr.write(f"Scénario en échec : {e}")
+                requests_time = time.perf_counter() - started
+
+                # Invoices, notifications and emails are written by the
+                # deferred task pool after each commit: the run ends with them
+                wait_for_pool()
+                wall_time = time.perf_counter() - started
+
+            leftover = DeferredTask.objects.filter(created_at__gte=started_at).count()
+            self.report(wall_time, wall_time - requests_time, leftover, failures)
+        finally:
+            # Never delete rows that a deferred task is still working on
+            wait_for_pool()
+            if options["cleanup"]:
+                self.cleanup()
+
+    def seed(self, user_count, product_count):
+        """Create the products, customers, carts and staff user under test"""
+        brand, _ = Brand.objects.get_or_create(name=f"{self.prefix} brand")
+        category, _ = Category.objects.get_or_create(
+            slug=f"{self.prefix}-category", defaults={"name": f"{self.prefix}"}
+        )
+
+        self.products = []
+        for i in range(product_count):
+            product, _ = Product.objects.update_or_create(
+                sku=f"{self.prefix}-{i}",
+                defaults={
+                    "name": f"{self.prefix} product {i}",
+                    "slug": f"{self.prefix}-product-{i}",
+                    "brand": brand,
+                    "description": "Load test product",
+                    "short_description": "Load test product",
+                    "price": Decimal("100.00"),
+                    "stock_quantity": 1_000_000,
+                },
+            )
+            product.categories.add(category)
+            self.products.append(product)
+
+        self.shipping_type = ShippingType.objects.filter(is_active=True).first()
+        if self.shipping_type is None:
+            self.shipping_type = ShippingType.objects.create(
+                name=f"{self.prefix} shipping", estimated_days=3, cost=Decimal("500")
+            )
+
+        self.admin, _ = User.objects.get_or_create(
+            username=f"{self.prefix}_admin",
+            defaults={
+                "is_staff": True,
+                "is_superuser": True,
+                "email": f"{self.prefix}_admin@example.com",
+            },
+        )
+
+        self.users = []
+        for i in range(user_count):
+            user, _ = User.objects.get_or_create(
+                username=f"{self.prefix}_{i}",
+                defaults={"email": f"{self.prefix}_{i}@example.com"},
+            )
+            cart, _ = Cart.objects.get_or_create(user=user)
+            cart.items.all().delete()
+            self.users.append(user)
+
+    def timed(self, name, client, method, path, **kwargs):
+        """Issue one request and record its latency and query count"""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, **kwargs)
+            elapsed = time.perf_counter() - started
+
+        # Redirects to the login page mean the request was refused
+        login_url = resolve_url(settings.LOGIN_URL)
+        ok = response.status_code < 400 and not (
+            response.status_code == 302 and response.url.startswith(login_url)
+        )
+        if ok and response.get("Content-Type", "").startswith("application/json"):
+            ok = bool(response.json().get("success"))
+
+        with self.lock:
+            self.samples[name].append((elapsed, len(queries.captured_queries), ok))
+        return response
+
+    def run_scenario(self, index, user):
+        """One customer's full journey followed by the admin confirmation"""
+        try:
+            client = Client(SERVER_NAME="localhost")
+            client.force_login(user)
+            admin_client = Client(SERVER_NAME="localhost")
+            admin_client.force_login(self.admin)
+
+            # Spread customers over the catalogue so carts overlap partially
+            products = [
+                self.products[(index + offset) % len(self.products)]
+                for offset in range(self.lines)
+            ]
+
+            for product in products:
+                self.timed(
+                    "add_to_cart",
+                    client,
+                    "post",
+                    reverse("payments:add_to_cart"),
+                    data=json.dumps({"product_id": product.id, "quantity": 1}),
+                    content_type="application/json",
+                )
+
+            item_id = (
+                CartItem.objects.filter(cart__user=user)
+                .values_list("id", flat=True)
+                .first()
+            )
+            self.timed(
+                "update_cart",
+                client,
+                "post",
+                reverse("payments:update_cart"),
+                data=json.dumps({"cart_item_id": item_id, "quantity": 2}),
+                content_type="application/json",
+            )
+
+            self.timed(
+                "batch_update_cart",
+                client,
+                "post",
+                reverse("payments:batch_update_cart"),
+                data=json.dumps(
+                    {
+                        "operations": [
+                            {"product_id": product.id, "quantity": 3}
+                            for product in products
+                        ]
+                    }
+                ),
+                content_type="application/json",
+            )
+
+            self.timed("checkout_page", client, "get", reverse("payments:checkout"))
+            self.timed(
+                "checkout_submit",
+                client,
+                "post",
+                reverse("payments:checkout"),
+                data={
+                    "idempotency_key": str(uuid.uuid4()),
+                    "shipping_type": self.shipping_type.id,
+                    "shipping_address": "1 rue du test",
+                    "shipping_city": "Alger",
+                    "shipping_state": "Alger",
+                    "shipping_zip": "16000",
+                },
+            )
+
+            order = Order.objects.filter(user=user).order_by("-created_at").first()
+            if order is None:
+                raise RuntimeError(f"aucune commande créée pour {user.username}")
+
+            self.timed(
+                "admin_confirm_order",
+                admin_client,
+                "post",
+                reverse("accounts:admin_confirm_order", args=[order.order_id]),
+                data={"action": "confirm"},
+            )
+        finally:
+            # Each worker thread owns its own connection
+            connection.close()
+
+    def report(self, wall_time, fanout_time, leftover, failures):
+        total = sum(len(samples) for samples in self.samples.values())
+        errors = sum(
+            1
+            for samples in self.samples.values()
+            for sample in samples
+            if not sample[2]
+        )
+
+        header = (
+            f"{'Endpoint':<22}{'req':>6}{'err':>6}{'req/s':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'avg q':>8}{'max q':>7}"
+        )
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, samples in self.samples.items():
+            latencies = sorted(sample[0] * 1000 for sample in samples)
+            query_counts = [sample[1] for sample in samples]
+            self.stdout.write(
+                f"{name:<22}{len(samples):>6}"
+                f"{sum(1 for sample in samples if not sample[2]):>6}"
+                f"{len(samples) / wall_time:>9.1f}"
+                f"{percentile(latencies, 0.50):>9.1f}"
+                f"{percentile(latencies, 0.95):>9.1f}"
+                f"{percentile(latencies, 0.99):>9.1f}"
+                f"{sum(query_counts) / len(query_counts):>8.1f}"
+                f"{max(query_counts):>7}"
+            )
+
+        checkouts = len(self.samples.get("checkout_submit", []))
+        self.stdout.write("")
+        self.stdout.write(
+            f"Durée totale : {wall_time:.2f}s — {total} requêtes "
+            f"({total / wall_time:.1f} req/s), {checkouts / wall_time:.2f} paiements/s"
+        )
+        self.stdout.write(
+            f"Tâches différées terminées {fanout_time:.2f}s après la dernière "
+            f"requête, {leftover} non exécutée(s)"
+        )
+        ok = not (errors or failures or leftover)
+        style = self.style.SUCCESS if ok else self.style.WARNING
+        self.stdout.write(
+            style(f"{errors} requête(s) en erreur, {failures} scénario(s) en échec")
+        )
+
+    def cleanup(self):
+        """Remove everything seeded by this run"""
+        users = User.objects.filter(username__startswith=f"{self.prefix}_")
+        Order.objects.filter(user__in=users).delete()
+        users.delete()
+        Product.objects.filter(sku__startswith=f"{self.prefix}-").delete()
+        Brand.objects.filter(name=f"{self.prefix} brand").delete()
+        Category.objects.filter(slug=f"{self.prefix}-category").delete()
+        ShippingType.objects.filter(name=f"{self.prefix} shipping").delete()
+        self.stdout.write(self.style.SUCCESS("Données de test supprimées"))
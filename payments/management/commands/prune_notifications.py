@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.models import Notification
+from payments.services import NotificationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive (ou supprime avec --delete) les notifications lues plus "
+        "anciennes que N jours, par lots courts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "NOTIFICATION_RETENTION_DAYS", 90),
+            help="Keep read notifications younger than this many days",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Rows moved per transaction",
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete old notifications instead of archiving them",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to pause between chunks to leave room for other writers",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the notifications that would be pruned",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        action = "supprimée(s)" if options["delete"] else "archivée(s)"
+
+        if options["dry_run"]:
+            count = Notification.objects.filter(
+                is_read=True, created_at__lt=cutoff
+            ).count()
+            self.stdout.write(f"{count} notification(s) seraient {action}")
+            return
+
+        total, chunks, last_id = 0, 0, 0
+        started = time.perf_counter()
+        while True:
+            chunk_started = time.perf_counter()
+            count, last_id = NotificationService.prune_chunk(
+                cutoff,
+                options["chunk_size"],
+                after_id=last_id,
+                archive=not options["delete"],
+            )
+            if not count:
+                break
+            total += count
+            chunks += 1
+            elapsed = time.perf_counter() - chunk_started
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"Lot {chunks} : {count} ligne(s) en {elapsed * 1000:.0f} ms"
+                )
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} notification(s) {action} en {chunks} lot(s), "
+                f"{elapsed:.2f}s ({rate:.0f} lignes/s)"
+            )
+        )
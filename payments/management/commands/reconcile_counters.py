@@ -0,0 +1,35 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from payments.services import CounterService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompte les compteurs du tableau de bord d'administration et "
+        "remplace les valeurs en cache (à lancer périodiquement)"
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        cached = cache.get_many(
+            [CounterService.cache_key(name) for name in CounterService.COUNTERS]
+        )
+        counters = CounterService.recount()
+        drifted = 0
+        for name, value in counters.items():
+            previous = cached.get(CounterService.cache_key(name))
+            if previous is not None and previous != value:
+                drifted += 1
+                self.stdout.write(f"{name} : {previous} → {value}")
+            elif options["verbosity"] > 1:
+                self.stdout.write(f"{name} : {value}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(counters)} compteur(s) recalculé(s) en {elapsed:.2f}s, "
+                f"{drifted} écart(s) corrigé(s)"
+            )
+        )
@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+
+from payments.models import DailySalesByStatus, Order
+from payments.services import SalesRollupService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les agrégats de ventes journaliers à partir des commandes "
+        "et corrige les écarts (à lancer chaque nuit, et avec --all après "
+        "l'installation)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="Rebuild this many days, today included",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild every day since the first order",
+        )
+        parser.add_argument(
+            "--window",
+            type=int,
+            default=31,
+            help="Days rebuilt per transaction",
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options["all"]:
+            first_order = Order.objects.aggregate(first=Min("created_at"))["first"]
+            first_rollup = DailySalesByStatus.objects.aggregate(first=Min("day"))[
+                "first"
+            ]
+            days = [today]
+            if first_order:
+                days.append(timezone.localdate(first_order))
+            if first_rollup:
+                days.append(first_rollup)
+            start = min(days)
+        else:
+            start = today - timedelta(days=options["days"] - 1)
+
+        total, started = 0, time.perf_counter()
+        window_start = start
+        while window_start <= today:
+            window_end = min(
+                window_start + timedelta(days=options["window"] - 1), today
+            )
+            fixed = SalesRollupService.reconcile(window_start, window_end)
+            total += fixed
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"{window_start} → {window_end} : {fixed} ligne(s) corrigée(s)"
+                )
+            window_start = window_end + timedelta(days=1)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Agrégats du {start} au {today} vérifiés en {elapsed:.2f}s, "
+                f"{total} ligne(s) corrigée(s)"
+            )
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from payments.reports import cache_timeout, refresh_section
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule la section « Cohortes » des rapports et la met en cache (à "
+        "lancer plus souvent que COHORT_REPORT_CACHE_TIMEOUT, 6 h par défaut, "
+        "pour que la page ne la calcule jamais elle-même)"
+    )
+
+    def handle(self, *args, **options):
+        timing = refresh_section("cohorts")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cohortes recalculées en {timing['seconds']:.2f}s "
+                f"({timing['queries']} requête(s)), en cache pour "
+                f"{cache_timeout('cohorts')}s"
+            )
+        )
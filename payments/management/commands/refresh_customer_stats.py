@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.models import CustomerStats, Order
+from payments.services import CustomerStatsService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les statistiques clients à partir des commandes et attribue "
+        "les scores RFM (à lancer chaque nuit, et après l'installation)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scores-only",
+            action="store_true",
+            help="Only reassign the RFM scores, without rebuilding the rows",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = None
+        if not options["scores_only"]:
+            # Customers with orders, and rows left over from deleted orders
+            user_ids = set(
+                Order.objects.order_by().values_list("user_id", flat=True).distinct()
+            )
+            user_ids.update(CustomerStats.objects.values_list("user_id", flat=True))
+            written = CustomerStatsService.refresh(sorted(user_ids))
+        scored = CustomerStatsService.score()
+
+        elapsed = time.perf_counter() - started
+        rebuilt = "" if written is None else f"{written} client(s) recalculé(s), "
+        self.stdout.write(
+            self.style.SUCCESS(f"{rebuilt}{scored} client(s) noté(s) en {elapsed:.2f}s")
+        )
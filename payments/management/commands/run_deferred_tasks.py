@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.tasks import run_due_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Exécute les tâches différées en attente : reprise après un arrêt du "
+        "serveur et nouvelles tentatives des tâches en échec"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the due tasks once and exit instead of polling",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Tasks run per pass"
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=10.0,
+            help="Seconds to wait when no task is due",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Démarrage de l'exécuteur de tâches différées...")
+        total_done = total_failed = 0
+
+        try:
+            while True:
+                done, failed = run_due_tasks(options["batch_size"])
+                total_done += done
+                total_failed += failed
+                if done or failed:
+                    self.stdout.write(f"{done} exécutée(s), {failed} en échec")
+
+                if done + failed < options["batch_size"]:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Terminé : {total_done} tâche(s) exécutée(s), {total_failed} échec(s)"
+            )
+        )
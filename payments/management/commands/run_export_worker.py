@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.exports import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Génère les exports de rapports (CSV/XLSX) en attente (ReportExportJob)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the pending jobs once and exit instead of polling",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when no job is pending",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Démarrage du générateur d'exports...")
+        done = failed = 0
+
+        try:
+            while True:
+                job = claim_next_job()
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+                    continue
+
+                started = time.perf_counter()
+                if run_job(job):
+                    done += 1
+                    job.refresh_from_db()
+                    self.stdout.write(
+                        f"Export {job.pk} ({job}) : {job.rows_written} ligne(s) "
+                        f"en {time.perf_counter() - started:.2f}s"
+                    )
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"Export {job.pk} en échec"))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Terminé : {done} export(s) généré(s), {failed} échec(s)"
+            )
+        )
@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.services import MailService
+
+
+class Command(BaseCommand):
+    help = "Distribue les emails en attente de la file d'envoi (OutgoingEmail)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the due emails once and exit instead of polling",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(settings, "MAIL_OUTBOX_BATCH_SIZE", 50),
+            help="Emails sent per backend connection",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=getattr(settings, "MAIL_OUTBOX_MAX_ATTEMPTS", 5),
+            help="Attempts before an email is marked as dead",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=int,
+            default=getattr(settings, "MAIL_OUTBOX_BACKOFF_SECONDS", 60),
+            help="Base retry delay in seconds, doubled after each failure",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when the outbox is empty",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Démarrage du distributeur d'emails...")
+        total_sent = total_failed = 0
+
+        try:
+            while True:
+                sent, failed = MailService.deliver_batch(
+                    batch_size=options["batch_size"],
+                    max_attempts=options["max_attempts"],
+                    backoff_seconds=options["backoff"],
+                )
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"{sent} envoyé(s), {failed} en échec")
+
+                if sent + failed < options["batch_size"]:
+                    # Nothing left that is due right now
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Terminé : {total_sent} email(s) envoyé(s), {total_failed} échec(s)"
+            )
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from payments.services import NotificationService
+
+
+class Command(BaseCommand):
+    help = (
+        "Envoie les résumés de notifications (à planifier toutes les heures "
+        "avec --frequency hourly et chaque jour avec --frequency daily)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--frequency",
+            choices=["hourly", "daily"],
+            required=True,
+            help="Which digest preference to send",
+        )
+
+    def handle(self, *args, **options):
+        count = NotificationService.send_digests(options["frequency"])
+        self.stdout.write(self.style.SUCCESS(f"{count} résumé(s) mis en file d'envoi"))
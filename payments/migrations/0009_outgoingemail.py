@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0008_checkoutsubmission"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutgoingEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subject", models.CharField(max_length=255, verbose_name="Sujet")),
+                ("body", models.TextField(verbose_name="Message")),
+                (
+                    "html_body",
+                    models.TextField(blank=True, verbose_name="Message HTML"),
+                ),
+                (
+                    "from_email",
+                    models.CharField(
+                        blank=True, max_length=254, verbose_name="Expéditeur"
+                    ),
+                ),
+                (
+                    "recipients",
+                    models.JSONField(default=list, verbose_name="Destinataires"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "En attente"),
+                            ("sent", "Envoyé"),
+                            ("dead", "Abandonné"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="Statut",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="Tentatives"),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Prochaine tentative",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="Dernière erreur"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Envoyé le"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Email sortant",
+                "verbose_name_plural": "Emails sortants",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="payments_ou_status_52550c_idx",
+                    )
+                ],
+            },
+        ),
+    ]
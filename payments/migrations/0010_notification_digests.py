@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0009_outgoingemail"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationPreference",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "notification_type",
+                    models.CharField(
+                        choices=[
+                            ("order_created", "Commande créée"),
+                            ("invoice_created", "Facture créée"),
+                            ("payment_submitted", "Paiement soumis"),
+                            ("payment_confirmed", "Paiement confirmé"),
+                            ("payment_rejected", "Paiement rejeté"),
+                            ("complaint_created", "Réclamation créée"),
+                            ("complaint_updated", "Réclamation mise à jour"),
+                            ("complaint_resolved", "Réclamation résolue"),
+                            ("refund_initiated", "Remboursement initié"),
+                            ("refund_completed", "Remboursement effectué"),
+                            ("order_shipped", "Commande expédiée"),
+                            ("order_delivered", "Commande livrée"),
+                            ("order_confirmed", "Commande confirmée"),
+                            ("order_rejected", "Commande rejetée"),
+                            ("user_registered", "Nouvel utilisateur inscrit"),
+                            ("review_submitted", "Nouvel avis soumis"),
+                            ("question_submitted", "Nouvelle question soumise"),
+                            ("contact_message", "Nouveau message de contact"),
+                        ],
+                        max_length=30,
+                        verbose_name="Type de notification",
+                    ),
+                ),
+                (
+                    "delivery",
+                    models.CharField(
+                        choices=[
+                            ("instant", "Immédiat"),
+                            ("hourly", "Résumé horaire"),
+                            ("daily", "Résumé quotidien"),
+                        ],
+                        default="instant",
+                        max_length=10,
+                        verbose_name="Envoi",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Préférence de notification",
+                "verbose_name_plural": "Préférences de notification",
+            },
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="digest_pending",
+            field=models.BooleanField(
+                default=False,
+                help_text="Sera envoyée dans le prochain email de résumé",
+                verbose_name="En attente de résumé",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["digest_pending", "user"], name="payments_no_digest__bd8908_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationpreference",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notification_preferences",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Utilisateur",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="notificationpreference",
+            unique_together={("user", "notification_type")},
+        ),
+    ]
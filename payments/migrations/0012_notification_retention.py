@@ -0,0 +1,140 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0011_notificationcounter"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "notification_type",
+                    models.CharField(
+                        choices=[
+                            ("order_created", "Commande créée"),
+                            ("invoice_created", "Facture créée"),
+                            ("payment_submitted", "Paiement soumis"),
+                            ("payment_confirmed", "Paiement confirmé"),
+                            ("payment_rejected", "Paiement rejeté"),
+                            ("complaint_created", "Réclamation créée"),
+                            ("complaint_updated", "Réclamation mise à jour"),
+                            ("complaint_resolved", "Réclamation résolue"),
+                            ("refund_initiated", "Remboursement initié"),
+                            ("refund_completed", "Remboursement effectué"),
+                            ("order_shipped", "Commande expédiée"),
+                            ("order_delivered", "Commande livrée"),
+                            ("order_confirmed", "Commande confirmée"),
+                            ("order_rejected", "Commande rejetée"),
+                            ("user_registered", "Nouvel utilisateur inscrit"),
+                            ("review_submitted", "Nouvel avis soumis"),
+                            ("question_submitted", "Nouvelle question soumise"),
+                            ("contact_message", "Nouveau message de contact"),
+                        ],
+                        max_length=30,
+                        verbose_name="Type de notification",
+                    ),
+                ),
+                ("title", models.CharField(max_length=200, verbose_name="Titre")),
+                ("message", models.TextField(verbose_name="Message")),
+                (
+                    "order_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID commande"
+                    ),
+                ),
+                (
+                    "invoice_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID facture"
+                    ),
+                ),
+                (
+                    "complaint_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID réclamation"
+                    ),
+                ),
+                (
+                    "refund_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID remboursement"
+                    ),
+                ),
+                (
+                    "related_user_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID utilisateur concerné"
+                    ),
+                ),
+                (
+                    "review_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID de l'avis"
+                    ),
+                ),
+                (
+                    "question_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID de la question"
+                    ),
+                ),
+                (
+                    "contact_id",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="ID du contact"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Créée le")),
+                (
+                    "archived_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Archivée le"),
+                ),
+            ],
+            options={
+                "verbose_name": "Notification archivée",
+                "verbose_name_plural": "Notifications archivées",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["user", "is_read", "-created_at"],
+                name="payments_no_user_id_6b044c_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notificationarchive",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="archived_notifications",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Utilisateur",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notificationarchive",
+            index=models.Index(
+                fields=["user", "-created_at"], name="payments_no_user_id_cd5d16_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0012_notification_retention"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeferredTask",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "handler",
+                    models.CharField(max_length=255, verbose_name="Gestionnaire"),
+                ),
+                ("payload", models.JSONField(default=dict, verbose_name="Données")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("pending", "En attente"), ("failed", "En échec")],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="Statut",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="Tentatives"),
+                ),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Prochaine tentative",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="Dernière erreur"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Tâche différée",
+                "verbose_name_plural": "Tâches différées",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="payments_de_status_07e7aa_idx",
+                    )
+                ],
+            },
+        ),
+    ]
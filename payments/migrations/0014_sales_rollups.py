@@ -0,0 +1,158 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0013_deferredtask"),
+        ("products", "0005_bulkcontainertype_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailySalesByStatus",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Jour")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending_confirmation", "En attente de confirmation"),
+                            ("confirmed", "Confirmée"),
+                            ("rejected", "Rejetée"),
+                            ("awaiting_payment", "En attente de paiement"),
+                            (
+                                "payment_under_review",
+                                "Paiement en cours de vérification",
+                            ),
+                            ("paid", "Payée"),
+                            ("processing", "En traitement"),
+                            ("shipped", "Expédiée"),
+                            ("delivered", "Livrée"),
+                            ("cancelled", "Annulée"),
+                            ("refund_pending", "Remboursement en attente"),
+                            ("refunded", "Remboursée"),
+                        ],
+                        max_length=30,
+                        verbose_name="Statut",
+                    ),
+                ),
+                (
+                    "order_count",
+                    models.IntegerField(default=0, verbose_name="Commandes"),
+                ),
+                ("item_count", models.IntegerField(default=0, verbose_name="Articles")),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Montant total",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ventes du jour par statut",
+                "verbose_name_plural": "Ventes du jour par statut",
+                "ordering": ["-day", "status"],
+                "unique_together": {("day", "status")},
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyCategorySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Jour")),
+                ("quantity", models.IntegerField(default=0, verbose_name="Quantité")),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Revenu",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="products.category",
+                        verbose_name="Catégorie",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ventes du jour par catégorie",
+                "verbose_name_plural": "Ventes du jour par catégorie",
+                "ordering": ["-day"],
+                "unique_together": {("day", "category")},
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyProductSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Jour")),
+                ("quantity", models.IntegerField(default=0, verbose_name="Quantité")),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Revenu",
+                    ),
+                ),
+                (
+                    "order_count",
+                    models.IntegerField(default=0, verbose_name="Commandes"),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="products.product",
+                        verbose_name="Produit",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ventes du jour par produit",
+                "verbose_name_plural": "Ventes du jour par produit",
+                "ordering": ["-day"],
+                "unique_together": {("day", "product")},
+            },
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0014_sales_rollups"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportExportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("orders", "Commandes"),
+                            ("daily_revenue", "Revenu par jour"),
+                            ("top_customers", "Meilleurs clients"),
+                            ("category_performance", "Performance par catégorie"),
+                        ],
+                        max_length=30,
+                        verbose_name="Rapport",
+                    ),
+                ),
+                (
+                    "file_format",
+                    models.CharField(
+                        choices=[("csv", "CSV"), ("xlsx", "Excel (XLSX)")],
+                        default="csv",
+                        max_length=4,
+                        verbose_name="Format",
+                    ),
+                ),
+                ("date_from", models.DateField(verbose_name="Du")),
+                ("date_to", models.DateField(verbose_name="Au")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "En attente"),
+                            ("running", "En cours"),
+                            ("done", "Terminé"),
+                            ("failed", "En échec"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="Statut",
+                    ),
+                ),
+                (
+                    "rows_written",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Lignes écrites"
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        blank=True, upload_to="report_exports/", verbose_name="Fichier"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Erreur")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Mis à jour le"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Démarré le"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Terminé le"
+                    ),
+                ),
+                (
+                    "requested_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="report_exports",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Demandé par",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Export de rapport",
+                "verbose_name_plural": "Exports de rapports",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"],
+                        name="payments_re_status_843784_idx",
+                    )
+                ],
+            },
+        ),
+    ]
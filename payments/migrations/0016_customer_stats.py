@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("payments", "0015_report_export_jobs"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CustomerStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="customer_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Client",
+                    ),
+                ),
+                (
+                    "order_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Commandes"),
+                ),
+                (
+                    "paid_order_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Commandes payées"
+                    ),
+                ),
+                (
+                    "total_spent",
+                    models.DecimalField(
+                        db_index=True,
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="Total dépensé",
+                    ),
+                ),
+                (
+                    "average_order_value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="Panier moyen",
+                    ),
+                ),
+                (
+                    "first_order_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Première commande payée"
+                    ),
+                ),
+                (
+                    "last_order_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_index=True,
+                        null=True,
+                        verbose_name="Dernière commande payée",
+                    ),
+                ),
+                (
+                    "recency_score",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="Récence"),
+                ),
+                (
+                    "frequency_score",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="Fréquence"
+                    ),
+                ),
+                (
+                    "monetary_score",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="Montant"),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Statistiques client",
+                "verbose_name_plural": "Statistiques clients",
+                "ordering": ["-total_spent"],
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+PAID_STATUSES = ("paid", "processing", "shipped", "delivered")
+
+
+def build_sales_rollups(apps, schema_editor):
+    """Rebuild the daily sales rollups from the orders placed before 0014.
+
+    Rows written by the signals since then are replaced, the whole history
+    being recomputed. Same aggregates as ``SalesRollupService.reconcile``.
+    """
+    Order = apps.get_model("payments", "Order")
+    OrderItem = apps.get_model("payments", "OrderItem")
+    DailySalesByStatus = apps.get_model("payments", "DailySalesByStatus")
+    DailyProductSales = apps.get_model("payments", "DailyProductSales")
+    DailyCategorySales = apps.get_model("payments", "DailyCategorySales")
+
+    revenue = Sum(
+        F("quantity") * F("price"),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    lines = OrderItem.objects.order_by()
+    paid_lines = lines.filter(order__status__in=PAID_STATUSES)
+
+    by_status = defaultdict(
+        lambda: {"order_count": 0, "item_count": 0, "revenue": Decimal("0")}
+    )
+    for row in (
+        Order.objects.order_by()
+        .values(day=TruncDate("created_at"), key=F("status"))
+        .annotate(order_count=Count("id"), revenue=Sum("total_amount"))
+    ):
+        by_status[(row["day"], row["key"])].update(
+            order_count=row["order_count"], revenue=row["revenue"]
+        )
+    for row in lines.values(
+        day=TruncDate("order__created_at"), key=F("order__status")
+    ).annotate(item_count=Sum("quantity")):
+        by_status[(row["day"], row["key"])]["item_count"] = row["item_count"]
+
+    by_product = paid_lines.values(
+        day=TruncDate("order__created_at"), key=F("product_id")
+    ).annotate(
+        revenue=revenue,
+        quantity=Sum("quantity"),
+        order_count=Count("order", distinct=True),
+    )
+    by_category = (
+        paid_lines.filter(product__categories__isnull=False)
+        .values(day=TruncDate("order__created_at"), key=F("product__categories"))
+        .annotate(revenue=revenue, quantity=Sum("quantity"))
+    )
+
+    DailySalesByStatus.objects.all().delete()
+    DailyProductSales.objects.all().delete()
+    DailyCategorySales.objects.all().delete()
+    DailySalesByStatus.objects.bulk_create(
+        [
+            DailySalesByStatus(day=day, status=status, **values)
+            for (day, status), values in by_status.items()
+        ],
+        batch_size=1000,
+    )
+    DailyProductSales.objects.bulk_create(
+        [
+            DailyProductSales(
+                day=row["day"],
+                product_id=row["key"],
+                quantity=row["quantity"],
+                revenue=row["revenue"],
+                order_count=row["order_count"],
+            )
+            for row in by_product
+        ],
+        batch_size=1000,
+    )
+    DailyCategorySales.objects.bulk_create(
+        [
+            DailyCategorySales(
+                day=row["day"],
+                category_id=row["key"],
+                quantity=row["quantity"],
+                revenue=row["revenue"],
+            )
+            for row in by_category
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0016_customer_stats"),
+    ]
+
+    operations = [
+        migrations.RunPython(build_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Max, Min, Q, Sum
+
+PAID_STATUSES = ("paid", "processing", "shipped", "delivered")
+
+
+def build_customer_stats(apps, schema_editor):
+    """Create the stats rows of the customers who ordered before 0016.
+
+    Same figures as ``CustomerStatsService.refresh``. Rows written since
+    0016 are rebuilt from all the orders, so they are kept. The RFM scores
+    are left at 0 until the next refresh_customer_stats run.
+    """
+    Order = apps.get_model("payments", "Order")
+    CustomerStats = apps.get_model("payments", "CustomerStats")
+
+    paid = Q(status__in=PAID_STATUSES)
+    rows = (
+        Order.objects.order_by()
+        .values("user_id")
+        .annotate(
+            order_count=Count("id"),
+            paid_order_count=Count("id", filter=paid),
+            total_spent=Sum("total_amount", filter=paid, default=Decimal("0")),
+            first_order_at=Min("created_at", filter=paid),
+            last_order_at=Max("created_at", filter=paid),
+        )
+    )
+    stats = []
+    for row in rows:
+        paid_count = row["paid_order_count"]
+        average = row["total_spent"] / paid_count if paid_count else 0
+        stats.append(
+            CustomerStats(
+                average_order_value=Decimal(average).quantize(Decimal("0.01")),
+                **row,
+            )
+        )
+    CustomerStats.objects.bulk_create(stats, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments", "0017_backfill_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.RunPython(build_customer_stats, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from products.models import Product
 import uuid
@@ -17,7 +18,8 @@ class Cart(models.Model):
         return f"Panier de {self.user.username}"
 
     def get_total_price(self):
-        return sum(item.get_total_price() for item in self.items.all())
+        items = self.items.select_related("product", "variant")
+        return sum(item.get_total_price() for item in items)
 
     def get_total_items(self):
         return sum(item.quantity for item in self.items.all())
@@ -149,6 +151,20 @@ class Order(models.Model):
     def __str__(self):
         return f"Commande {self.order_id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # État lu en base, comparé après chaque enregistrement pour les agrégats
+        instance._rollup_state = instance.rollup_state()
+        return instance
+
+    def rollup_state(self):
+        """(statut, montant total) pris en compte dans les agrégats de ventes"""
+        loaded = self.__dict__
+        if "status" not in loaded or "total_amount" not in loaded:
+            return None
+        return (loaded["status"], loaded["total_amount"])
+
     def save(self, *args, **kwargs):
         if not self.order_id:
             self.order_id = f"CMD-{uuid.uuid4().hex[:12].upper()}"
@@ -182,10 +198,52 @@ class OrderItem(models.Model):
         variant_info = f" ({self.variant.variant_value})" if self.variant else ""
         return f"{self.quantity} x {self.product.name}{variant_info}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_state = instance.rollup_state()
+        return instance
+
+    def rollup_state(self):
+        """(produit, quantité, prix) pris en compte dans les agrégats de ventes"""
+        loaded = self.__dict__
+        if not {"product_id", "quantity", "price"} <= loaded.keys():
+            return None
+        return (loaded["product_id"], loaded["quantity"], loaded["price"])
+
     def get_total_price(self):
         return self.quantity * self.price
 
 
+class CheckoutSubmission(models.Model):
+    """Clé d'idempotence émise avec le formulaire de paiement"""
+
+    key = models.UUIDField(unique=True, editable=False, verbose_name="Clé")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="checkout_submissions",
+        verbose_name="Utilisateur",
+    )
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="checkout_submission",
+        verbose_name="Commande",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Soumission de paiement"
+        verbose_name_plural = "Soumissions de paiement"
+
+    def __str__(self):
+        return f"Soumission {self.key}"
+
+
 class OrderNote(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name="note")
     content = models.TextField(verbose_name="Contenu")
@@ -686,12 +744,391 @@ class Notification(models.Model):
     )
 
     is_read = models.BooleanField(default=False, verbose_name="Lu")
+    digest_pending = models.BooleanField(
+        default=False,
+        verbose_name="En attente de résumé",
+        help_text="Sera envoyée dans le prochain email de résumé",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["digest_pending", "user"]),
+            models.Index(fields=["user", "is_read", "-created_at"]),
+        ]
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
 
     def __str__(self):
         return f"{self.get_notification_type_display()} - {self.user.username}"
+
+
+class NotificationArchive(models.Model):
+    """Notification lue archivée par la commande prune_notifications"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="archived_notifications",
+        verbose_name="Utilisateur",
+    )
+    notification_type = models.CharField(
+        max_length=30,
+        choices=Notification.TYPE_CHOICES,
+        verbose_name="Type de notification",
+    )
+    title = models.CharField(max_length=200, verbose_name="Titre")
+    message = models.TextField(verbose_name="Message")
+
+    # Identifiants seulement : l'archive ne bloque pas la suppression des objets liés
+    order_id = models.IntegerField(null=True, blank=True, verbose_name="ID commande")
+    invoice_id = models.IntegerField(null=True, blank=True, verbose_name="ID facture")
+    complaint_id = models.IntegerField(
+        null=True, blank=True, verbose_name="ID réclamation"
+    )
+    refund_id = models.IntegerField(
+        null=True, blank=True, verbose_name="ID remboursement"
+    )
+    related_user_id = models.IntegerField(
+        null=True, blank=True, verbose_name="ID utilisateur concerné"
+    )
+    review_id = models.IntegerField(null=True, blank=True, verbose_name="ID de l'avis")
+    question_id = models.IntegerField(
+        null=True, blank=True, verbose_name="ID de la question"
+    )
+    contact_id = models.IntegerField(
+        null=True, blank=True, verbose_name="ID du contact"
+    )
+
+    created_at = models.DateTimeField(verbose_name="Créée le")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Archivée le")
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "-created_at"])]
+        verbose_name = "Notification archivée"
+        verbose_name_plural = "Notifications archivées"
+
+    def __str__(self):
+        return f"{self.get_notification_type_display()} - {self.user.username}"
+
+
+class NotificationCounter(models.Model):
+    """Nombre de notifications non lues d'un utilisateur, tenu à jour à chaque changement"""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name="notification_counter",
+        verbose_name="Utilisateur",
+    )
+    unread_count = models.PositiveIntegerField(default=0, verbose_name="Non lues")
+
+    class Meta:
+        verbose_name = "Compteur de notifications"
+        verbose_name_plural = "Compteurs de notifications"
+
+    def __str__(self):
+        return f"{self.user.username}: {self.unread_count}"
+
+
+class NotificationPreference(models.Model):
+    """Mode d'envoi des emails choisi par un utilisateur pour un type de notification"""
+
+    DELIVERY_CHOICES = [
+        ("instant", "Immédiat"),
+        ("hourly", "Résumé horaire"),
+        ("daily", "Résumé quotidien"),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="notification_preferences",
+        verbose_name="Utilisateur",
+    )
+    notification_type = models.CharField(
+        max_length=30,
+        choices=Notification.TYPE_CHOICES,
+        verbose_name="Type de notification",
+    )
+    delivery = models.CharField(
+        max_length=10,
+        choices=DELIVERY_CHOICES,
+        default="instant",
+        verbose_name="Envoi",
+    )
+
+    class Meta:
+        unique_together = ("user", "notification_type")
+        verbose_name = "Préférence de notification"
+        verbose_name_plural = "Préférences de notification"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.notification_type}: {self.delivery}"
+
+
+class DeferredTask(models.Model):
+    """Gestionnaire de signal différé, exécuté après la validation de la transaction"""
+
+    STATUS_CHOICES = [
+        ("pending", "En attente"),
+        ("failed", "En échec"),
+    ]
+
+    handler = models.CharField(max_length=255, verbose_name="Gestionnaire")
+    payload = models.JSONField(default=dict, verbose_name="Données")
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="pending", verbose_name="Statut"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Prochaine tentative"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Dernière erreur")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+        verbose_name = "Tâche différée"
+        verbose_name_plural = "Tâches différées"
+
+    def __str__(self):
+        return f"{self.handler} ({self.payload.get('model')} #{self.payload.get('pk')})"
+
+
+class OutgoingEmail(models.Model):
+    """Email en attente d'envoi, distribué par la commande run_mail_worker"""
+
+    STATUS_CHOICES = [
+        ("pending", "En attente"),
+        ("sent", "Envoyé"),
+        ("dead", "Abandonné"),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name="Sujet")
+    body = models.TextField(verbose_name="Message")
+    html_body = models.TextField(blank=True, verbose_name="Message HTML")
+    from_email = models.CharField(max_length=254, blank=True, verbose_name="Expéditeur")
+    recipients = models.JSONField(default=list, verbose_name="Destinataires")
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="pending", verbose_name="Statut"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Prochaine tentative"
+    )
+    last_error = models.TextField(blank=True, verbose_name="Dernière erreur")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Envoyé le")
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+        verbose_name = "Email sortant"
+        verbose_name_plural = "Emails sortants"
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
+
+
+class DailySalesByStatus(models.Model):
+    """Commandes d'une journée pour un statut, tenu à jour à chaque changement.
+
+    Une commande compte le jour de sa création, sous son statut actuel.
+    """
+
+    day = models.DateField(verbose_name="Jour")
+    status = models.CharField(
+        max_length=30, choices=Order.STATUS_CHOICES, verbose_name="Statut"
+    )
+    order_count = models.IntegerField(default=0, verbose_name="Commandes")
+    item_count = models.IntegerField(default=0, verbose_name="Articles")
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Montant total"
+    )
+
+    class Meta:
+        ordering = ["-day", "status"]
+        unique_together = ("day", "status")
+        verbose_name = "Ventes du jour par statut"
+        verbose_name_plural = "Ventes du jour par statut"
+
+    def __str__(self):
+        return f"{self.day} - {self.status}: {self.order_count}"
+
+
+class DailyProductSales(models.Model):
+    """Ventes payées d'un produit pour une journée de création des commandes"""
+
+    day = models.DateField(verbose_name="Jour")
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="+", verbose_name="Produit"
+    )
+    quantity = models.IntegerField(default=0, verbose_name="Quantité")
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Revenu"
+    )
+    order_count = models.IntegerField(default=0, verbose_name="Commandes")
+
+    class Meta:
+        ordering = ["-day"]
+        unique_together = ("day", "product")
+        verbose_name = "Ventes du jour par produit"
+        verbose_name_plural = "Ventes du jour par produit"
+
+    def __str__(self):
+        return f"{self.day} - {self.product_id}: {self.quantity}"
+
+
+class DailyCategorySales(models.Model):
+    """Ventes payées d'une catégorie pour une journée de création des commandes"""
+
+    day = models.DateField(verbose_name="Jour")
+    category = models.ForeignKey(
+        "products.Category",
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Catégorie",
+    )
+    quantity = models.IntegerField(default=0, verbose_name="Quantité")
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Revenu"
+    )
+
+    class Meta:
+        ordering = ["-day"]
+        unique_together = ("day", "category")
+        verbose_name = "Ventes du jour par catégorie"
+        verbose_name_plural = "Ventes du jour par catégorie"
+
+    def __str__(self):
+        return f"{self.day} - {self.category_id}: {self.quantity}"
+
+
+class ReportExportJob(models.Model):
+    """Export CSV ou XLSX des rapports, généré par la commande run_export_worker"""
+
+    KIND_CHOICES = [
+        ("orders", "Commandes"),
+        ("daily_revenue", "Revenu par jour"),
+        ("top_customers", "Meilleurs clients"),
+        ("category_performance", "Performance par catégorie"),
+    ]
+
+    FORMAT_CHOICES = [
+        ("csv", "CSV"),
+        ("xlsx", "Excel (XLSX)"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "En attente"),
+        ("running", "En cours"),
+        ("done", "Terminé"),
+        ("failed", "En échec"),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name="Rapport")
+    file_format = models.CharField(
+        max_length=4, choices=FORMAT_CHOICES, default="csv", verbose_name="Format"
+    )
+    date_from = models.DateField(verbose_name="Du")
+    date_to = models.DateField(verbose_name="Au")
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="report_exports",
+        verbose_name="Demandé par",
+    )
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="pending", verbose_name="Statut"
+    )
+    rows_written = models.PositiveIntegerField(default=0, verbose_name="Lignes écrites")
+    file = models.FileField(
+        upload_to="report_exports/", blank=True, verbose_name="Fichier"
+    )
+    error = models.TextField(blank=True, verbose_name="Erreur")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Mis à jour le"
+    )
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Démarré le")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Terminé le")
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+        verbose_name = "Export de rapport"
+        verbose_name_plural = "Exports de rapports"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.date_from} - {self.date_to}"
+
+
+class CustomerStats(models.Model):
+    """Chiffres d'achat d'un client, recalculés à chaque changement de ses commandes.
+
+    Les montants ne comptent que les commandes payées. Les scores RFM
+    (1 à 5, quintiles parmi les clients ayant payé) sont attribués par la
+    commande refresh_customer_stats ; 0 signifie pas encore noté.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="customer_stats",
+        verbose_name="Client",
+    )
+    order_count = models.PositiveIntegerField(default=0, verbose_name="Commandes")
+    paid_order_count = models.PositiveIntegerField(
+        default=0, verbose_name="Commandes payées"
+    )
+    total_spent = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        verbose_name="Total dépensé",
+    )
+    average_order_value = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, verbose_name="Panier moyen"
+    )
+    first_order_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Première commande payée"
+    )
+    last_order_at = models.DateTimeField(
+        null=True, blank=True, db_index=True, verbose_name="Dernière commande payée"
+    )
+
+    recency_score = models.PositiveSmallIntegerField(default=0, verbose_name="Récence")
+    frequency_score = models.PositiveSmallIntegerField(
+        default=0, verbose_name="Fréquence"
+    )
+    monetary_score = models.PositiveSmallIntegerField(default=0, verbose_name="Montant")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-total_spent"]
+        verbose_name = "Statistiques client"
+        verbose_name_plural = "Statistiques clients"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.total_spent}"
+
+    @property
+    def rfm_score(self):
+        if not self.recency_score:
+            return ""
+        return f"{self.recency_score}{self.frequency_score}{self.monetary_score}"
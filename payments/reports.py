@@ -0,0 +1,374 @@
+"""Sections of the admin reports page, run concurrently and cached.
+
+A section is a function registered with ``@section(name, label)``. It takes the
+start of the period and returns the template variables it owns, already
+evaluated, so that they can be cached. ``build_report`` runs the sections
+that are not cached on a small thread pool, where each worker thread uses
+its own database connection. The page then takes as long as its slowest
+section instead of the sum of all of them. On SQLite, or inside a
+transaction that worker threads could not see, sections run one after the
+other.
+
+Each section result is cached per period for ``REPORT_CACHE_TIMEOUT``
+seconds (300 by default), or for the setting it was registered with, read
+each time a result is stored. Only the periods of ``PERIODS`` are offered.
+Sections registered with ``by_period=False`` have one cache entry for all
+periods. Such sections can be computed ahead of the page with
+``refresh_section``, so that no request has to wait for them.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from pages.models import ContactMessage
+from products.models import Product, ProductReview
+
+from .cohorts import build_cohorts
+from .models import Complaint, Order, PaymentProof, Refund
+from .services import CustomerStatsService, ReportService
+
+logger = logging.getLogger(__name__)
+
+# Periods offered on the page, in days; any other value would add cache entries
+PERIODS = (7, 30, 90, 180, 365)
+DEFAULT_PERIOD = 30
+
+_sections = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def section(
+    name,
+    label,
+    by_period=True,
+    timeout_setting="REPORT_CACHE_TIMEOUT",
+    default_timeout=300,
+):
+    """Register a report section; sections are listed in registration order"""
+
+    def register(compute):
+        _sections[name] = (label, compute, by_period, timeout_setting, default_timeout)
+        return compute
+
+    return register
+
+
+def parse_period(value):
+    """Days of the requested period, ``DEFAULT_PERIOD`` unless one of ``PERIODS``"""
+    try:
+        period = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PERIOD
+    return period if period in PERIODS else DEFAULT_PERIOD
+
+
+def refresh_section(name):
+    """Compute a section that does not depend on the period and cache it.
+
+    Returns its timing, as listed in ``report_timings``.
+    """
+    if _sections[name][2]:
+        raise ValueError(f"Report section {name} depends on the period")
+    data, timing = _run(name, None)
+    cache.set(f"reports:{name}", data, cache_timeout(name))
+    return timing
+
+
+def cache_timeout(name):
+    """Seconds a section result stays cached, from the current settings"""
+    _, _, _, timeout_setting, default_timeout = _sections[name]
+    return getattr(settings, timeout_setting, default_timeout)
+
+
+def build_report(period_days, refresh=False):
+    """Template context for the reports page over the last ``period_days`` days.
+
+    ``report_timings`` lists, for each section, its wall time in seconds,
+    its number of queries and whether it came from the cache. With
+    ``refresh`` every section is recomputed.
+    """
+    started = time.perf_counter()
+    end_date = timezone.now()
+    start_date = end_date - timedelta(days=period_days)
+
+    keys = {
+        name: f"reports:{name}:{period_days}" if by_period else f"reports:{name}"
+        for name, (_, _, by_period, _, _) in _sections.items()
+    }
+    cached = {} if refresh else cache.get_many(list(keys.values()))
+    results, timings = {}, {}
+    for name, key in keys.items():
+        if key in cached:
+            results[name] = cached[key]
+            timings[name] = {
+                "name": name,
+                "label": _sections[name][0],
+                "seconds": 0,
+                "queries": 0,
+                "cached": True,
+            }
+
+    missing = [name for name in _sections if name not in results]
+    if len(missing) > 1 and run_in_parallel():
+        futures = {
+            name: get_executor().submit(_run_in_worker, name, start_date)
+            for name in missing
+        }
+        computed = {name: future.result() for name, future in futures.items()}
+    else:
+        computed = {name: _run(name, start_date) for name in missing}
+    for name, (data, timing) in computed.items():
+        results[name] = data
+        timings[name] = timing
+    for name in computed:
+        cache.set(keys[name], results[name], cache_timeout(name))
+
+    context = {"period": period_days, "start_date": start_date, "end_date": end_date}
+    for name in _sections:
+        context.update(results[name])
+    context["report_timings"] = [timings[name] for name in _sections]
+    context["report_seconds"] = time.perf_counter() - started
+    return context
+
+
+def run_in_parallel():
+    """Whether sections can run on worker threads with their own connections"""
+    return (
+        getattr(settings, "REPORT_PARALLEL", True)
+        and connection.vendor != "sqlite"
+        and not connection.in_atomic_block
+    )
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "REPORT_WORKERS", len(_sections)),
+                thread_name_prefix="report-section",
+            )
+        return _executor
+
+
+def _run_in_worker(name, start_date):
+    # Worker threads own their connections, like request threads do
+    close_old_connections()
+    try:
+        return _run(name, start_date)
+    finally:
+        close_old_connections()
+
+
+def _run(name, start_date):
+    """Compute one section; returns ``(data, timing)``"""
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        label, compute, *_ = _sections[name]
+        data = compute(start_date)
+        seconds = time.perf_counter() - started
+    logger.debug("Report section %s: %.3fs, %d queries", name, seconds, queries)
+    return data, {
+        "name": name,
+        "label": label,
+        "seconds": seconds,
+        "queries": queries,
+        "cached": False,
+    }
+
+
+@section("financial", "Financier")
+def financial(start_date):
+    # Sales figures come from the daily rollups, whatever the order volume
+    sales = ReportService.get_sales_summary(timezone.localdate(start_date))
+
+    payment_methods = list(
+        PaymentProof.objects.filter(uploaded_at__gte=start_date)
+        .values("payment_method")
+        .annotate(count=Count("id"), total_amount=Sum("invoice__total_amount"))
+        .order_by("-count")
+    )
+
+    refunds = Refund.objects.aggregate(
+        total_refunded=Sum(
+            "amount", filter=Q(created_at__gte=start_date, status="refund_completed")
+        ),
+        pending_refunds=Count("id", filter=Q(status="refund_pending")),
+        completed_refunds=Count("id", filter=Q(status="refund_completed")),
+    )
+    total_refunded = refunds["total_refunded"] or 0
+    net_revenue = sales["total_revenue"] - total_refunded
+
+    payment_stats = PaymentProof.objects.aggregate(
+        pending_verifications=Count("id", filter=Q(verified=False)),
+        verified_payments=Count("id", filter=Q(verified=True)),
+        rejected_payments=Count("id", filter=~Q(rejection_reason="")),
+    )
+
+    return {
+        "order_stats": {
+            "total_orders": sales["total_orders"],
+            "total_revenue": sales["total_revenue"],
+            "net_revenue": net_revenue,
+            "average_order_value": sales["average_order_value"],
+            "by_status": sales["by_status"],
+        },
+        "revenue_by_status": sales["revenue_by_status"],
+        "payment_methods": payment_methods,
+        "daily_revenue": sales["daily_revenue"],
+        "total_revenue": sales["total_revenue"],
+        "total_refunded": total_refunded,
+        "net_revenue": net_revenue,
+        "avg_order_value": sales["average_order_value"],
+        "avg_items_per_order": sales["avg_items_per_order"],
+        "payment_stats": payment_stats,
+        "refund_stats": {
+            "pending_refunds": refunds["pending_refunds"],
+            "completed_refunds": refunds["completed_refunds"],
+            "total_refunded": total_refunded,
+        },
+    }
+
+
+@section("products", "Produits")
+def products(start_date):
+    sales = ReportService.get_product_sales(timezone.localdate(start_date))
+    return {
+        "top_products": sales["top_products"],
+        "category_performance": sales["category_performance"],
+        "specialty_performance": sales["specialty_performance"],
+        "low_stock_products": list(
+            Product.objects.filter(
+                stock_quantity__lte=10, availability_status="in_stock"
+            ).order_by("stock_quantity")[:10]
+        ),
+        "out_of_stock_count": Product.objects.filter(
+            Q(stock_quantity=0) | Q(availability_status="out_of_stock")
+        ).count(),
+    }
+
+
+@section("customers", "Clients")
+def customers(start_date):
+    user_types = dict(UserProfile.USER_TYPES)
+    return {
+        "user_registrations": list(
+            User.objects.filter(date_joined__gte=start_date)
+            .annotate(day=TruncDate("date_joined"))
+            .values("day")
+            .annotate(count=Count("id"))
+            .order_by("day")
+        ),
+        "user_types": list(
+            UserProfile.objects.values("user_type")
+            .annotate(count=Count("id"))
+            .order_by("-count")
+        ),
+        # Users who placed an order in the period
+        "active_users": Order.objects.filter(created_at__gte=start_date)
+        .values("user")
+        .distinct()
+        .count(),
+        # Customer lifetime value, from the per-customer stats table
+        "top_customers": CustomerStatsService.get_top_customers(),
+        "customer_segments": [
+            {**segment, "label": user_types.get(segment["user_type"], "-")}
+            for segment in CustomerStatsService.get_segments()
+        ],
+        "total_users": User.objects.count(),
+    }
+
+
+@section("reviews", "Avis")
+def reviews(start_date):
+    in_period = ProductReview.objects.filter(created_at__gte=start_date)
+    return {
+        "ratings_by_category": ReportService.get_ratings_by_category(start_date),
+        "review_trend": list(
+            in_period.annotate(day=TruncDate("created_at"))
+            .values("day")
+            .annotate(count=Count("id"), avg_rating=Avg("rating"))
+            .order_by("day")
+        ),
+        "rating_distribution": list(
+            in_period.values("rating").annotate(count=Count("id")).order_by("rating")
+        ),
+    }
+
+
+@section("support", "Support")
+def support(start_date):
+    contact_by_type = list(
+        ContactMessage.objects.filter(created_at__gte=start_date)
+        .values("inquiry_type")
+        .annotate(count=Count("id"), responded=Count("id", filter=Q(responded=True)))
+        .order_by("-count")
+    )
+
+    in_period = Q(created_at__gte=start_date)
+    complaints = Complaint.objects.aggregate(
+        total=Count("id", filter=in_period),
+        resolved=Count("id", filter=in_period & Q(status="resolved")),
+        open=Count("id", filter=Q(status="open")),
+        in_review=Count("id", filter=Q(status="in_review")),
+    )
+    resolution_rate = (
+        complaints["resolved"] / complaints["total"] * 100 if complaints["total"] else 0
+    )
+
+    resolution = ReportService.get_resolution_stats(start_date)
+
+    return {
+        "contact_by_type": contact_by_type,
+        "complaint_stats": {
+            "open_complaints": complaints["open"],
+            "in_review": complaints["in_review"],
+            "resolved_complaints": complaints["resolved"],
+            "resolution_rate": resolution_rate,
+            "avg_resolution_time": resolution["mean_hours"],
+            "median_resolution_time": resolution["median_hours"],
+            "p90_resolution_time": resolution["p90_hours"],
+            "resolution_by_reason": resolution["by_reason"],
+            "resolution_by_handler": resolution["by_handler"],
+            "by_reason": list(
+                Complaint.objects.filter(created_at__gte=start_date)
+                .values("reason__name")
+                .annotate(count=Count("id"))
+                .order_by("-count")
+            ),
+        },
+    }
+
+
+@section(
+    "cohorts",
+    "Cohortes",
+    by_period=False,
+    timeout_setting="COHORT_REPORT_CACHE_TIMEOUT",
+    default_timeout=6 * 3600,
+)
+def cohorts(start_date):
+    # Always the last twelve registration months, whatever the period. Kept
+    # for hours and refreshed ahead of expiry by refresh_cohort_report
+    report = build_cohorts(12)
+    return {"cohort_report": report, "cohort_curves": report["curves"]}
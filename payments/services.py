@@ -1,76 +1,608 @@
-from django.utils import timezone
+import csv
+import io
+import posixpath
+import re
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from html import unescape
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Aggregate,
+    Avg,
+    Count,
+    DecimalField,
+    DurationField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Func,
+    Max,
+    Min,
+    OuterRef,
+    Prefetch,
+    Q,
+    Sum,
+    Window,
+)
+from django.db.models.functions import Greatest, Ntile, RowNumber, TruncDate
+from django.template import Context, TemplateDoesNotExist
+from django.template.loader import select_template
+from django.utils import timezone, translation
+from django.utils.html import strip_tags
 from decimal import Decimal
+import numpy as np
 from pages.models import SiteInformation
+from .events import broker, notification_event
+from products.models import Product, ProductReview, ProductVariant
 from .models import (
+    Cart,
+    CartItem,
+    CheckoutSubmission,
+    Complaint,
+    CustomerStats,
+    DailyCategorySales,
+    DailyProductSales,
+    DailySalesByStatus,
     Order,
     OrderItem,
+    OrderNote,
+    OrderNoteAttachment,
+    OutgoingEmail,
     PaymentProof,
     Notification,
+    NotificationArchive,
+    NotificationCounter,
+    NotificationPreference,
     Refund,
 )
 
 
+class InsufficientStock(Exception):
+    """Raised when cart lines ask for more than the stock available.
+
+    ``shortfalls`` holds one dict per offending cart line with the
+    ``cart_item_id``, ``product``, ``variant``, ``requested`` and
+    ``available`` quantities.
+    """
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(
+            f"Stock insuffisant pour {len(shortfalls)} article(s) du panier"
+        )
+
+
 class OrderService:
     """Service for order creation and management"""
 
+    @staticmethod
+    def lock_cart_lines(cart):
+        """Load the cart lines with their product and variant rows locked.
+
+        Returns ``(lines, shortfalls)``. Products are locked together with the
+        cart lines in one query; variants need a second one, since a row on
+        the nullable side of an outer join cannot be locked. Quantities are
+        then checked in memory against the locked stock.
+        """
+        lines = list(
+            cart.items.select_related("product")
+            .select_for_update(of=("self", "product"))
+            .order_by("product_id")
+        )
+
+        variant_ids = [line.variant_id for line in lines if line.variant_id]
+        variants = {}
+        if variant_ids:
+            variants = ProductVariant.objects.select_for_update().in_bulk(
+                sorted(variant_ids)
+            )
+
+        requested = {}
+        for line in lines:
+            if line.variant_id:
+                line.variant = variants[line.variant_id]
+                key = ("variant", line.variant_id)
+            else:
+                key = ("product", line.product_id)
+            requested[key] = requested.get(key, 0) + line.quantity
+
+        shortfalls = []
+        for line in lines:
+            if line.variant_id:
+                key = ("variant", line.variant_id)
+                available = line.variant.stock_quantity
+            else:
+                key = ("product", line.product_id)
+                available = line.product.stock_quantity
+            if requested[key] > available:
+                shortfalls.append(
+                    {
+                        "cart_item_id": line.id,
+                        "product": line.product,
+                        "variant": line.variant,
+                        "requested": line.quantity,
+                        "available": max(available, 0),
+                    }
+                )
+
+        return lines, shortfalls
+
     @staticmethod
     def create_order_from_cart(user, cart, shipping_data, tva_rate=None):
-        """Create order from cart items"""
+        """Create order from cart items.
+
+        Stock for every line is locked and validated up front; raises
+        ``InsufficientStock`` without writing anything if a line cannot be
+        fulfilled.
+        """
         # Get TVA rate from site settings if not provided
         if tva_rate is None:
-            site_info = SiteInformation.get_instance()
-            tva_rate = site_info.tva_rate
+            tva_rate = SiteInformation.get_tva_rate()
 
         # Get shipping type
         shipping_type = shipping_data.get("shipping_type")
         shipping_cost = shipping_type.cost if shipping_type else Decimal("500.00")
 
-        # Calculate totals
-        subtotal = cart.get_total_price()
-        tax_amount = subtotal * tva_rate
-        total = subtotal + tax_amount + shipping_cost
+        with transaction.atomic():
+            lines, shortfalls = OrderService.lock_cart_lines(cart)
+            if shortfalls:
+                raise InsufficientStock(shortfalls)
 
-        # Create order
-        order = Order.objects.create(
-            user=user,
-            status="pending_confirmation",
-            shipping_type=shipping_type,
-            shipping_address=shipping_data["shipping_address"],
-            shipping_city=shipping_data["shipping_city"],
-            shipping_state=shipping_data["shipping_state"],
-            shipping_zip=shipping_data["shipping_zip"],
-            shipping_country="Algeria",
-            subtotal=subtotal,
-            tax_amount=tax_amount,
-            shipping_cost=shipping_cost,
-            total_amount=total,
-        )
-
-        # Create order items with variant info
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                variant=cart_item.variant,  # Save variant
-                quantity=cart_item.quantity,
-                price=cart_item.get_unit_price(),  # Use actual cart price
+            # Calculate totals from the locked rows
+            subtotal = sum((line.get_total_price() for line in lines), Decimal("0"))
+            tax_amount = subtotal * tva_rate
+            total = subtotal + tax_amount + shipping_cost
+
+            # Create order
+            order = Order.objects.create(
+                user=user,
+                status="pending_confirmation",
+                shipping_type=shipping_type,
+                shipping_address=shipping_data["shipping_address"],
+                shipping_city=shipping_data["shipping_city"],
+                shipping_state=shipping_data["shipping_state"],
+                shipping_zip=shipping_data["shipping_zip"],
+                shipping_country="Algeria",
+                subtotal=subtotal,
+                tax_amount=tax_amount,
+                shipping_cost=shipping_cost,
+                total_amount=total,
+            )
+
+            # Create order items with variant info
+            items = OrderItem.objects.bulk_create(
+                [
+                    OrderItem(
+                        order=order,
+                        product=line.product,
+                        variant=line.variant,
+                        quantity=line.quantity,
+                        price=line.get_unit_price(),
+                    )
+                    for line in lines
+                ]
+            )
+            SalesRollupService.record_lines(
+                order, [item.rollup_state() for item in items]
             )
 
             # Reduce stock
-            if cart_item.variant:
-                cart_item.variant.stock_quantity -= cart_item.quantity
-                cart_item.variant.save()
-            else:
-                product = cart_item.product
-                product.stock_quantity -= cart_item.quantity
-                product.save()
+            variants, products = {}, {}
+            for line in lines:
+                if line.variant:
+                    line.variant.stock_quantity -= line.quantity
+                    variants[line.variant.id] = line.variant
+                else:
+                    line.product.stock_quantity -= line.quantity
+                    products[line.product.id] = line.product
+            if variants:
+                ProductVariant.objects.bulk_update(
+                    variants.values(), ["stock_quantity"]
+                )
+            if products:
+                Product.objects.bulk_update(products.values(), ["stock_quantity"])
 
-        # Clear cart
-        cart.items.all().delete()
+            # Clear cart
+            cart.items.all().delete()
 
         return order
 
 
+class CartService:
+    """Service for cart mutations"""
+
+    # Upper bound on the number of operations accepted in one batch
+    MAX_OPERATIONS = 500
+
+    @staticmethod
+    def apply_operations(user, operations):
+        """Apply a batch of cart line operations with a bounded number of queries.
+
+        Each operation is a dict with either ``cart_item_id``, ``product_id``
+        or ``sku`` (plus an optional ``variant_id``, or ``variant`` matched
+        against the variant value), a ``quantity`` and an optional ``mode``
+        (``"set"`` by default, or ``"add"`` to increment the line).
+        A quantity of 0 or less in ``"set"`` mode removes the line. When a
+        product has variants and none is given, the cheapest active variant
+        in stock is selected, as on the product page.
+
+        Stock is validated for every operation before anything is written.
+        Valid operations are then applied with one ``bulk_update``, one
+        ``bulk_create`` and one delete. Returns a dict with per-operation
+        ``results`` and the new cart totals.
+        """
+        cart, _ = Cart.objects.get_or_create(user=user)
+        lines = list(cart.items.select_related("product", "variant"))
+        lines_by_id = {line.id: line for line in lines}
+        lines_by_key = {(line.product_id, line.variant_id): line for line in lines}
+
+        parsed = []
+        product_ids = set()
+        skus = set()
+        for index, operation in enumerate(operations):
+            try:
+                try:
+                    quantity = int(operation.get("quantity", 1))
+                except (TypeError, ValueError):
+                    raise ValueError("Quantité invalide")
+                mode = operation.get("mode", "set")
+                if mode not in ("set", "add"):
+                    raise ValueError(f"Mode inconnu : {mode}")
+                if mode == "add" and quantity < 1:
+                    raise ValueError("La quantité doit être au moins 1")
+                cart_item_id = operation.get("cart_item_id")
+                product_id = operation.get("product_id")
+                sku = str(operation.get("sku") or "").strip()
+                variant_id = operation.get("variant_id") or None
+                variant_value = str(operation.get("variant") or "").strip()
+                if cart_item_id is not None:
+                    cart_item_id = int(cart_item_id)
+                elif product_id is not None:
+                    product_id = int(product_id)
+                    variant_id = int(variant_id) if variant_id else None
+                    product_ids.add(product_id)
+                elif sku:
+                    variant_id = int(variant_id) if variant_id else None
+                    skus.add(sku)
+                else:
+                    raise ValueError("cart_item_id, product_id ou sku est requis")
+            except (AttributeError, TypeError, ValueError) as e:
+                parsed.append((index, None, str(e)))
+                continue
+            parsed.append(
+                (
+                    index,
+                    {
+                        "cart_item_id": cart_item_id,
+                        "product_id": product_id,
+                        "sku": sku,
+                        "variant_id": variant_id,
+                        "variant_value": variant_value,
+                        "quantity": quantity,
+                        "mode": mode,
+                    },
+                    None,
+                )
+            )
+
+        # Products (and their variants) referenced by id or SKU, in one round
+        # trip each
+        products, products_by_sku = {}, {}
+        if product_ids or skus:
+            queryset = Product.objects.filter(
+                Q(id__in=product_ids) | Q(sku__in=skus)
+            ).prefetch_related(
+                Prefetch(
+                    "variants",
+                    queryset=ProductVariant.objects.all(),
+                    to_attr="all_variants",
+                )
+            )
+            for product in queryset:
+                products[product.id] = product
+                products_by_sku[product.sku] = product
+
+        # Desired quantity per line, starting from the current cart contents
+        desired = {key: line.quantity for key, line in lines_by_key.items()}
+        targets = {}
+        results = []
+        for index, operation, error in parsed:
+            result = {"index": index, "success": False}
+            results.append(result)
+            if error:
+                result["message"] = error
+                continue
+
+            auto_selected = False
+            if operation["cart_item_id"] is not None:
+                line = lines_by_id.get(operation["cart_item_id"])
+                if line is None:
+                    result["message"] = "Cart item not found"
+                    continue
+                product, variant = line.product, line.variant
+            else:
+                if operation["product_id"] is not None:
+                    product = products.get(operation["product_id"])
+                else:
+                    product = products_by_sku.get(operation["sku"])
+                if product is None:
+                    result["message"] = "Produit non trouvé"
+                    continue
+                if operation["variant_id"] or operation["variant_value"]:
+                    wanted = operation["variant_value"].casefold()
+                    variant = next(
+                        (
+                            v
+                            for v in product.all_variants
+                            if v.id == operation["variant_id"]
+                            or (wanted and v.variant_value.casefold() == wanted)
+                        ),
+                        None,
+                    )
+                    if variant is None:
+                        result["message"] = "Variante non trouvée"
+                        continue
+                    if not variant.is_active:
+                        result["message"] = "Variante non disponible"
+                        continue
+                else:
+                    # Auto-select cheapest variant if no variant specified
+                    available = [
+                        v
+                        for v in product.all_variants
+                        if v.is_active and v.stock_quantity > 0
+                    ]
+                    variant = (
+                        min(available, key=lambda v: v.get_total_price())
+                        if available
+                        else None
+                    )
+                    auto_selected = variant is not None
+
+            key = (product.id, variant.id if variant else None)
+            current = desired.get(key, 0)
+            quantity = operation["quantity"]
+            new_quantity = (
+                current + quantity if operation["mode"] == "add" else quantity
+            )
+            stock = variant.stock_quantity if variant else product.stock_quantity
+
+            if new_quantity > stock:
+                if current and operation["mode"] == "add":
+                    result["message"] = (
+                        f"Impossible d'ajouter {quantity}. Stock maximum: {stock}"
+                    )
+                else:
+                    result["message"] = (
+                        f"Stock insuffisant. Seulement {stock} disponible(s)"
+                    )
+                continue
+
+            desired[key] = max(new_quantity, 0)
+            targets[key] = (product, variant)
+            result.update(
+                {
+                    "success": True,
+                    "product_id": product.id,
+                    "variant_id": variant.id if variant else None,
+                    "quantity": desired[key],
+                    "auto_selected_variant": (
+                        variant.variant_value if auto_selected else None
+                    ),
+                }
+            )
+
+        to_update, to_create, to_delete = [], [], []
+        for key, quantity in desired.items():
+            line = lines_by_key.get(key)
+            if line is not None:
+                if quantity <= 0:
+                    to_delete.append(line.id)
+                elif quantity != line.quantity:
+                    line.quantity = quantity
+                    to_update.append(line)
+            elif quantity > 0:
+                product, variant = targets[key]
+                line = CartItem(
+                    cart=cart, product=product, variant=variant, quantity=quantity
+                )
+                lines_by_key[key] = line
+                to_create.append(line)
+
+        with transaction.atomic():
+            if to_update:
+                CartItem.objects.bulk_update(to_update, ["quantity"])
+            if to_create:
+                CartItem.objects.bulk_create(to_create)
+            if to_delete:
+                CartItem.objects.filter(cart=cart, id__in=to_delete).delete()
+
+        # Totals come from the in-memory lines; no further query is needed
+        remaining = [line for line in lines_by_key.values() if line.id not in to_delete]
+        for result in results:
+            if result["success"]:
+                key = (result.pop("product_id"), result.pop("variant_id"))
+                line = lines_by_key.get(key)
+                kept = line is not None and line.id not in to_delete
+                result["cart_item_id"] = line.id if kept else None
+                result["item_total"] = line.get_total_price() if kept else Decimal("0")
+
+        return {
+            "cart": cart,
+            "results": results,
+            "cart_count": sum(line.quantity for line in remaining),
+            "cart_total": sum(
+                (line.get_total_price() for line in remaining), Decimal("0")
+            ),
+        }
+
+    # Upper bound on the number of lines accepted in one CSV upload
+    MAX_IMPORT_LINES = 1000
+
+    # Accepted header names for each CSV column
+    IMPORT_COLUMNS = {
+        "sku": ("sku", "reference", "référence"),
+        "variant": ("variant", "variante"),
+        "quantity": ("quantity", "quantité", "quantite", "qty"),
+    }
+
+    @staticmethod
+    def reorder(user, order):
+        """Add every line of a previous order to the user's cart"""
+        operations = [
+            {
+                "product_id": product_id,
+                "variant_id": variant_id,
+                "quantity": quantity,
+                "mode": "add",
+            }
+            for product_id, variant_id, quantity in order.items.values_list(
+                "product_id", "variant_id", "quantity"
+            )
+        ]
+        return CartService.apply_operations(user, operations)
+
+    @staticmethod
+    def parse_import_file(uploaded_file):
+        """Read a CSV upload into ``(line_number, operation)`` pairs.
+
+        The file needs a header row with at least a ``sku`` column; ``variant``
+        and ``quantity`` (default 1) are optional. Comma, semicolon and tab
+        delimiters are accepted. Raises ``ValueError`` on unreadable files.
+        """
+        try:
+            content = uploaded_file.read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise ValueError("Le fichier doit être encodé en UTF-8")
+
+        try:
+            dialect = csv.Sniffer().sniff(content[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(io.StringIO(content), dialect)
+
+        header = next(reader, None)
+        if not header:
+            raise ValueError("Le fichier est vide")
+        header = [name.strip().casefold() for name in header]
+        columns = {}
+        for column, aliases in CartService.IMPORT_COLUMNS.items():
+            for position, name in enumerate(header):
+                if name in aliases:
+                    columns[column] = position
+                    break
+        if "sku" not in columns:
+            raise ValueError("Colonne « sku » introuvable dans l'en-tête")
+
+        def cell(row, column):
+            position = columns.get(column)
+            if position is None or position >= len(row):
+                return ""
+            return row[position].strip()
+
+        rows = []
+        for row in reader:
+            if not any(value.strip() for value in row):
+                continue
+            if len(rows) >= CartService.MAX_IMPORT_LINES:
+                raise ValueError(
+                    f"Maximum {CartService.MAX_IMPORT_LINES} lignes par fichier"
+                )
+            rows.append(
+                (
+                    reader.line_num,
+                    {
+                        "sku": cell(row, "sku"),
+                        "variant": cell(row, "variant"),
+                        "quantity": cell(row, "quantity") or 1,
+                        "mode": "add",
+                    },
+                )
+            )
+        return rows
+
+    @staticmethod
+    def import_csv(user, uploaded_file):
+        """Add the lines of a CSV upload to the cart and report on each line"""
+        rows = CartService.parse_import_file(uploaded_file)
+        outcome = CartService.apply_operations(
+            user, [operation for _, operation in rows]
+        )
+
+        report = []
+        for (line_number, operation), result in zip(rows, outcome["results"]):
+            report.append(
+                {
+                    "line": line_number,
+                    "sku": operation["sku"],
+                    "variant": operation["variant"]
+                    or result.get("auto_selected_variant")
+                    or "",
+                    "quantity": operation["quantity"],
+                    "success": result["success"],
+                    "message": result.get("message", ""),
+                }
+            )
+        outcome["report"] = report
+        return outcome
+
+
+class CheckoutService:
+    """Service for idempotent checkout submissions"""
+
+    @staticmethod
+    def place_order(user, cart, key, shipping_data, note_content="", files=()):
+        """Create the order for a checkout key exactly once.
+
+        Returns ``(order, created)``. Replays of a key that already produced an
+        order return that order with ``created=False``; ``order`` is ``None``
+        when the cart is empty and no order exists for the key.
+        """
+        with transaction.atomic():
+            # The row lock makes concurrent duplicates wait for the first one
+            submission, _ = (
+                CheckoutSubmission.objects.select_for_update()
+                .select_related("order")
+                .get_or_create(key=key, defaults={"user": user})
+            )
+            if submission.user_id != user.id:
+                raise PermissionDenied("Checkout key belongs to another user")
+
+            if submission.order_id:
+                return submission.order, False
+
+            if not cart.items.exists():
+                return None, False
+
+            order = OrderService.create_order_from_cart(
+                user=user, cart=cart, shipping_data=shipping_data
+            )
+
+            if note_content:
+                order_note = OrderNote.objects.create(
+                    order=order, content=note_content, created_by=user
+                )
+                for file in files:
+                    OrderNoteAttachment.objects.create(
+                        order_note=order_note,
+                        file=file,
+                        file_name=file.name,
+                        file_type=file.content_type,
+                    )
+
+            submission.order = order
+            submission.save(update_fields=["order"])
+
+        return order, True
+
+
 class PaymentService:
     """Service for payment processing"""
 
@@ -115,6 +647,8 @@ class RefundService:
 class NotificationService:
     """Service for creating notifications"""
 
+    STAFF_RECIPIENTS_CACHE_KEY = "notifications:staff_recipients"
+
     @staticmethod
     def create_notification(user, notification_type, title, message, **related_objects):
         """Create a notification for user"""
@@ -123,25 +657,1622 @@ class NotificationService:
             notification_type=notification_type,
             title=title,
             message=message,
-            **related_objects
+            **related_objects,
+        )
+
+    @staticmethod
+    def get_staff_recipients():
+        """Return ``(user_id, email)`` pairs for active staff, cached"""
+        recipients = cache.get(NotificationService.STAFF_RECIPIENTS_CACHE_KEY)
+        if recipients is None:
+            recipients = list(
+                User.objects.filter(is_staff=True, is_active=True)
+                .order_by("id")
+                .values_list("id", "email")
+            )
+            cache.set(
+                NotificationService.STAFF_RECIPIENTS_CACHE_KEY,
+                recipients,
+                getattr(settings, "STAFF_RECIPIENTS_CACHE_TIMEOUT", 300),
+            )
+        return recipients
+
+    @staticmethod
+    def invalidate_staff_recipients():
+        """Drop the cached staff list after a user was changed"""
+        cache.delete(NotificationService.STAFF_RECIPIENTS_CACHE_KEY)
+
+    @staticmethod
+    def notify_staff(notification_type, title, message, email=True, **related_objects):
+        """Notify every active staff user of an event.
+
+        All notifications are inserted with one ``bulk_create`` and the emails
+        are queued with another, one outbox row per recipient, so the cost of
+        an event no longer grows in queries with the number of staff users.
+        """
+        recipients = NotificationService.get_staff_recipients()
+        if not recipients:
+            return []
+
+        # Recipients who chose a digest for this type get no email right away
+        digest_users = set()
+        if email:
+            digest_users = set(
+                NotificationPreference.objects.filter(
+                    notification_type=notification_type,
+                    user_id__in=[user_id for user_id, _ in recipients],
+                )
+                .exclude(delivery="instant")
+                .values_list("user_id", flat=True)
+            )
+
+        notifications = Notification.objects.bulk_create(
+            [
+                Notification(
+                    user_id=user_id,
+                    notification_type=notification_type,
+                    title=title,
+                    message=message,
+                    digest_pending=user_id in digest_users,
+                    **related_objects,
+                )
+                for user_id, _ in recipients
+            ]
         )
+        # bulk_create sends no post_save, so counters and live streams are
+        # updated here
+        NotificationService.adjust_unread([user_id for user_id, _ in recipients], 1)
+        NotificationService.publish(notifications)
+        if email:
+            html_body, body = EmailTemplateService.render(
+                "emails/notification.html", {"title": title, "message": message}
+            )
+            MailService.enqueue_many(
+                subject=title,
+                body=body,
+                html_body=html_body,
+                recipients=[
+                    address
+                    for user_id, address in recipients
+                    if user_id not in digest_users
+                ],
+            )
+        return notifications
+
+    @staticmethod
+    def publish(notifications):
+        """Push notifications to the users' open streams after commit"""
+        events = [
+            (notification.user_id, notification_event(notification))
+            for notification in notifications
+            if notification.pk
+        ]
+
+        def send():
+            for user_id, event in events:
+                broker.publish(user_id, event)
+
+        if events:
+            transaction.on_commit(send)
+
+    @staticmethod
+    def adjust_unread(user_ids, delta):
+        """Add ``delta`` to the unread counters of several users in one UPDATE.
+
+        Missing counters are created from a recount when notifications are
+        added; decrements never go below zero. The navbar cache of each user
+        is invalidated once the transaction commits.
+        """
+        user_ids = set(user_ids)
+        if not user_ids or not delta:
+            return
+        updated = NotificationCounter.objects.filter(user_id__in=user_ids).update(
+            unread_count=Greatest(F("unread_count") + delta, 0)
+        )
+        if delta > 0 and updated < len(user_ids):
+            existing = NotificationCounter.objects.filter(
+                user_id__in=user_ids
+            ).values_list("user_id", flat=True)
+            NotificationService.recount_unread(user_ids - set(existing))
+        NotificationService.invalidate_navbar(user_ids)
+
+    @staticmethod
+    def recount_unread(user_ids=None):
+        """Rebuild unread counters from the notifications table"""
+        notifications = Notification.objects.filter(is_read=False)
+        if user_ids is not None:
+            user_ids = set(user_ids)
+            notifications = notifications.filter(user_id__in=user_ids)
+        counts = dict(
+            notifications.values("user_id")
+            .annotate(count=Count("id"))
+            .values_list("user_id", "count")
+        )
+        if user_ids is None:
+            user_ids = set(counts) | set(
+                NotificationCounter.objects.values_list("user_id", flat=True)
+            )
+        NotificationCounter.objects.bulk_create(
+            [
+                NotificationCounter(
+                    user_id=user_id, unread_count=counts.get(user_id, 0)
+                )
+                for user_id in user_ids
+            ],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["unread_count"],
+        )
+        NotificationService.invalidate_navbar(user_ids)
+        return len(user_ids)
+
+    @staticmethod
+    def invalidate_navbar(user_ids):
+        """Give each user a new navbar cache version after commit.
+
+        Cached previews carry the version they were built for, so a preview
+        computed from data read before the change is never served after it.
+        """
+        versions = {
+            f"notifications:{user_id}:version": uuid.uuid4().hex for user_id in user_ids
+        }
+        if versions:
+            transaction.on_commit(lambda: cache.set_many(versions, None))
+
+    @staticmethod
+    def get_navbar_data(user, preview_size=10):
+        """Unread count and latest unread notifications for the navbar.
+
+        Served from the cache with a single ``get_many`` while the user's
+        version is unchanged; rebuilt with two queries otherwise.
+        """
+        version_key = f"notifications:{user.id}:version"
+        payload_key = f"notifications:{user.id}:navbar"
+        cached = cache.get_many([version_key, payload_key])
+        version = cached.get(version_key)
+        payload = cached.get(payload_key)
+        if version is not None and payload and payload["version"] == version:
+            return payload["count"], payload["preview"]
+
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(version_key, version, None):
+                version = cache.get(version_key)
+
+        count = (
+            NotificationCounter.objects.filter(user=user)
+            .values_list("unread_count", flat=True)
+            .first()
+        )
+        if count is None:
+            NotificationService.recount_unread([user.id])
+            count = user.notification_counter.unread_count
+        preview = list(
+            Notification.objects.filter(user=user, is_read=False)
+            .select_related("invoice", "complaint", "refund", "order__invoice")
+            .order_by("-created_at")[:preview_size]
+        )
+        cache.set(
+            payload_key,
+            {"version": version, "count": count, "preview": preview},
+            getattr(settings, "NOTIFICATION_NAVBAR_CACHE_TIMEOUT", 300),
+        )
+        return count, preview
+
+    @staticmethod
+    def get_preferences(user):
+        """Return the delivery mode for every notification type"""
+        preferences = dict.fromkeys(
+            (value for value, _ in Notification.TYPE_CHOICES), "instant"
+        )
+        preferences.update(
+            user.notification_preferences.values_list("notification_type", "delivery")
+        )
+        return preferences
+
+    @staticmethod
+    def set_preferences(user, preferences):
+        """Store delivery modes; instant is the default and needs no row"""
+        instant = [
+            notification_type
+            for notification_type, delivery in preferences.items()
+            if delivery == "instant"
+        ]
+        with transaction.atomic():
+            user.notification_preferences.filter(notification_type__in=instant).delete()
+            # Events waiting for a digest that is no longer wanted are dropped
+            user.notifications.filter(
+                digest_pending=True, notification_type__in=instant
+            ).update(digest_pending=False)
+            NotificationPreference.objects.bulk_create(
+                [
+                    NotificationPreference(
+                        user=user,
+                        notification_type=notification_type,
+                        delivery=delivery,
+                    )
+                    for notification_type, delivery in preferences.items()
+                    if delivery != "instant"
+                ],
+                update_conflicts=True,
+                unique_fields=["user", "notification_type"],
+                update_fields=["delivery"],
+            )
+
+    @staticmethod
+    def send_digests(frequency, sample_size=3):
+        """Queue one digest email per recipient for a delivery frequency.
+
+        Pending notifications are counted per recipient and type with one
+        grouped query, and the latest ``sample_size`` messages of each group
+        come from one windowed query, so the cost does not depend on the
+        number of notifications. Returns the number of digests queued.
+        """
+        chosen = NotificationPreference.objects.filter(
+            user=OuterRef("user"),
+            notification_type=OuterRef("notification_type"),
+            delivery=frequency,
+        )
+        pending = Notification.objects.filter(digest_pending=True).filter(
+            Exists(chosen)
+        )
+        last_id = pending.aggregate(last_id=Max("id"))["last_id"]
+        if last_id is None:
+            return 0
+        pending = pending.filter(id__lte=last_id)
+
+        groups = (
+            pending.values("user_id", "user__email", "notification_type")
+            .annotate(count=Count("id"), latest=Max("created_at"))
+            .order_by("user_id", "notification_type")
+        )
+        samples = {}
+        for row in (
+            pending.annotate(
+                rank=Window(
+                    RowNumber(),
+                    partition_by=[F("user_id"), F("notification_type")],
+                    order_by=F("created_at").desc(),
+                )
+            )
+            .filter(rank__lte=sample_size)
+            .order_by("-created_at")
+            .values("user_id", "notification_type", "message")
+        ):
+            samples.setdefault((row["user_id"], row["notification_type"]), []).append(
+                row["message"]
+            )
+
+        labels = dict(Notification.TYPE_CHOICES)
+        digests = {}
+        for group in groups:
+            digest = digests.setdefault(
+                group["user_id"],
+                {"email": group["user__email"], "sections": [], "total": 0},
+            )
+            key = (group["user_id"], group["notification_type"])
+            digest["sections"].append(
+                {
+                    "label": labels.get(group["notification_type"]),
+                    "count": group["count"],
+                    "latest": group["latest"],
+                    "messages": samples.get(key, []),
+                    "more": group["count"] - len(samples.get(key, [])),
+                }
+            )
+            digest["total"] += group["count"]
+
+        period = dict(NotificationPreference.DELIVERY_CHOICES)[frequency]
+        rendered = EmailTemplateService.render_batch(
+            "emails/notification_digest.txt",
+            [{"digest": digest} for digest in digests.values()],
+            shared={"period": period},
+        )
+        site_name = EmailTemplateService.site_context()["site_info"].site_name
+        emails = [
+            (
+                f"{site_name} - {period} : {digest['total']} notification(s)",
+                text,
+                html,
+                digest["email"],
+            )
+            for digest, (html, text) in zip(digests.values(), rendered)
+        ]
+
+        with transaction.atomic():
+            MailService.enqueue_bulk(emails)
+            pending.update(digest_pending=False)
+        return len(emails)
+
+    # Columns copied from Notification into NotificationArchive
+    ARCHIVE_FIELDS = [
+        "user_id",
+        "notification_type",
+        "title",
+        "message",
+        "order_id",
+        "invoice_id",
+        "complaint_id",
+        "refund_id",
+        "related_user_id",
+        "review_id",
+        "question_id",
+        "contact_id",
+        "created_at",
+    ]
+
+    @staticmethod
+    def prune_chunk(cutoff, chunk_size, after_id=0, archive=True):
+        """Archive (or just delete) one chunk of read notifications.
+
+        Handles at most ``chunk_size`` rows older than ``cutoff`` with an id
+        above ``after_id``, in its own short transaction. Returns
+        ``(count, last_id)``; ``count`` is 0 when nothing is left.
+        """
+        with transaction.atomic():
+            rows = list(
+                Notification.objects.filter(
+                    id__gt=after_id, is_read=True, created_at__lt=cutoff
+                )
+                .order_by("id")
+                .values("id", *NotificationService.ARCHIVE_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                return 0, after_id
+
+            ids = [row.pop("id") for row in rows]
+            if archive:
+                NotificationArchive.objects.bulk_create(
+                    [NotificationArchive(**row) for row in rows]
+                )
+            # A regular delete, so post_delete still keeps the unread counters
+            # right should a row have been marked unread in the meantime
+            Notification.objects.filter(id__in=ids).delete()
+        return len(ids), ids[-1]
 
     @staticmethod
     def mark_as_read(notification_ids, user):
         """Mark notifications as read"""
-        Notification.objects.filter(id__in=notification_ids, user=user).update(
-            is_read=True
-        )
+        with transaction.atomic():
+            count = Notification.objects.filter(
+                id__in=notification_ids, user=user, is_read=False
+            ).update(is_read=True)
+            NotificationService.adjust_unread([user.id], -count)
+        return count
 
     @staticmethod
     def mark_all_as_read(user):
         """Mark all notifications as read for user"""
-        Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+        with transaction.atomic():
+            count = Notification.objects.filter(user=user, is_read=False).update(
+                is_read=True
+            )
+            NotificationCounter.objects.filter(user=user).update(unread_count=0)
+            NotificationService.invalidate_navbar([user.id])
+        return count
+
+
+class EmailTemplateService:
+    """Service for rendering emails from cached, pre-compiled templates.
+
+    Each template is looked up once per language (``emails/fr/name.html``
+    before ``emails/name.html``) and kept compiled together with its text
+    part: a sibling ``.txt`` template when there is one, otherwise a text
+    template derived once from the HTML source.
+    """
+
+    # (template name, language) -> (html template or None, text template)
+    _templates = {}
+
+    @staticmethod
+    def clear_cache():
+        EmailTemplateService._templates.clear()
+
+    @staticmethod
+    def get_templates(template_name, language=None):
+        language = (
+            language or translation.get_language() or settings.LANGUAGE_CODE
+        ).lower()
+        key = (template_name, language)
+        templates = EmailTemplateService._templates.get(key)
+        if templates is None:
+            templates = EmailTemplateService._load(template_name, language)
+            EmailTemplateService._templates[key] = templates
+        return templates
+
+    @staticmethod
+    def _load(template_name, language):
+        directory, filename = posixpath.split(template_name)
+        root, extension = posixpath.splitext(filename)
+
+        def candidates(suffix):
+            return [
+                posixpath.join(directory, code, root + suffix)
+                for code in dict.fromkeys([language, language.split("-")[0]])
+            ] + [posixpath.join(directory, root + suffix)]
+
+        if extension == ".txt":
+            return None, select_template(candidates(".txt")).template
+
+        html_template = select_template(candidates(extension)).template
+        try:
+            text_template = select_template(candidates(".txt")).template
+        except TemplateDoesNotExist:
+            text_template = html_template.engine.from_string(
+                EmailTemplateService.html_to_text(html_template.source)
+            )
+        return html_template, text_template
+
+    @staticmethod
+    def html_to_text(source):
+        """Turn an HTML template source into a plain text template source"""
+        source = re.sub(r"(?is)<(head|style|script)\b.*?</\1>", "", source)
+        # Keep link targets, which would otherwise be lost with the tags
+        source = re.sub(
+            r'(?is)<a\b[^>]*href="(?!mailto:)([^"]+)"[^>]*>(.*?)</a>',
+            r"\2 (\1)",
+            source,
+        )
+        source = re.sub(r"(?i)<li\b[^>]*>", "- ", source)
+        source = re.sub(r"(?i)<br\s*/?>", "\n", source)
+        text = unescape(strip_tags(source))
+        return "\n".join(line.strip() for line in text.splitlines())
+
+    @staticmethod
+    def site_context():
+        """Site information shared by every email"""
+        return {
+            "site_info": SiteInformation.get_instance(),
+            "site_url": getattr(settings, "SITE_URL", "http://localhost:8000"),
+            "current_year": datetime.now().year,
+        }
+
+    @staticmethod
+    def render(template_name, context=None, language=None):
+        """Return ``(html, text)``; ``html`` is ``None`` for text-only templates"""
+        return EmailTemplateService.render_batch(
+            template_name, [context or {}], language=language
+        )[0]
+
+    @staticmethod
+    def render_batch(template_name, contexts, shared=None, language=None):
+        """Render one email per context in ``contexts``.
+
+        The template lookup, site information and ``shared`` context are
+        resolved once for the whole batch; each context only adds the
+        per-recipient values.
+        """
+        html_template, text_template = EmailTemplateService.get_templates(
+            template_name, language
+        )
+        base = {**EmailTemplateService.site_context(), **(shared or {})}
+        html_context = Context(base)
+        text_context = Context(base, autoescape=False)
+
+        rendered = []
+        for context in contexts:
+            html = None
+            if html_template is not None:
+                with html_context.push(context):
+                    html = html_template.render(html_context)
+            with text_context.push(context):
+                text = re.sub(r"\n{3,}", "\n\n", text_template.render(text_context))
+            rendered.append((html, text.strip()))
+        return rendered
+
+
+class MailService:
+    """Service for queuing emails and delivering the outbox"""
+
+    @staticmethod
+    def enqueue(subject, body, recipients, from_email=None, html_body=""):
+        """Queue an email for the mail worker.
+
+        The row is written in the caller's transaction, so emails about work
+        that gets rolled back are never sent. Returns ``None`` when there is
+        no recipient with an address.
+        """
+        recipients = [address for address in recipients if address]
+        if not recipients:
+            return None
+        return OutgoingEmail.objects.create(
+            subject=subject[:255],
+            body=body,
+            html_body=html_body or "",
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=recipients,
+        )
+
+    @staticmethod
+    def enqueue_many(subject, body, recipients, from_email=None, html_body=""):
+        """Queue the same email once per recipient with a single insert.
+
+        Each recipient gets their own row so one bad address does not hold
+        back the others; the worker still sends them over one connection.
+        """
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        return OutgoingEmail.objects.bulk_create(
+            [
+                OutgoingEmail(
+                    subject=subject[:255],
+                    body=body,
+                    html_body=html_body or "",
+                    from_email=from_email,
+                    recipients=[address],
+                )
+                for address in dict.fromkeys(recipients)
+                if address
+            ]
+        )
+
+    @staticmethod
+    def enqueue_bulk(emails, from_email=None):
+        """Queue ``(subject, body, html_body, recipient)`` tuples with a single insert"""
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        return OutgoingEmail.objects.bulk_create(
+            [
+                OutgoingEmail(
+                    subject=subject[:255],
+                    body=body,
+                    html_body=html_body or "",
+                    from_email=from_email,
+                    recipients=[address],
+                )
+                for subject, body, html_body, address in emails
+                if address
+            ]
+        )
+
+    @staticmethod
+    def claim_batch(batch_size, lease_seconds=300):
+        """Reserve up to ``batch_size`` due emails for this worker.
+
+        Claimed rows get their next attempt pushed back by the lease, so
+        other workers skip them and a crashed worker's batch is retried once
+        the lease expires.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                OutgoingEmail.objects.select_for_update(skip_locked=True)
+                .filter(status="pending", next_attempt_at__lte=now)
+                .order_by("next_attempt_at", "id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if ids:
+                OutgoingEmail.objects.filter(id__in=ids).update(
+                    next_attempt_at=now + timedelta(seconds=lease_seconds)
+                )
+        return list(OutgoingEmail.objects.filter(id__in=ids).order_by("id"))
+
+    @staticmethod
+    def deliver_batch(batch_size=None, max_attempts=None, backoff_seconds=None):
+        """Send one batch of due emails over a single backend connection.
+
+        Failed emails are retried with exponential backoff and marked as
+        ``dead`` after ``max_attempts`` tries. Returns ``(sent, failed)``.
+        """
+        if batch_size is None:
+            batch_size = getattr(settings, "MAIL_OUTBOX_BATCH_SIZE", 50)
+        if max_attempts is None:
+            max_attempts = getattr(settings, "MAIL_OUTBOX_MAX_ATTEMPTS", 5)
+        if backoff_seconds is None:
+            backoff_seconds = getattr(settings, "MAIL_OUTBOX_BACKOFF_SECONDS", 60)
+
+        emails = MailService.claim_batch(batch_size)
+        if not emails:
+            return 0, 0
+
+        sent_ids, failed = [], []
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+            for email in emails:
+                message = EmailMultiAlternatives(
+                    subject=email.subject,
+                    body=email.body,
+                    from_email=email.from_email or settings.DEFAULT_FROM_EMAIL,
+                    to=email.recipients,
+                    connection=connection,
+                )
+                if email.html_body:
+                    message.attach_alternative(email.html_body, "text/html")
+                try:
+                    message.send()
+                    sent_ids.append(email.id)
+                except Exception as e:
+                    email.last_error = f"{type(e).__name__}: {e}"[:2000]
+                    failed.append(email)
+                    # Start over with a fresh connection for the next email
+                    connection.close()
+                    connection.open()
+        except Exception as e:
+            # Could not reach the backend: the rest of the batch fails too
+            handled = set(sent_ids) | {email.id for email in failed}
+            for email in emails:
+                if email.id not in handled:
+                    email.last_error = f"{type(e).__name__}: {e}"[:2000]
+                    failed.append(email)
+        finally:
+            connection.close()
+
+        now = timezone.now()
+        if sent_ids:
+            OutgoingEmail.objects.filter(id__in=sent_ids).update(
+                status="sent", sent_at=now, attempts=F("attempts") + 1, last_error=""
+            )
+        for email in failed:
+            email.attempts += 1
+            if email.attempts >= max_attempts:
+                email.status = "dead"
+            else:
+                delay = backoff_seconds * 2 ** (email.attempts - 1)
+                email.next_attempt_at = now + timedelta(seconds=delay)
+        if failed:
+            OutgoingEmail.objects.bulk_update(
+                failed, ["attempts", "status", "next_attempt_at", "last_error"]
+            )
+
+        return len(sent_ids), len(failed)
+
+
+class SalesRollupService:
+    """Service for the daily sales rollups read by the admin reports.
+
+    An order counts on the day it was created, under its current status.
+    Product and category rows only count orders in ``PAID_STATUSES``.
+    Changes are applied as deltas in the transaction of the order change;
+    ``reconcile`` rebuilds days from the orders table.
+    """
+
+    PAID_STATUSES = ("paid", "processing", "shipped", "delivered")
+
+    @staticmethod
+    def record_order(order, old_state=None):
+        """Apply an order change given the ``rollup_state()`` it had before.
+
+        Without a previous state the order is counted as new. When its
+        status changes, its lines move to the new status as well.
+        """
+        new_state = order.rollup_state()
+        if new_state == old_state:
+            return
+        status_deltas, product_deltas = defaultdict(Counter), defaultdict(Counter)
+        day = timezone.localdate(order.created_at)
+        if old_state:
+            SalesRollupService._add_order(status_deltas, day, *old_state, sign=-1)
+        SalesRollupService._add_order(status_deltas, day, *new_state)
+
+        if old_state and old_state[0] != new_state[0]:
+            lines = list(order.items.values_list("product_id", "quantity", "price"))
+            SalesRollupService._add_lines(
+                status_deltas, product_deltas, day, old_state[0], lines, sign=-1
+            )
+            SalesRollupService._add_lines(
+                status_deltas, product_deltas, day, new_state[0], lines
+            )
+        SalesRollupService._apply(status_deltas, product_deltas)
+
+    @staticmethod
+    def remove_order(order, state):
+        """Take a deleted order out of the rollups; its lines are removed on their own"""
+        if state is None:
+            return
+        status_deltas = defaultdict(Counter)
+        SalesRollupService._add_order(
+            status_deltas, timezone.localdate(order.created_at), *state, sign=-1
+        )
+        SalesRollupService._apply(status_deltas, {})
+
+    @staticmethod
+    def record_lines(order, lines, sign=1):
+        """Add the lines of a new order, given as ``(product_id, quantity, price)``.
+
+        Use ``sign=-1`` to remove them. Called for lines created with
+        ``bulk_create``, which sends no signal; every product of ``lines``
+        counts one more order, so they must be all the lines of ``order``.
+        """
+        status_deltas, product_deltas = defaultdict(Counter), defaultdict(Counter)
+        SalesRollupService._add_lines(
+            status_deltas,
+            product_deltas,
+            timezone.localdate(order.created_at),
+            order.status,
+            lines,
+            sign=sign,
+        )
+        SalesRollupService._apply(status_deltas, product_deltas)
+
+    @staticmethod
+    def record_line(item, old_line=None, new_line=None, removed=None):
+        """Apply the change of one order line from ``old_line`` to ``new_line``.
+
+        Both are ``rollup_state()`` tuples, ``None`` for a created or deleted
+        line. The status is read from the orders table rather than from
+        ``item.order``, which may be a stale instance. A product's order
+        count only moves when the order gains its first line of that
+        product or loses its last one.
+
+        ``removed`` is a set shared by the lines of one ``delete()`` call:
+        they are all gone before the first of them is recorded, so it keeps
+        an order from being taken out of a product's count twice.
+        """
+        if old_line == new_line:
+            return
+        row = (
+            Order.objects.filter(pk=item.order_id)
+            .values_list("status", "created_at")
+            .first()
+        )
+        if row is None:
+            return
+        status, created_at = row
+        day = timezone.localdate(created_at)
+        status_deltas, product_deltas = defaultdict(Counter), defaultdict(Counter)
+        for sign, line in ((-1, old_line), (1, new_line)):
+            if line:
+                SalesRollupService._add_lines(
+                    status_deltas,
+                    product_deltas,
+                    day,
+                    status,
+                    [line],
+                    sign,
+                    count_orders=False,
+                )
+
+        old_product = old_line[0] if old_line else None
+        new_product = new_line[0] if new_line else None
+        if status in SalesRollupService.PAID_STATUSES and old_product != new_product:
+            remaining = set(
+                OrderItem.objects.filter(
+                    order_id=item.order_id,
+                    product_id__in=[old_product, new_product],
+                )
+                .exclude(pk=item.pk)
+                .values_list("product_id", flat=True)
+            )
+            for sign, product_id in ((-1, old_product), (1, new_product)):
+                if product_id is None or product_id in remaining:
+                    continue
+                if sign < 0 and removed is not None:
+                    if (item.order_id, product_id) in removed:
+                        continue
+                    removed.add((item.order_id, product_id))
+                product_deltas[(day, product_id)]["order_count"] += sign
+        SalesRollupService._apply(status_deltas, product_deltas)
+
+    @staticmethod
+    def update_status(queryset, status, **fields):
+        """``queryset.update(status=status, **fields)`` keeping the rollups in step.
+
+        Returns the number of orders updated.
+        """
+        with transaction.atomic():
+            orders = list(
+                Order.objects.filter(pk__in=queryset.values("pk"))
+                .select_for_update()
+                .only("id", "user_id", "created_at", "status", "total_amount")
+            )
+            updated = Order.objects.filter(
+                pk__in=[order.pk for order in orders]
+            ).update(status=status, **fields)
+
+            changed = {order.pk: order for order in orders if order.status != status}
+            lines = defaultdict(list)
+            for order_id, *line in OrderItem.objects.filter(
+                order_id__in=changed
+            ).values_list("order_id", "product_id", "quantity", "price"):
+                lines[order_id].append(line)
+
+            status_deltas, product_deltas = defaultdict(Counter), defaultdict(Counter)
+            for order in changed.values():
+                day = timezone.localdate(order.created_at)
+                for sign, order_status in ((-1, order.status), (1, status)):
+                    SalesRollupService._add_order(
+                        status_deltas, day, order_status, order.total_amount, sign
+                    )
+                    SalesRollupService._add_lines(
+                        status_deltas,
+                        product_deltas,
+                        day,
+                        order_status,
+                        lines[order.pk],
+                        sign,
+                    )
+            SalesRollupService._apply(status_deltas, product_deltas)
+            CustomerStatsService.schedule_refresh(
+                order.user_id for order in changed.values()
+            )
+        return updated
+
+    @staticmethod
+    def _add_order(status_deltas, day, status, total_amount, sign=1):
+        row = status_deltas[(day, status)]
+        row["order_count"] += sign
+        row["revenue"] += sign * total_amount
+
+    @staticmethod
+    def _add_lines(
+        status_deltas, product_deltas, day, status, lines, sign=1, count_orders=True
+    ):
+        products = set()
+        for product_id, quantity, price in lines:
+            status_deltas[(day, status)]["item_count"] += sign * quantity
+            if status in SalesRollupService.PAID_STATUSES:
+                row = product_deltas[(day, product_id)]
+                row["quantity"] += sign * quantity
+                row["revenue"] += sign * quantity * price
+                products.add(product_id)
+        if not count_orders:
+            return
+        for product_id in products:
+            # One order per product, whatever the number of its lines
+            product_deltas[(day, product_id)]["order_count"] += sign
+
+    @staticmethod
+    def _apply(status_deltas, product_deltas):
+        """Write the deltas, deriving the category rows from the product rows"""
+        category_deltas = defaultdict(Counter)
+        if product_deltas:
+            categories = defaultdict(list)
+            for product_id, category_id in Product.categories.through.objects.filter(
+                product_id__in={product_id for _, product_id in product_deltas}
+            ).values_list("product_id", "category_id"):
+                categories[product_id].append(category_id)
+            for (day, product_id), values in product_deltas.items():
+                for category_id in categories[product_id]:
+                    row = category_deltas[(day, category_id)]
+                    row["quantity"] += values["quantity"]
+                    row["revenue"] += values["revenue"]
+
+        for (day, status), values in status_deltas.items():
+            SalesRollupService._bump(
+                DailySalesByStatus, {"day": day, "status": status}, values
+            )
+        for (day, product_id), values in product_deltas.items():
+            SalesRollupService._bump(
+                DailyProductSales, {"day": day, "product_id": product_id}, values
+            )
+        for (day, category_id), values in category_deltas.items():
+            SalesRollupService._bump(
+                DailyCategorySales, {"day": day, "category_id": category_id}, values
+            )
+
+    @staticmethod
+    def _bump(model, keys, values):
+        """Add ``values`` to the row identified by ``keys``, creating it if needed"""
+        values = {field: value for field, value in values.items() if value}
+        if not values:
+            return
+        increments = {field: F(field) + value for field, value in values.items()}
+        if model.objects.filter(**keys).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**keys, **values)
+        except IntegrityError:
+            # Created concurrently since the update above
+            model.objects.filter(**keys).update(**increments)
+
+    @staticmethod
+    def reconcile(start=None, end=None):
+        """Rebuild the rollups of days ``start`` to ``end`` from the orders.
+
+        Both bounds are inclusive and optional. Returns the number of rows
+        that had to be created, corrected or deleted.
+        """
+        orders = Order.objects.order_by()
+        lines = OrderItem.objects.order_by()
+        rollups = [
+            DailySalesByStatus.objects.all(),
+            DailyProductSales.objects.all(),
+            DailyCategorySales.objects.all(),
+        ]
+        if start:
+            orders = orders.filter(created_at__date__gte=start)
+            lines = lines.filter(order__created_at__date__gte=start)
+            rollups = [queryset.filter(day__gte=start) for queryset in rollups]
+        if end:
+            orders = orders.filter(created_at__date__lte=end)
+            lines = lines.filter(order__created_at__date__lte=end)
+            rollups = [queryset.filter(day__lte=end) for queryset in rollups]
+
+        revenue = Sum(
+            F("quantity") * F("price"),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+        paid_lines = lines.filter(order__status__in=SalesRollupService.PAID_STATUSES)
+
+        by_status = defaultdict(
+            lambda: {"order_count": 0, "item_count": 0, "revenue": Decimal("0")}
+        )
+        for row in orders.values(day=TruncDate("created_at"), key=F("status")).annotate(
+            order_count=Count("id"), revenue=Sum("total_amount")
+        ):
+            by_status[(row["day"], row["key"])].update(
+                order_count=row["order_count"], revenue=row["revenue"]
+            )
+        for row in lines.values(
+            day=TruncDate("order__created_at"), key=F("order__status")
+        ).annotate(item_count=Sum("quantity")):
+            by_status[(row["day"], row["key"])]["item_count"] = row["item_count"]
+
+        by_product = {
+            (row.pop("day"), row.pop("key")): row
+            for row in paid_lines.values(
+                day=TruncDate("order__created_at"), key=F("product_id")
+            ).annotate(
+                # Before "quantity", which would shadow the column
+                revenue=revenue,
+                quantity=Sum("quantity"),
+                order_count=Count("order", distinct=True),
+            )
+        }
+        by_category = {
+            (row.pop("day"), row.pop("key")): row
+            for row in paid_lines.filter(product__categories__isnull=False)
+            .values(day=TruncDate("order__created_at"), key=F("product__categories"))
+            .annotate(revenue=revenue, quantity=Sum("quantity"))
+        }
+
+        with transaction.atomic():
+            return sum(
+                SalesRollupService._sync(queryset, key_field, expected)
+                for queryset, key_field, expected in zip(
+                    rollups,
+                    ("status", "product_id", "category_id"),
+                    (by_status, by_product, by_category),
+                )
+            )
+
+    @staticmethod
+    def _sync(queryset, key_field, expected):
+        """Make the rows of ``queryset`` match ``expected``; returns the rows changed"""
+        model = queryset.model
+        existing = {
+            (row.day, getattr(row, key_field)): row
+            for row in queryset.select_for_update()
+        }
+        to_create, to_update, fields = [], [], set()
+        for (day, key), values in expected.items():
+            row = existing.pop((day, key), None)
+            if row is None:
+                to_create.append(model(day=day, **{key_field: key}, **values))
+                continue
+            changed = {
+                field: value
+                for field, value in values.items()
+                if getattr(row, field) != value
+            }
+            if changed:
+                for field, value in changed.items():
+                    setattr(row, field, value)
+                fields.update(changed)
+                to_update.append(row)
+
+        model.objects.bulk_create(to_create, batch_size=1000)
+        if to_update:
+            model.objects.bulk_update(to_update, sorted(fields), batch_size=1000)
+        model.objects.filter(pk__in=[row.pk for row in existing.values()]).delete()
+        # Rows left at zero by transitions are dropped without being counted
+        count_field = "order_count" if model is DailySalesByStatus else "quantity"
+        stale = [row for row in existing.values() if getattr(row, count_field)]
+        return len(to_create) + len(to_update) + len(stale)
+
+
+class CustomerStatsService:
+    """Service for the per-customer stats table: lifetime value and RFM scores.
+
+    A customer's row is rebuilt from their orders after any commit that
+    creates or deletes one of their orders, or changes its status or total.
+    A rebuild is one grouped query for a batch of customers. RFM scores
+    rank customers against each other, so ``score`` reassigns them all
+    (see the refresh_customer_stats command).
+    """
+
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def schedule_refresh(user_ids):
+        """Refresh the rows of ``user_ids`` once the transaction commits"""
+        user_ids = set(user_ids)
+        if user_ids:
+            transaction.on_commit(lambda: CustomerStatsService.refresh(user_ids))
+
+    @staticmethod
+    def refresh(user_ids):
+        """Rebuild the rows of ``user_ids`` from their orders.
+
+        Users without orders, or deleted since, lose their row. Returns the
+        number of rows written.
+        """
+        user_ids = list(user_ids)
+        paid = Q(orders__status__in=SalesRollupService.PAID_STATUSES)
+        written = 0
+        for start in range(0, len(user_ids), CustomerStatsService.BATCH_SIZE):
+            batch = user_ids[start : start + CustomerStatsService.BATCH_SIZE]
+            rows = (
+                User.objects.filter(id__in=batch)
+                .annotate(
+                    order_count=Count("orders"),
+                    paid_order_count=Count("orders", filter=paid),
+                    total_spent=Sum(
+                        "orders__total_amount", filter=paid, default=Decimal("0")
+                    ),
+                    first_order_at=Min("orders__created_at", filter=paid),
+                    last_order_at=Max("orders__created_at", filter=paid),
+                )
+                .filter(order_count__gt=0)
+                .values(
+                    "id",
+                    "order_count",
+                    "paid_order_count",
+                    "total_spent",
+                    "first_order_at",
+                    "last_order_at",
+                )
+            )
+            stats = []
+            for row in rows:
+                paid_count = row["paid_order_count"]
+                average = row["total_spent"] / paid_count if paid_count else 0
+                stats.append(
+                    CustomerStats(
+                        user_id=row.pop("id"),
+                        average_order_value=Decimal(average).quantize(Decimal("0.01")),
+                        **row,
+                    )
+                )
+            with transaction.atomic():
+                CustomerStats.objects.bulk_create(
+                    stats,
+                    update_conflicts=True,
+                    unique_fields=["user"],
+                    update_fields=[
+                        "order_count",
+                        "paid_order_count",
+                        "total_spent",
+                        "average_order_value",
+                        "first_order_at",
+                        "last_order_at",
+                        "updated_at",
+                    ],
+                )
+                CustomerStats.objects.filter(
+                    user_id__in=set(batch) - {row.user_id for row in stats}
+                ).delete()
+            written += len(stats)
+        return written
+
+    @staticmethod
+    def score():
+        """Give every paying customer quintile scores from 1 to 5.
+
+        Recency ranks the last paid order date, frequency the number of
+        paid orders and monetary the total spent; 5 is the best fifth.
+        Returns the number of customers scored.
+        """
+        scores = (
+            CustomerStats.objects.filter(paid_order_count__gt=0)
+            .annotate(
+                recency=Window(Ntile(5), order_by=F("last_order_at").asc()),
+                frequency=Window(Ntile(5), order_by=F("paid_order_count").asc()),
+                monetary=Window(Ntile(5), order_by=F("total_spent").asc()),
+            )
+            .values_list("user_id", "recency", "frequency", "monetary")
+        )
+        scored, batch = 0, []
+        for user_id, recency, frequency, monetary in scores.iterator(
+            chunk_size=CustomerStatsService.BATCH_SIZE
+        ):
+            batch.append(
+                CustomerStats(
+                    user_id=user_id,
+                    recency_score=recency,
+                    frequency_score=frequency,
+                    monetary_score=monetary,
+                )
+            )
+            if len(batch) == CustomerStatsService.BATCH_SIZE:
+                scored += CustomerStatsService._save_scores(batch)
+                batch = []
+        scored += CustomerStatsService._save_scores(batch)
+
+        # Customers whose paid orders were all cancelled since
+        CustomerStats.objects.filter(paid_order_count=0).exclude(
+            recency_score=0
+        ).update(recency_score=0, frequency_score=0, monetary_score=0)
+        return scored
+
+    @staticmethod
+    def _save_scores(batch):
+        return CustomerStats.objects.bulk_update(
+            batch, ["recency_score", "frequency_score", "monetary_score"]
+        )
+
+    @staticmethod
+    def get_top_customers(limit=10):
+        """Customers with the highest lifetime spend, read from the index"""
+        return list(
+            CustomerStats.objects.filter(paid_order_count__gt=0)
+            .order_by("-total_spent")
+            .values(
+                "user_id",
+                "user__username",
+                "user__email",
+                "total_spent",
+                "average_order_value",
+                "recency_score",
+                "frequency_score",
+                "monetary_score",
+                "paid_order_count",
+            )[:limit]
+        )
+
+    @staticmethod
+    def get_segments():
+        """Paying customers, revenue and average basket per ``UserProfile.user_type``"""
+        segments = list(
+            CustomerStats.objects.filter(paid_order_count__gt=0)
+            .values(user_type=F("user__profile__user_type"))
+            .annotate(
+                customers=Count("pk"),
+                orders=Sum("paid_order_count"),
+                revenue=Sum("total_spent"),
+            )
+            .order_by("-revenue")
+        )
+        for segment in segments:
+            segment["average_order_value"] = segment["revenue"] / segment["orders"]
+        return segments
+
+
+class CounterService:
+    """Service for the admin counters of the dashboard, payments list and navbar.
+
+    Each counter is kept in the cache and moved by deltas from the model
+    signals once the transaction commits. A missing or expired counter is
+    recounted on the next read, so code that bypasses signals only has to
+    call ``invalidate``, and any drift is gone after ``COUNTERS_TIMEOUT``
+    seconds (600 by default).
+    """
+
+    # name: (model, filter used to recount, the same test on tracked values)
+    COUNTERS = {
+        "total_users": (User, None, lambda state: True),
+        "active_users": (User, Q(is_active=True), lambda state: state["is_active"]),
+        "pending_approvals": (
+            User,
+            Q(is_active=False),
+            lambda state: not state["is_active"],
+        ),
+        "total_orders": (Order, None, lambda state: True),
+        "total_payments": (PaymentProof, None, lambda state: True),
+        "unverified_payments": (
+            PaymentProof,
+            Q(verified=False),
+            lambda state: not state["verified"],
+        ),
+        "pending_payments": (
+            PaymentProof,
+            Q(verified=False, rejection_reason=""),
+            lambda state: not state["verified"] and not state["rejection_reason"],
+        ),
+        "verified_payments": (
+            PaymentProof,
+            Q(verified=True),
+            lambda state: state["verified"],
+        ),
+        "rejected_payments": (
+            PaymentProof,
+            ~Q(rejection_reason=""),
+            lambda state: bool(state["rejection_reason"]),
+        ),
+        "open_complaints": (
+            Complaint,
+            Q(status="open"),
+            lambda state: state["status"] == "open",
+        ),
+        "pending_refunds": (
+            Refund,
+            Q(status="refund_pending"),
+            lambda state: state["status"] == "refund_pending",
+        ),
+    }
+
+    # Fields the counters of each model depend on
+    TRACKED_FIELDS = {
+        User: ("is_active",),
+        Order: (),
+        PaymentProof: ("verified", "rejection_reason"),
+        Complaint: ("status",),
+        Refund: ("status",),
+    }
+
+    @staticmethod
+    def cache_key(name):
+        return f"counters:{name}"
+
+    @staticmethod
+    def get_counters():
+        """All counters, with ``pending_total`` for the navbar badge.
+
+        One ``get_many`` when the counters are cached; missing ones are
+        recounted with one query per model.
+        """
+        keys = {
+            name: CounterService.cache_key(name) for name in CounterService.COUNTERS
+        }
+        cached = cache.get_many(list(keys.values()))
+        counters = {name: cached[key] for name, key in keys.items() if key in cached}
+        missing = [name for name in CounterService.COUNTERS if name not in counters]
+        if missing:
+            counters.update(CounterService.recount(missing))
+        counters["pending_total"] = (
+            counters["pending_approvals"]
+            + counters["pending_payments"]
+            + counters["open_complaints"]
+            + counters["pending_refunds"]
+        )
+        return counters
+
+    @staticmethod
+    def recount(names=None):
+        """Count ``names`` (all counters by default) in the database and cache them"""
+        names = names or list(CounterService.COUNTERS)
+        by_model = defaultdict(dict)
+        for name in names:
+            model, condition, _ = CounterService.COUNTERS[name]
+            by_model[model][name] = Count("pk", filter=condition)
+        counters = {}
+        for model, aggregates in by_model.items():
+            counters.update(model._default_manager.aggregate(**aggregates))
+        cache.set_many(
+            {CounterService.cache_key(name): value for name, value in counters.items()},
+            getattr(settings, "COUNTERS_TIMEOUT", 600),
+        )
+        return counters
+
+    @staticmethod
+    def state(instance):
+        """Values of the tracked fields, or ``None`` if one of them is deferred"""
+        fields = CounterService.TRACKED_FIELDS[instance._meta.concrete_model]
+        loaded = instance.__dict__
+        if not all(field in loaded for field in fields):
+            return None
+        return {field: loaded[field] for field in fields}
+
+    @staticmethod
+    def stored_state(instance):
+        """Values of the tracked fields as saved, or ``None`` if the row is gone"""
+        model = instance._meta.concrete_model
+        fields = CounterService.TRACKED_FIELDS[model]
+        if not fields:
+            return {}
+        return model._default_manager.filter(pk=instance.pk).values(*fields).first()
+
+    @staticmethod
+    def record_save(instance, old_state, created):
+        """Move the counters of a saved instance given its previous state"""
+        new_state = CounterService.state(instance)
+        if not created and old_state == new_state:
+            return
+        model = instance._meta.concrete_model
+        if new_state is None or (not created and old_state is None):
+            CounterService.invalidate(model)
+            return
+        deltas = {}
+        for name, (counter_model, _, test) in CounterService.COUNTERS.items():
+            if counter_model is model:
+                was_counted = False if created else test(old_state)
+                deltas[name] = int(test(new_state)) - int(was_counted)
+        CounterService.adjust(deltas)
+
+    @staticmethod
+    def record_delete(instance, state):
+        """Take a deleted instance out of the counters it was in"""
+        model = instance._meta.concrete_model
+        if state is None:
+            CounterService.invalidate(model)
+            return
+        CounterService.adjust(
+            {
+                name: -int(test(state))
+                for name, (counter_model, _, test) in CounterService.COUNTERS.items()
+                if counter_model is model
+            }
+        )
+
+    @staticmethod
+    def adjust(deltas):
+        """Add ``{name: delta}`` to the cached counters after commit.
+
+        A counter that is not cached is left alone: it is recounted on the
+        next read.
+        """
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+
+        def apply():
+            for name, delta in deltas.items():
+                try:
+                    cache.incr(CounterService.cache_key(name), delta)
+                except ValueError:
+                    pass
+
+        transaction.on_commit(apply)
+
+    @staticmethod
+    def invalidate(model=None):
+        """Drop the counters of ``model`` (all counters by default) after commit"""
+        keys = [
+            CounterService.cache_key(name)
+            for name, (counter_model, _, _) in CounterService.COUNTERS.items()
+            if model is None or counter_model is model
+        ]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class PercentileCont(Aggregate):
+    """``percentile_cont(fraction) WITHIN GROUP (ORDER BY expression)`` (PostgreSQL)"""
+
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
 
 
 class ReportService:
     """Service for generating reports"""
 
+    @staticmethod
+    def get_sales_summary(start_day, end_day=None):
+        """Order counts and revenue for a range of days, from the daily rollups.
+
+        The cost grows with the number of days in the range, not with the
+        number of orders.
+        """
+        by_status = DailySalesByStatus.objects.filter(day__gte=start_day)
+        if end_day:
+            by_status = by_status.filter(day__lte=end_day)
+        paid = SalesRollupService.PAID_STATUSES
+
+        revenue_by_status = list(
+            by_status.values("status")
+            .annotate(total=Sum("revenue"), count=Sum("order_count"))
+            .filter(count__gt=0)
+            .order_by("-total")
+        )
+        daily_revenue = list(
+            by_status.filter(status__in=paid)
+            .values("day")
+            .annotate(revenue=Sum("revenue"), orders=Sum("order_count"))
+            .filter(orders__gt=0)
+            .order_by("day")
+        )
+        totals = by_status.aggregate(
+            orders=Sum("order_count"), items=Sum("item_count"), revenue=Sum("revenue")
+        )
+        total_orders = totals["orders"] or 0
+        total_revenue = sum(
+            (row["total"] for row in revenue_by_status if row["status"] in paid),
+            Decimal("0"),
+        )
+
+        return {
+            "total_orders": total_orders,
+            "total_revenue": total_revenue,
+            "average_order_value": (
+                totals["revenue"] / total_orders if total_orders else 0
+            ),
+            "avg_items_per_order": (
+                totals["items"] / total_orders if total_orders else 0
+            ),
+            "by_status": [
+                {"status": row["status"], "count": row["count"]}
+                for row in revenue_by_status
+            ],
+            "revenue_by_status": revenue_by_status,
+            "daily_revenue": daily_revenue,
+        }
+
+    @staticmethod
+    def get_product_sales(start_day, end_day=None):
+        """Top products, category and specialty figures from the daily rollups"""
+        by_product = DailyProductSales.objects.filter(day__gte=start_day)
+        if end_day:
+            by_product = by_product.filter(day__lte=end_day)
+
+        top_products = list(
+            by_product.values("product__name", "product__id")
+            .annotate(total_quantity=Sum("quantity"), total_revenue=Sum("revenue"))
+            .filter(total_quantity__gt=0)
+            .order_by("-total_revenue")[:10]
+        )
+        category_names = defaultdict(list)
+        for product_id, name in (
+            Product.categories.through.objects.filter(
+                product_id__in=[item["product__id"] for item in top_products]
+            )
+            .order_by("id")
+            .values_list("product_id", "category__name")
+        ):
+            category_names[product_id].append(name)
+        for item in top_products:
+            item["categories"] = ", ".join(category_names[item["product__id"]][:2])
+
+        # Orders are counted once per product, not once per specialty
+        specialty_performance = list(
+            by_product.filter(product__specialty__isnull=False)
+            .exclude(product__specialty="")
+            .values("product__specialty")
+            .annotate(total_revenue=Sum("revenue"), total_orders=Sum("order_count"))
+            .filter(total_orders__gt=0)
+            .order_by("-total_revenue")
+        )
+
+        return {
+            "top_products": top_products,
+            "category_performance": ReportService.get_category_performance(
+                start_day, end_day
+            ),
+            "specialty_performance": specialty_performance,
+        }
+
+    @staticmethod
+    def get_category_performance(start_day, end_day=None):
+        """Paid quantity, revenue and distinct products per category.
+
+        Two grouped queries over the daily rollups, whatever the number of
+        order lines: the category rows, and the product rows counted through
+        the product/category table. A product in two categories counts in
+        both.
+        """
+        by_product = DailyProductSales.objects.filter(
+            day__gte=start_day, quantity__gt=0, product__categories__isnull=False
+        )
+        by_category = DailyCategorySales.objects.filter(day__gte=start_day)
+        if end_day:
+            by_product = by_product.filter(day__lte=end_day)
+            by_category = by_category.filter(day__lte=end_day)
+
+        unique_products = dict(
+            by_product.values("product__categories")
+            .annotate(count=Count("product", distinct=True))
+            .values_list("product__categories", "count")
+        )
+        return [
+            {
+                "product__category__name": row["category__name"],
+                "total_quantity": row["total_quantity"],
+                "total_revenue": row["total_revenue"],
+                "unique_products": unique_products.get(row["category_id"], 0),
+            }
+            for row in by_category.values("category_id", "category__name")
+            .annotate(total_quantity=Sum("quantity"), total_revenue=Sum("revenue"))
+            .filter(total_quantity__gt=0)
+            .order_by("-total_revenue")
+        ]
+
+    @staticmethod
+    def get_ratings_by_category(date_from, date_to=None):
+        """Average rating and review count per category, in one grouped query"""
+        reviews = ProductReview.objects.filter(
+            created_at__gte=date_from, product__categories__isnull=False
+        )
+        if date_to:
+            reviews = reviews.filter(created_at__lte=date_to)
+        return [
+            {
+                "product__category__name": row["product__categories__name"],
+                "avg_rating": row["avg_rating"],
+                "review_count": row["review_count"],
+            }
+            for row in reviews.values(
+                "product__categories", "product__categories__name"
+            )
+            .annotate(avg_rating=Avg("rating"), review_count=Count("id"))
+            .order_by("-avg_rating")
+        ]
+
+    @staticmethod
+    def get_resolution_stats(date_from, date_to=None):
+        """Time to resolve complaints, in hours: overall, per reason and per handler.
+
+        Covers the resolved complaints created in the range. Each group has
+        ``count``, ``mean_hours``, ``median_hours`` and ``p90_hours``.
+        PostgreSQL computes them with ``percentile_cont``, in three grouped
+        queries. Other databases fetch all the durations in one query and
+        compute them with NumPy. Both use linear interpolation, so they give
+        the same figures.
+        """
+        complaints = Complaint.objects.filter(
+            created_at__gte=date_from, status="resolved", resolved_at__isnull=False
+        )
+        if date_to:
+            complaints = complaints.filter(created_at__lte=date_to)
+        duration = ExpressionWrapper(
+            F("resolved_at") - F("created_at"), output_field=DurationField()
+        )
+
+        if connection.vendor == "postgresql":
+            hours = Func(
+                duration,
+                template="EXTRACT(EPOCH FROM %(expressions)s) / 3600",
+                output_field=FloatField(),
+            )
+            aggregates = {
+                "count": Count("id"),
+                "mean_hours": Avg(hours),
+                "median_hours": PercentileCont(hours, 0.5),
+                "p90_hours": PercentileCont(hours, 0.9),
+            }
+            overall = complaints.aggregate(**aggregates)
+
+            def grouped(field):
+                return list(
+                    complaints.values(field)
+                    .annotate(**aggregates)
+                    .order_by("-count", field)
+                )
+
+            return {
+                **overall,
+                "by_reason": grouped("reason__name"),
+                "by_handler": grouped("handled_by__username"),
+            }
+
+        rows = list(
+            complaints.annotate(duration=duration).values_list(
+                "reason__name", "handled_by__username", "duration"
+            )
+        )
+        if not rows:
+            return {
+                "count": 0,
+                "mean_hours": None,
+                "median_hours": None,
+                "p90_hours": None,
+                "by_reason": [],
+                "by_handler": [],
+            }
+
+        reasons, handlers, durations = zip(*rows)
+        hours = np.array(durations, dtype="timedelta64[us]") / np.timedelta64(1, "h")
+
+        def describe(values):
+            median, p90 = np.percentile(values, [50, 90])
+            return {
+                "count": int(values.size),
+                "mean_hours": float(values.mean()),
+                "median_hours": float(median),
+                "p90_hours": float(p90),
+            }
+
+        def grouped(field, labels):
+            # None (no reason, no handler) is its own group, like in SQL
+            keys = np.array(["" if label is None else label for label in labels])
+            names, groups = np.unique(keys, return_inverse=True)
+            result = [
+                {field: str(name) or None, **describe(hours[groups == index])}
+                for index, name in enumerate(names)
+            ]
+            # NULL sorts last, as in PostgreSQL
+            result.sort(
+                key=lambda row: (-row["count"], row[field] is None, row[field] or "")
+            )
+            return result
+
+        return {
+            **describe(hours),
+            "by_reason": grouped("reason__name", reasons),
+            "by_handler": grouped("handled_by__username", handlers),
+        }
+
     @staticmethod
     def get_order_statistics(date_from=None, date_to=None):
         """Get order statistics"""
@@ -1,12 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.conf import settings
 from django.contrib.auth.models import User
+from django.utils.autoreload import file_changed
 
 from .models import (
     Order,
+    OrderItem,
     Invoice,
     PaymentProof,
     PaymentReceipt,
@@ -16,39 +16,175 @@ from .models import (
     Complaint,
     Notification,
 )
+from .services import (
+    CounterService,
+    CustomerStatsService,
+    EmailTemplateService,
+    MailService,
+    NotificationService,
+    SalesRollupService,
+)
+from .tasks import deferred
 
 
 def notify_admins(notification_type, title, message, **related_objects):
     """Notifier tous les utilisateurs administrateurs actifs par notification et email"""
-    admin_users = User.objects.filter(is_staff=True, is_active=True)
-    for admin in admin_users:
-        # Créer notification dans la base de données
-        Notification.objects.create(
-            user=admin,
-            notification_type=notification_type,
-            title=title,
-            message=message,
-            **related_objects,
-        )
-        # Envoyer notification par email
-        send_notification_email(admin, title, message)
+    NotificationService.notify_staff(
+        notification_type, title, message, **related_objects
+    )
+
+
+# Les gestionnaires marqués @deferred s'exécutent après la validation de la
+# transaction, dans le pool de tâches (voir payments.tasks), et reçoivent une
+# copie fraîche de l'instance : son état actuel, pas celui de l'enregistrement
+# qui les a déclenchés. Seuls les enregistrements qui changent les champs
+# indiqués créent une tâche.
 
 
 def send_notification_email(user, title, message):
-    """Fonction d'aide pour envoyer des notifications par email"""
-    try:
-        send_mail(
-            subject=title,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            fail_silently=True,
-        )
-    except Exception:
-        pass
+    """Fonction d'aide pour envoyer des notifications par email (via la file d'envoi)"""
+    html_body, body = EmailTemplateService.render(
+        "emails/notification.html", {"user": user, "title": title, "message": message}
+    )
+    MailService.enqueue(
+        subject=title, body=body, html_body=html_body, recipients=[user.email]
+    )
+
+
+@receiver(file_changed)
+def reload_email_templates(sender, file_path, **kwargs):
+    """Recompiler les templates d'email modifiés pendant le développement"""
+    EmailTemplateService.clear_cache()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_staff_recipients(sender, instance, update_fields=None, **kwargs):
+    """Vider la liste des administrateurs en cache quand un utilisateur change"""
+    # Les connexions ne mettent à jour que last_login
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    NotificationService.invalidate_staff_recipients()
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    """Incrémenter le compteur de notifications non lues et pousser la notification"""
+    if created and not instance.is_read:
+        NotificationService.adjust_unread([instance.user_id], 1)
+        NotificationService.publish([instance])
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    """Décrémenter le compteur quand une notification non lue est supprimée"""
+    if not instance.is_read:
+        NotificationService.adjust_unread([instance.user_id], -1)
+
+
+# Placé avant update_sales_rollups, qui remplace _rollup_state par le nouvel état
+@receiver(post_save, sender=Order)
+def update_customer_stats(sender, instance, created, raw=False, **kwargs):
+    """Recalculer les statistiques du client quand le statut ou le montant change"""
+    if raw:
+        return
+    if created or getattr(instance, "_rollup_state", None) != instance.rollup_state():
+        CustomerStatsService.schedule_refresh([instance.user_id])
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_customer_stats(sender, instance, **kwargs):
+    """Recalculer les statistiques du client d'une commande supprimée"""
+    CustomerStatsService.schedule_refresh([instance.user_id])
 
 
 @receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, created, raw=False, **kwargs):
+    """Reporter la création ou le changement de statut dans les ventes du jour"""
+    if raw:
+        return
+    if created:
+        SalesRollupService.record_order(instance)
+    elif getattr(instance, "_rollup_state", None) is not None:
+        SalesRollupService.record_order(instance, instance._rollup_state)
+    # Sans état précédent connu, reconcile_sales_rollups corrige les agrégats
+    instance._rollup_state = instance.rollup_state()
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_sales_rollups(sender, instance, **kwargs):
+    """Retirer une commande supprimée des ventes du jour"""
+    SalesRollupService.remove_order(instance, getattr(instance, "_rollup_state", None))
+
+
+@receiver(post_save, sender=OrderItem)
+def update_line_sales_rollups(sender, instance, created, raw=False, **kwargs):
+    """Reporter l'ajout ou la modification d'un article de commande"""
+    if raw:
+        return
+    old_state = getattr(instance, "_rollup_state", None)
+    new_state = instance.rollup_state()
+    if created:
+        SalesRollupService.record_line(instance, new_line=new_state)
+    elif old_state is not None and old_state != new_state:
+        SalesRollupService.record_line(instance, old_state, new_state)
+    instance._rollup_state = new_state
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_line_from_sales_rollups(sender, instance, origin=None, **kwargs):
+    """Retirer un article de commande supprimé des ventes du jour"""
+    state = getattr(instance, "_rollup_state", None)
+    if state is None:
+        return
+    # Partagé par les articles supprimés par un même appel à delete()
+    removed = (
+        vars(origin).setdefault("_rollup_removed_lines", set())
+        if origin is not None
+        else None
+    )
+    SalesRollupService.record_line(instance, old_line=state, removed=removed)
+
+
+def snapshot_counter_state(sender, instance, **kwargs):
+    """Mémoriser les champs suivis par les compteurs d'administration"""
+    instance._counter_state = CounterService.state(instance)
+
+
+def update_admin_counters(sender, instance, created, raw=False, **kwargs):
+    """Reporter la création ou la modification dans les compteurs en cache"""
+    if raw:
+        return
+    CounterService.record_save(
+        instance, getattr(instance, "_counter_state", None), created
+    )
+    instance._counter_state = CounterService.state(instance)
+
+
+def refresh_counter_state(sender, instance, origin=None, **kwargs):
+    """Relire en base l'état de l'instance sur laquelle delete() est appelé.
+
+    Elle a pu être chargée avant une modification faite ailleurs ; les
+    instances supprimées en cascade viennent d'être lues par le collecteur.
+    """
+    if origin is instance:
+        instance._counter_state = CounterService.stored_state(instance)
+
+
+def remove_from_admin_counters(sender, instance, **kwargs):
+    """Retirer une instance supprimée des compteurs en cache"""
+    CounterService.record_delete(instance, getattr(instance, "_counter_state", None))
+
+
+for counted_model in CounterService.TRACKED_FIELDS:
+    post_init.connect(snapshot_counter_state, sender=counted_model)
+    post_save.connect(update_admin_counters, sender=counted_model)
+    pre_delete.connect(refresh_counter_state, sender=counted_model)
+    post_delete.connect(remove_from_admin_counters, sender=counted_model)
+
+
+@receiver(post_save, sender=Order)
+@deferred(sender=Order, fields=("status",))
 def handle_order_creation_and_status(sender, instance, created, **kwargs):
     """Gérer la création de commande et les changements de statut"""
     if created:
@@ -76,7 +212,9 @@ def handle_order_creation_and_status(sender, instance, created, **kwargs):
         if instance.status == "confirmed" and instance.confirmed_at:
             # Passer à en attente de paiement et créer la facture
             if not hasattr(instance, "invoice"):
-                Order.objects.filter(pk=instance.pk).update(status="awaiting_payment")
+                SalesRollupService.update_status(
+                    Order.objects.filter(pk=instance.pk), "awaiting_payment"
+                )
                 instance.refresh_from_db()
 
                 # Créer la facture
@@ -118,6 +256,7 @@ def handle_order_creation_and_status(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=PaymentProof)
+@deferred(fields=())
 def update_invoice_on_payment_proof(sender, instance, created, **kwargs):
     """Mettre à jour le statut de la facture lors du téléchargement de la preuve de paiement"""
     if created:
@@ -153,6 +292,7 @@ def update_invoice_on_payment_proof(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=PaymentProof)
+@deferred(sender=PaymentProof, fields=("verified", "rejection_reason"))
 def handle_payment_verification(sender, instance, created, **kwargs):
     """Gérer la vérification du paiement (approuver/rejeter)"""
     if not created and instance.verified:
@@ -211,6 +351,7 @@ def handle_payment_verification(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=Complaint)
+@deferred(sender=Complaint, fields=("status",))
 def notify_on_complaint(sender, instance, created, **kwargs):
     """Créer une notification lors de la création ou mise à jour d'une réclamation"""
     if created:
@@ -262,6 +403,7 @@ def notify_on_complaint(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=Refund)
+@deferred(fields=())
 def notify_on_refund(sender, instance, created, **kwargs):
     """Notifier l'utilisateur des changements de statut de remboursement"""
     if created:
@@ -287,6 +429,7 @@ def notify_on_refund(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=RefundProof)
+@deferred(fields=())
 def complete_refund_on_proof(sender, instance, created, **kwargs):
     """Finaliser le remboursement lors du téléchargement de la preuve"""
     if created:
@@ -0,0 +1,235 @@
+"""Deferred side effects for signal handlers.
+
+A ``post_save`` receiver decorated with ``@deferred`` does not run inside
+``save()``. The save records a ``DeferredTask`` row in the same transaction.
+Once that transaction commits, a small in-process thread pool runs the
+handler against a fresh copy of the instance. The handler's writes and the
+task's deletion commit together, so a crash either keeps the task for a
+retry or loses nothing. Long jobs that commit in chunks of their own use
+``@deferred(atomic=False)`` and must be safe to run again.
+``run_deferred_tasks`` picks up tasks that a stopped process never ran and
+retries failed ones with backoff.
+
+The handler sees the row as it is when the task runs, not as it was saved:
+by then a later save may have moved a status on, and a retried task runs
+again. Handlers that react to a transition therefore check the current
+state (``not hasattr(order, "invoice")`` before creating one, for example)
+instead of assuming the value that triggered them.
+"""
+
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_init
+from django.utils import timezone
+
+from .models import DeferredTask
+
+logger = logging.getLogger(__name__)
+
+# Seconds a started task is reserved before another runner may retry it
+LEASE_SECONDS = 300
+
+_handlers = {}
+_executor = None
+_executor_lock = threading.Lock()
+# Futures of the tasks submitted to the pool and not finished yet
+_pending = set()
+
+
+def deferred(handler=None, *, atomic=True, sender=None, fields=None):
+    """Run a ``post_save`` receiver after commit, off the request thread.
+
+    The handler is called later with ``sender``, a freshly loaded
+    ``instance`` and ``created``; it is skipped if the row no longer exists.
+    With ``atomic=False`` it runs outside of a transaction. Fixture loading
+    (``raw`` saves) enqueues nothing.
+
+    ``fields`` limits the task to saves that matter: an empty tuple to
+    creations only, field names (with the ``sender`` model) to creations and
+    saves that changed one of them since the instance was loaded or last
+    saved. Other saves cost no query at all.
+    """
+    if handler is None:
+        return functools.partial(deferred, atomic=atomic, sender=sender, fields=fields)
+
+    name = f"{handler.__module__}.{handler.__qualname__}"
+    _handlers[name] = (handler, atomic)
+    if fields:
+        post_init.connect(
+            functools.partial(_snapshot, name, fields),
+            sender=sender,
+            weak=False,
+            dispatch_uid=f"deferred:{name}",
+        )
+
+    @functools.wraps(handler)
+    def receiver(sender, instance, created=False, raw=False, **kwargs):
+        if raw:
+            return
+        changed = True
+        if fields:
+            states = instance.__dict__.setdefault("_deferred_state", {})
+            old_state, new_state = states.get(name), _state(instance, fields)
+            states[name] = new_state
+            changed = old_state is None or old_state != new_state
+        elif fields is not None:
+            changed = False
+        if created or changed:
+            enqueue(name, model=instance._meta.label, pk=instance.pk, created=created)
+
+    return receiver
+
+
+def _state(instance, fields):
+    """Values of ``fields``, or ``None`` if one of them is deferred"""
+    loaded = instance.__dict__
+    if not all(field in loaded for field in fields):
+        return None
+    return tuple(loaded[field] for field in fields)
+
+
+def _snapshot(name, fields, sender, instance, **kwargs):
+    instance.__dict__.setdefault("_deferred_state", {})[name] = _state(instance, fields)
+
+
+def enqueue(name, **payload):
+    """Record a task in the current transaction and start it after commit"""
+    task = DeferredTask.objects.create(handler=name, payload=payload)
+    transaction.on_commit(lambda: submit(task.pk))
+    return task
+
+
+def submit(task_id):
+    if getattr(settings, "DEFERRED_TASKS_EAGER", False):
+        run_task(task_id)
+    else:
+        future = get_executor().submit(_run_in_worker, task_id)
+        with _executor_lock:
+            _pending.add(future)
+        future.add_done_callback(_forget)
+
+
+def _forget(future):
+    with _executor_lock:
+        _pending.discard(future)
+
+
+def wait_for_pool(timeout=None):
+    """Block until the pool is idle, including tasks queued by its own tasks.
+
+    Returns ``False`` if tasks are still running after ``timeout`` seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        with _executor_lock:
+            futures = list(_pending)
+        if not futures:
+            return True
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        _, running = wait(futures, remaining)
+        if running:
+            return False
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "DEFERRED_TASKS_WORKERS", 2),
+                thread_name_prefix="deferred-task",
+            )
+        return _executor
+
+
+def _run_in_worker(task_id):
+    # Worker threads own their connections, like request threads do
+    close_old_connections()
+    try:
+        run_task(task_id)
+    except Exception:
+        logger.exception("Deferred task %s could not be run", task_id)
+    finally:
+        close_old_connections()
+
+
+def run_task(task_id):
+    """Claim and run one due task.
+
+    Returns ``True`` on success, ``False`` on failure and ``None`` when the
+    task is not due or another runner already holds it.
+    """
+    now = timezone.now()
+    claimed = DeferredTask.objects.filter(
+        pk=task_id, status="pending", next_attempt_at__lte=now
+    ).update(
+        attempts=F("attempts") + 1,
+        next_attempt_at=now + timedelta(seconds=LEASE_SECONDS),
+    )
+    if not claimed:
+        return None
+
+    task = DeferredTask.objects.get(pk=task_id)
+    try:
+        if task.handler not in _handlers:
+            raise LookupError(f"Unknown deferred handler {task.handler}")
+        handler, atomic = _handlers[task.handler]
+        with transaction.atomic() if atomic else nullcontext():
+            _execute(handler, task)
+            task.delete()
+        return True
+    except Exception as e:
+        logger.exception("Deferred task %s (%s) failed", task.pk, task.handler)
+        max_attempts = getattr(settings, "DEFERRED_TASKS_MAX_ATTEMPTS", 5)
+        backoff = getattr(settings, "DEFERRED_TASKS_BACKOFF_SECONDS", 30)
+        if task.attempts >= max_attempts:
+            task.status = "failed"
+        else:
+            task.next_attempt_at = timezone.now() + timedelta(
+                seconds=backoff * 2 ** (task.attempts - 1)
+            )
+        task.last_error = f"{type(e).__name__}: {e}"[:2000]
+        # The row may already be gone if another runner finished the task
+        DeferredTask.objects.filter(pk=task.pk).update(
+            status=task.status,
+            next_attempt_at=task.next_attempt_at,
+            last_error=task.last_error,
+        )
+        return False
+
+
+def _execute(handler, task):
+    model = apps.get_model(task.payload["model"])
+    instance = model.objects.filter(pk=task.payload["pk"]).first()
+    if instance is None:
+        return
+    handler(sender=model, instance=instance, created=task.payload["created"])
+
+
+def run_due_tasks(batch_size=100):
+    """Run the tasks that are due in this thread; returns ``(done, failed)``"""
+    ids = list(
+        DeferredTask.objects.filter(
+            status="pending", next_attempt_at__lte=timezone.now()
+        )
+        .order_by("id")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    done = failed = 0
+    for task_id in ids:
+        result = run_task(task_id)
+        if result is True:
+            done += 1
+        elif result is False:
+            failed += 1
+    return done, failed
@@ -0,0 +1,83 @@
+"""Small fixture builders shared by the payments tests"""
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from accounts.models import UserProfile
+from payments.models import Order, OrderItem
+from products.models import Brand, Category, Product, ProductVariant
+
+
+def make_user(username, user_type="general", **fields):
+    # No password: hashing one takes longer than the rest of most tests
+    user = User.objects.create_user(username, f"{username}@example.com", **fields)
+    UserProfile.objects.create(user=user, user_type=user_type)
+    return user
+
+
+def make_product(sku, price="1000", stock=10, category=None, **fields):
+    brand, _ = Brand.objects.get_or_create(name="Marque")
+    if category is None:
+        category, _ = Category.objects.get_or_create(
+            slug="categorie", defaults={"name": "Catégorie"}
+        )
+    product = Product.objects.create(
+        name=f"Produit {sku}",
+        slug=sku.lower(),
+        sku=sku,
+        brand=brand,
+        description="-",
+        short_description="-",
+        price=Decimal(price),
+        stock_quantity=stock,
+        **fields,
+    )
+    product.categories.add(category)
+    return product
+
+
+def make_variant(product, value, price="1000", stock=10, **fields):
+    return ProductVariant.objects.create(
+        product=product,
+        variant_title="Taille",
+        variant_value=value,
+        retail_price=Decimal(price),
+        stock_quantity=stock,
+        **fields,
+    )
+
+
+def make_order(user, lines=(), status="pending_confirmation", **fields):
+    """An order with one item per ``(product, variant, quantity)`` line.
+
+    Items are saved one by one so that their signals run.
+    """
+    prices = [
+        variant.get_total_price() if variant else product.price
+        for product, variant, _ in lines
+    ]
+    total = sum(
+        (price * quantity for price, (_, _, quantity) in zip(prices, lines)),
+        Decimal("0"),
+    )
+    order = Order.objects.create(
+        user=user,
+        status=status,
+        shipping_address="1 rue Didouche Mourad",
+        shipping_city="Alger",
+        shipping_state="Alger",
+        shipping_zip="16000",
+        subtotal=total,
+        total_amount=total,
+        **fields,
+    )
+    for price, (product, variant, quantity) in zip(prices, lines):
+        OrderItem.objects.create(
+            order=order,
+            product=product,
+            variant=variant,
+            quantity=quantity,
+            price=price,
+        )
+    return order
@@ -0,0 +1,233 @@
+from decimal import Decimal
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.test import TestCase
+
+from payments.models import Cart, CartItem
+from payments.services import CartService
+
+from .factories import make_order, make_product, make_user, make_variant
+
+
+class ApplyOperationsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("client")
+        self.cart = Cart.objects.create(user=self.user)
+        self.gloves = make_product("GANTS", price="500", stock=10)
+        self.masks = make_product("MASQUES", price="200", stock=3)
+        self.scale = make_product("BALANCE", price="9000", stock=5)
+        self.line = CartItem.objects.create(
+            cart=self.cart, product=self.gloves, quantity=2
+        )
+
+    def quantities(self):
+        return dict(self.cart.items.values_list("product__sku", "quantity"))
+
+    def test_mixed_batch_applies_valid_operations_only(self):
+        outcome = CartService.apply_operations(
+            self.user,
+            [
+                {"cart_item_id": self.line.pk, "quantity": 4},
+                {"product_id": self.masks.pk, "quantity": 5},
+                {"sku": "BALANCE", "quantity": 1, "mode": "add"},
+                {"sku": "INCONNU", "quantity": 1},
+                {"quantity": 1},
+            ],
+        )
+
+        results = outcome["results"]
+        self.assertEqual(
+            [result["success"] for result in results],
+            [True, False, True, False, False],
+        )
+        self.assertEqual(
+            results[1]["message"], "Stock insuffisant. Seulement 3 disponible(s)"
+        )
+        self.assertEqual(results[3]["message"], "Produit non trouvé")
+        self.assertEqual(self.quantities(), {"GANTS": 4, "BALANCE": 1})
+        self.assertEqual(outcome["cart_count"], 5)
+        self.assertEqual(outcome["cart_total"], Decimal("11000"))
+
+    def test_add_over_stock_keeps_the_line(self):
+        outcome = CartService.apply_operations(
+            self.user, [{"cart_item_id": self.line.pk, "quantity": 9, "mode": "add"}]
+        )
+
+        self.assertFalse(outcome["results"][0]["success"])
+        self.assertEqual(
+            outcome["results"][0]["message"],
+            "Impossible d'ajouter 9. Stock maximum: 10",
+        )
+        self.assertEqual(self.quantities(), {"GANTS": 2})
+
+    def test_operations_on_one_line_are_cumulative(self):
+        # Checked against the quantity left by the previous operations of the
+        # batch, not the one stored before it
+        outcome = CartService.apply_operations(
+            self.user,
+            [
+                {"product_id": self.masks.pk, "quantity": 2, "mode": "add"},
+                {"product_id": self.masks.pk, "quantity": 2, "mode": "add"},
+                {"product_id": self.masks.pk, "quantity": 1, "mode": "add"},
+            ],
+        )
+
+        self.assertEqual(
+            [result["success"] for result in outcome["results"]], [True, False, True]
+        )
+        self.assertEqual(self.quantities(), {"GANTS": 2, "MASQUES": 3})
+
+    def test_zero_quantity_removes_the_line(self):
+        outcome = CartService.apply_operations(
+            self.user, [{"cart_item_id": self.line.pk, "quantity": 0}]
+        )
+
+        self.assertTrue(outcome["results"][0]["success"])
+        self.assertIsNone(outcome["results"][0]["cart_item_id"])
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual(outcome["cart_total"], Decimal("0"))
+
+    def test_cheapest_variant_in_stock_is_selected(self):
+        make_variant(self.scale, "XL", price="100", stock=0)
+        make_variant(self.scale, "M", price="300", stock=4)
+        make_variant(self.scale, "L", price="200", stock=4, is_active=False)
+
+        outcome = CartService.apply_operations(
+            self.user, [{"product_id": self.scale.pk, "quantity": 1}]
+        )
+
+        self.assertEqual(outcome["results"][0]["auto_selected_variant"], "M")
+        self.assertEqual(
+            self.cart.items.get(product=self.scale).variant.variant_value, "M"
+        )
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        products = [make_product(f"LOT-{i}", stock=5) for i in range(20)]
+        operations = [{"product_id": product.pk, "quantity": 1} for product in products]
+
+        # Cart, lines, products, variants, then one bulk_create in a savepoint
+        with self.assertNumQueries(7):
+            CartService.apply_operations(self.user, operations)
+        self.assertEqual(self.cart.items.count(), 21)
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("pharmacie", user_type="pharmacy")
+        self.gloves = make_product("GANTS", stock=10)
+        self.masks = make_product("MASQUES", stock=0)
+        self.scale = make_product("BALANCE", stock=5)
+        self.old_size = make_variant(self.scale, "S", stock=5, is_active=False)
+        self.order = make_order(
+            self.user,
+            [
+                (self.gloves, None, 3),
+                (self.masks, None, 2),
+                (self.scale, self.old_size, 1),
+            ],
+            status="delivered",
+        )
+
+    def test_unavailable_lines_are_reported_and_the_rest_added(self):
+        outcome = CartService.reorder(self.user, self.order)
+
+        results = outcome["results"]
+        self.assertEqual(
+            [result["success"] for result in results], [True, False, False]
+        )
+        self.assertEqual(
+            results[1]["message"], "Stock insuffisant. Seulement 0 disponible(s)"
+        )
+        self.assertEqual(results[2]["message"], "Variante non disponible")
+        self.assertEqual(
+            list(outcome["cart"].items.values_list("product__sku", "quantity")),
+            [("GANTS", 3)],
+        )
+
+    def test_reorder_adds_to_the_current_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.gloves, quantity=8)
+
+        outcome = CartService.reorder(self.user, self.order)
+
+        self.assertEqual(
+            outcome["results"][0]["message"],
+            "Impossible d'ajouter 3. Stock maximum: 10",
+        )
+        self.assertEqual(cart.items.get(product=self.gloves).quantity, 8)
+
+
+class ImportCsvTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("clinique", user_type="clinic")
+        self.gloves = make_product("GANTS", stock=10)
+        self.scale = make_product("BALANCE", stock=5)
+        make_variant(self.scale, "M", stock=5)
+
+    def upload(self, content):
+        return SimpleUploadedFile("panier.csv", content.encode(), "text/csv")
+
+    def test_report_covers_every_line(self):
+        outcome = CartService.import_csv(
+            self.user,
+            self.upload(
+                "Référence;Variante;Quantité\n"
+                "GANTS;;4\n"
+                "INCONNU;;1\n"
+                "BALANCE;XXL;1\n"
+                "BALANCE;;0\n"
+                "BALANCE;;-2\n"
+                "BALANCE;m;2\n"
+            ),
+        )
+
+        report = outcome["report"]
+        self.assertEqual([line["line"] for line in report], [2, 3, 4, 5, 6, 7])
+        self.assertEqual(
+            [(line["success"], line["message"]) for line in report],
+            [
+                (True, ""),
+                (False, "Produit non trouvé"),
+                (False, "Variante non trouvée"),
+                (False, "La quantité doit être au moins 1"),
+                (False, "La quantité doit être au moins 1"),
+                (True, ""),
+            ],
+        )
+        self.assertEqual(report[5]["variant"], "m")
+        self.assertEqual(
+            dict(outcome["cart"].items.values_list("product__sku", "quantity")),
+            {"GANTS": 4, "BALANCE": 2},
+        )
+
+    def test_missing_sku_column_is_rejected(self):
+        with self.assertRaisesMessage(
+            ValueError, "Colonne « sku » introuvable dans l'en-tête"
+        ):
+            CartService.import_csv(
+                self.user, self.upload("produit,quantite\nGANTS,1\n")
+            )
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_empty_and_non_utf8_files_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, "Le fichier est vide"):
+            CartService.import_csv(self.user, self.upload(""))
+        with self.assertRaisesMessage(ValueError, "encodé en UTF-8"):
+            CartService.import_csv(
+                self.user,
+                SimpleUploadedFile("panier.csv", "sku\nGANTS\né".encode("latin-1")),
+            )
+
+    def test_line_limit(self):
+        rows = "".join("GANTS,1\n" for _ in range(CartService.MAX_IMPORT_LINES + 1))
+        with self.assertRaisesMessage(ValueError, "Maximum 1000 lignes par fichier"):
+            CartService.import_csv(self.user, self.upload("sku,qty\n" + rows))
+
+    def test_quantity_defaults_to_one(self):
+        outcome = CartService.import_csv(self.user, self.upload("sku\nGANTS\n"))
+        self.assertEqual(outcome["report"][0]["quantity"], 1)
+        self.assertEqual(outcome["cart"].items.get().quantity, 1)
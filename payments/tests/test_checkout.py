@@ -0,0 +1,156 @@
+import threading
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+
+from pages.models import SiteInformation
+from payments.models import Cart, CartItem, Order, ShippingType
+from payments.services import InsufficientStock, OrderService
+from products.models import Brand, Category, Product, ProductVariant
+
+from .factories import make_product, make_user, make_variant
+
+
+@override_settings(DEFERRED_TASKS_EAGER=True)
+class CheckoutIdempotencyTests(TransactionTestCase):
+    def setUp(self):
+        # Cached staff ids from earlier tests point at rolled back users
+        cache.clear()
+        # Saved, as in a real install: a fresh instance keeps a float TVA rate
+        SiteInformation.objects.create()
+        brand = Brand.objects.create(name="Marque")
+        category = Category.objects.create(name="Catégorie", slug="categorie")
+        self.product = Product.objects.create(
+            name="Tensiomètre",
+            slug="tensiometre",
+            sku="TENS-1",
+            brand=brand,
+            description="-",
+            short_description="-",
+            price=Decimal("1000"),
+            stock_quantity=10,
+        )
+        self.product.categories.add(category)
+        self.shipping_type = ShippingType.objects.create(
+            name="Standard", estimated_days=3, cost=Decimal("500")
+        )
+        self.user = User.objects.create_user("client", "client@example.com", "-")
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+
+    def test_concurrent_duplicate_submissions_create_one_order(self):
+        data = {
+            "idempotency_key": str(uuid.uuid4()),
+            "shipping_type": self.shipping_type.pk,
+            "shipping_address": "1 rue Didouche Mourad",
+            "shipping_city": "Alger",
+            "shipping_state": "Alger",
+            "shipping_zip": "16000",
+        }
+        barrier = threading.Barrier(2)
+        responses, errors = [], []
+
+        def submit():
+            client = Client()
+            client.force_login(self.user)
+            try:
+                barrier.wait()
+                responses.append(client.post("/payments/checkout/", data))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([response.status_code for response in responses], [302, 302])
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 8)
+
+
+class CreateOrderFromCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("clinique", user_type="clinic")
+        self.cart = Cart.objects.create(user=self.user)
+        self.gloves = make_product("GANTS", stock=10)
+        self.masks = make_product("MASQUES", stock=1)
+        self.scale = make_product("BALANCE", stock=50)
+        self.large = make_variant(self.scale, "L", stock=2)
+        self.small = make_variant(self.scale, "S", stock=9)
+        self.shipping_data = {
+            "shipping_type": ShippingType.objects.create(
+                name="Standard", estimated_days=3, cost=Decimal("500")
+            ),
+            "shipping_address": "1 rue Didouche Mourad",
+            "shipping_city": "Alger",
+            "shipping_state": "Alger",
+            "shipping_zip": "16000",
+        }
+
+    def add(self, product, quantity, variant=None):
+        return CartItem.objects.create(
+            cart=self.cart, product=product, variant=variant, quantity=quantity
+        )
+
+    def stock(self):
+        return dict(Product.objects.values_list("sku", "stock_quantity")), dict(
+            ProductVariant.objects.values_list("variant_value", "stock_quantity")
+        )
+
+    def test_every_short_line_is_reported_and_nothing_is_written(self):
+        self.add(self.gloves, 4)
+        short_masks = self.add(self.masks, 3)
+        short_large = self.add(self.scale, 5, self.large)
+        self.add(self.scale, 1, self.small)
+        before = self.stock()
+
+        with self.assertRaises(InsufficientStock) as raised:
+            OrderService.create_order_from_cart(
+                self.user, self.cart, self.shipping_data, tva_rate=Decimal("0.19")
+            )
+
+        self.assertEqual(
+            sorted(
+                (
+                    shortfall["cart_item_id"],
+                    shortfall["requested"],
+                    shortfall["available"],
+                )
+                for shortfall in raised.exception.shortfalls
+            ),
+            [(short_masks.pk, 3, 1), (short_large.pk, 5, 2)],
+        )
+        self.assertEqual(self.stock(), before)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 4)
+
+    def test_stock_is_taken_from_products_and_variants(self):
+        self.add(self.gloves, 4)
+        self.add(self.masks, 1)
+        self.add(self.scale, 2, self.large)
+        self.add(self.scale, 3, self.small)
+
+        order = OrderService.create_order_from_cart(
+            self.user, self.cart, self.shipping_data, tva_rate=Decimal("0.19")
+        )
+
+        self.assertEqual(order.items.count(), 4)
+        self.assertEqual(
+            self.stock(),
+            (
+                {"GANTS": 6, "MASQUES": 0, "BALANCE": 50},
+                {"L": 0, "S": 6},
+            ),
+        )
+        self.assertFalse(self.cart.items.exists())
@@ -0,0 +1,127 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from payments.models import Complaint, Invoice, Refund
+from payments.services import CounterService
+
+from .factories import make_order, make_product, make_user
+
+
+class CounterServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("client")
+        self.order = make_order(self.user, [(make_product("GANTS"), None, 1)])
+        self.complaint = Complaint.objects.create(
+            user=self.user, order=self.order, description="-"
+        )
+        # Cached from here on, moved by the signals
+        CounterService.get_counters()
+
+    def assertInStep(self):
+        cached = CounterService.get_counters()
+        del cached["pending_total"]
+        self.assertEqual(cached, CounterService.recount())
+
+    def change(self, instance, **fields):
+        for field, value in fields.items():
+            setattr(instance, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save()
+
+    def delete(self, instance):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.delete()
+
+    def test_counters_are_served_from_the_cache(self):
+        with self.assertNumQueries(0):
+            counters = CounterService.get_counters()
+        self.assertEqual(counters["open_complaints"], 1)
+        self.assertEqual(counters["total_orders"], 1)
+        self.assertEqual(counters["pending_total"], 1)
+
+    def test_creation_and_status_changes(self):
+        invoice = Invoice.objects.create(
+            order=self.order,
+            subtotal=Decimal("1000"),
+            tax_amount=Decimal("0"),
+            total_amount=Decimal("1000"),
+        )
+        refund = Refund(
+            order=self.order,
+            invoice=invoice,
+            amount=Decimal("500"),
+            refund_method="ccp",
+            reason="-",
+        )
+        self.change(refund)
+        self.assertEqual(CounterService.get_counters()["pending_refunds"], 1)
+
+        self.change(self.complaint, status="in_review")
+        self.change(refund, status="refund_completed")
+        counters = CounterService.get_counters()
+        self.assertEqual(
+            (counters["open_complaints"], counters["pending_refunds"]), (0, 0)
+        )
+        self.assertInStep()
+
+        self.change(self.complaint, status="open")
+        self.assertEqual(CounterService.get_counters()["open_complaints"], 1)
+        self.assertInStep()
+
+    def test_status_change_then_delete(self):
+        self.change(self.complaint, status="resolved")
+        self.delete(self.complaint)
+
+        self.assertEqual(CounterService.get_counters()["open_complaints"], 0)
+        self.assertInStep()
+
+    def test_delete_through_an_instance_loaded_before_the_change(self):
+        stale = Complaint.objects.get(pk=self.complaint.pk)
+        self.change(self.complaint, status="resolved")
+
+        self.delete(stale)
+
+        self.assertEqual(CounterService.get_counters()["open_complaints"], 0)
+        self.assertInStep()
+
+    def test_deferred_fields_drop_the_counters(self):
+        complaint = Complaint.objects.only("id", "user", "order").get()
+        complaint.status = "rejected"
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint.save()
+
+        self.assertNotIn(CounterService.cache_key("open_complaints"), cache)
+        self.assertInStep()
+
+    def test_cascade_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_order(self.user)
+            other = make_user("autre")
+        self.change(other, is_active=False)
+
+        self.delete(self.user)
+
+        counters = CounterService.get_counters()
+        self.assertEqual(
+            (
+                counters["total_users"],
+                counters["pending_approvals"],
+                counters["total_orders"],
+                counters["open_complaints"],
+            ),
+            (1, 1, 0, 0),
+        )
+        self.assertInStep()
+
+    def test_bulk_updates_are_caught_up_by_invalidate(self):
+        Complaint.objects.update(status="resolved")
+        self.assertEqual(CounterService.get_counters()["open_complaints"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CounterService.invalidate(Complaint)
+
+        self.assertEqual(CounterService.get_counters()["open_complaints"], 0)
+        self.assertEqual(CounterService.get_counters()["total_orders"], 1)
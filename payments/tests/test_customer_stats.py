@@ -0,0 +1,168 @@
+import importlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from payments.models import CustomerStats, Order
+from payments.services import CustomerStatsService, SalesRollupService
+
+from .factories import make_order, make_product, make_user
+
+
+class CustomerStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("client")
+        self.product = make_product("GANTS", price="100")
+
+    def order(self, user, quantity, status="paid", days_ago=0):
+        """An order of ``quantity`` × 100 DZD, its stats refreshed on commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            order = make_order(user, [(self.product, None, quantity)], status=status)
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(
+                created_at=timezone.now() - timedelta(days=days_ago)
+            )
+            CustomerStatsService.refresh([user.pk])
+        return order
+
+    def stats(self, user=None):
+        return (
+            CustomerStats.objects.filter(user=user or self.user)
+            .values(
+                "order_count", "paid_order_count", "total_spent", "average_order_value"
+            )
+            .first()
+        )
+
+    def test_rows_follow_order_changes(self):
+        pending = self.order(self.user, 3, status="pending_confirmation")
+        self.assertEqual(
+            self.stats(),
+            {
+                "order_count": 1,
+                "paid_order_count": 0,
+                "total_spent": Decimal("0"),
+                "average_order_value": Decimal("0"),
+            },
+        )
+
+        self.order(self.user, 1)
+        pending.status = "paid"
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.save()
+        self.assertEqual(
+            self.stats(),
+            {
+                "order_count": 2,
+                "paid_order_count": 2,
+                "total_spent": Decimal("400"),
+                "average_order_value": Decimal("200"),
+            },
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesRollupService.update_status(
+                Order.objects.filter(pk=pending.pk), "cancelled"
+            )
+        self.assertEqual(self.stats()["total_spent"], Decimal("100"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(user=self.user).delete()
+        self.assertIsNone(self.stats())
+
+    def test_unrelated_saves_do_not_refresh(self):
+        order = self.order(self.user, 1)
+        order.tracking_number = "TRK-1"
+        with self.captureOnCommitCallbacks() as callbacks:
+            order.save()
+        self.assertEqual(callbacks, [])
+
+    def test_rfm_scores_top_customers_and_segments(self):
+        # Five customers, each better than the previous on every axis
+        users = [self.user] + [
+            make_user(f"client{i}", user_type="pharmacy" if i % 2 else "clinic")
+            for i in range(1, 5)
+        ]
+        for rank, user in enumerate(users):
+            for _ in range(rank + 1):
+                self.order(user, rank + 1, days_ago=10 - 2 * rank)
+
+        self.assertEqual(CustomerStatsService.score(), 5)
+
+        top = CustomerStatsService.get_top_customers(limit=3)
+        self.assertEqual(
+            [(row["user__username"], row["total_spent"]) for row in top],
+            [
+                ("client4", Decimal("2500")),
+                ("client3", Decimal("1600")),
+                ("client2", Decimal("900")),
+            ],
+        )
+        self.assertEqual(
+            [
+                (row["recency_score"], row["frequency_score"], row["monetary_score"])
+                for row in top
+            ],
+            [(5, 5, 5), (4, 4, 4), (3, 3, 3)],
+        )
+        self.assertEqual(CustomerStats.objects.get(user=self.user).rfm_score, "111")
+
+        self.assertEqual(
+            [
+                (
+                    row["user_type"],
+                    row["customers"],
+                    row["orders"],
+                    row["revenue"],
+                    row["average_order_value"],
+                )
+                for row in CustomerStatsService.get_segments()
+            ],
+            [
+                ("clinic", 2, 8, Decimal("3400"), Decimal("425")),
+                ("pharmacy", 2, 6, Decimal("2000"), Decimal("2000") / 6),
+                ("general", 1, 1, Decimal("100"), Decimal("100")),
+            ],
+        )
+
+    def test_customers_who_stopped_paying_lose_their_scores(self):
+        order = self.order(self.user, 1)
+        CustomerStatsService.score()
+        self.assertEqual(CustomerStats.objects.get().rfm_score, "111")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesRollupService.update_status(
+                Order.objects.filter(pk=order.pk), "cancelled"
+            )
+        CustomerStatsService.score()
+
+        self.assertEqual(CustomerStats.objects.get().rfm_score, "")
+
+    def test_backfill_migration(self):
+        self.order(self.user, 2)
+        self.order(self.user, 1, status="pending_confirmation")
+        other = make_user("autre")
+        self.order(other, 5)
+        rows = CustomerStats.objects.order_by("user").values_list(
+            "user",
+            "order_count",
+            "paid_order_count",
+            "total_spent",
+            "average_order_value",
+            "first_order_at",
+            "last_order_at",
+        )
+        expected = list(rows)
+        CustomerStats.objects.filter(user=other).delete()
+
+        migration = importlib.import_module(
+            "payments.migrations.0018_backfill_customer_stats"
+        )
+        migration.build_customer_stats(apps, None)
+
+        self.assertEqual(list(rows.all()), expected)
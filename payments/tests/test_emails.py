@@ -0,0 +1,85 @@
+import os
+import tempfile
+from copy import deepcopy
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils.autoreload import file_changed
+
+from payments.services import EmailTemplateService
+
+
+class EmailTemplateCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        os.makedirs(os.path.join(self.directory, "emails", "fr"))
+        templates = deepcopy(settings.TEMPLATES)
+        templates[0]["DIRS"] = [self.directory, *templates[0]["DIRS"]]
+        self.enterContext(override_settings(TEMPLATES=templates))
+        EmailTemplateService.clear_cache()
+        self.addCleanup(EmailTemplateService.clear_cache)
+
+    def write(self, name, source):
+        path = Path(self.directory, "emails", name)
+        path.write_text(source)
+        return path
+
+    def render_batch(self, names, language="en"):
+        return EmailTemplateService.render_batch(
+            "emails/rappel.html",
+            [{"name": name} for name in names],
+            shared={"order": "CMD-1"},
+            language=language,
+        )
+
+    def test_batch_shares_the_template_and_context(self):
+        self.write("rappel.html", "<p>Bonjour {{ name }}, commande {{ order }}</p>")
+
+        self.assertEqual(
+            self.render_batch(["Amina", "<b>Yacine</b>"]),
+            [
+                (
+                    "<p>Bonjour Amina, commande CMD-1</p>",
+                    "Bonjour Amina, commande CMD-1",
+                ),
+                (
+                    "<p>Bonjour &lt;b&gt;Yacine&lt;/b&gt;, commande CMD-1</p>",
+                    "Bonjour <b>Yacine</b>, commande CMD-1",
+                ),
+            ],
+        )
+
+    def test_saved_template_replaces_the_cached_one(self):
+        path = self.write("rappel.html", "<p>Bonjour {{ name }}</p>")
+        self.assertEqual(self.render_batch(["Amina"])[0][1], "Bonjour Amina")
+
+        self.write("rappel.html", "<p>Salut {{ name }}</p>")
+        # Compiled once: the file is not read again on each render
+        self.assertEqual(self.render_batch(["Amina"])[0][1], "Bonjour Amina")
+
+        # What the autoreloader sends when a template file is saved
+        file_changed.send(sender=None, file_path=path)
+        self.assertEqual(self.render_batch(["Amina"])[0][1], "Salut Amina")
+
+    def test_language_variant_and_text_part(self):
+        self.write("rappel.html", "<p>Hello {{ name }}</p>")
+        self.write("fr/rappel.html", '<p>Bonjour <a href="/suivi/">{{ name }}</a></p>')
+        self.write("fr/rappel.txt", "Bonjour {{ name }} (texte)")
+
+        self.assertEqual(self.render_batch(["Amina"], "en")[0][1], "Hello Amina")
+        self.assertEqual(
+            self.render_batch(["Amina"], "fr-dz")[0],
+            ('<p>Bonjour <a href="/suivi/">Amina</a></p>', "Bonjour Amina (texte)"),
+        )
+
+    def test_text_part_keeps_links(self):
+        self.write("rappel.html", '<p>Suivre <a href="/suivi/{{ order }}/">ici</a></p>')
+
+        self.assertEqual(
+            self.render_batch(["Amina"])[0][1], "Suivre ici (/suivi/CMD-1/)"
+        )
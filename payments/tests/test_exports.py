@@ -0,0 +1,40 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from payments.exports import STALE_SECONDS, claim_next_job, run_job
+from payments.models import ReportExportJob
+
+
+class ReportExportTakeoverTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.export_dir = os.path.join(media_root.name, "report_exports")
+        today = timezone.localdate()
+        ReportExportJob.objects.create(
+            kind="orders", file_format="csv", date_from=today, date_to=today
+        )
+
+    def test_superseded_worker_stops(self):
+        stalled = claim_next_job()
+        ReportExportJob.objects.filter(pk=stalled.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=STALE_SECONDS + 1)
+        )
+        current = claim_next_job()
+        self.assertEqual(current.pk, stalled.pk)
+
+        self.assertFalse(run_job(stalled))
+        job = ReportExportJob.objects.get(pk=current.pk)
+        self.assertEqual(job.status, "running")
+        self.assertEqual(job.started_at, current.started_at)
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+        self.assertTrue(run_job(current))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual(os.listdir(self.export_dir), [os.path.basename(job.file.name)])
@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from payments.models import OutgoingEmail
+from payments.services import MailService
+
+
+class RejectingBackend(EmailBackend):
+    """Delivers to the test outbox but refuses addresses at rejet.example.com"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(address.endswith("@rejet.example.com") for address in message.to):
+                raise ConnectionError("550 destinataire refusé")
+        return super().send_messages(messages)
+
+
+class UnreachableBackend(BaseEmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("serveur SMTP injoignable")
+
+
+@override_settings(
+    EMAIL_BACKEND="payments.tests.test_mail.RejectingBackend",
+    MAIL_OUTBOX_MAX_ATTEMPTS=3,
+    MAIL_OUTBOX_BACKOFF_SECONDS=60,
+)
+class MailOutboxTests(TestCase):
+    def make_due(self):
+        OutgoingEmail.objects.filter(status="pending").update(
+            next_attempt_at=timezone.now()
+        )
+
+    def test_rolled_back_transaction_queues_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                MailService.enqueue("Commande", "-", ["client@example.com"])
+                raise RuntimeError("checkout annulé")
+
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(MailService.deliver_batch(), (0, 0))
+
+    def test_enqueue_many_writes_one_row_per_address(self):
+        emails = MailService.enqueue_many(
+            "Promotion", "-", ["a@example.com", "", "b@example.com", "a@example.com"]
+        )
+        self.assertEqual(
+            [email.recipients for email in emails],
+            [["a@example.com"], ["b@example.com"]],
+        )
+        self.assertIsNone(MailService.enqueue("Promotion", "-", ["", None]))
+
+    def test_failed_email_is_retried_with_backoff(self):
+        MailService.enqueue("Commande", "-", ["client@example.com"])
+        rejected = MailService.enqueue("Commande", "-", ["x@rejet.example.com"])
+
+        before = timezone.now()
+        self.assertEqual(MailService.deliver_batch(), (1, 1))
+        self.assertEqual(
+            [message.to for message in mail.outbox], [["client@example.com"]]
+        )
+
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.status, "pending")
+        self.assertEqual(rejected.attempts, 1)
+        self.assertIn("550 destinataire refusé", rejected.last_error)
+        self.assertGreaterEqual(
+            rejected.next_attempt_at, before + timedelta(seconds=60)
+        )
+        # Not due yet
+        self.assertEqual(MailService.deliver_batch(), (0, 0))
+
+        self.make_due()
+        MailService.deliver_batch()
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.attempts, 2)
+        self.assertGreaterEqual(
+            rejected.next_attempt_at, timezone.now() + timedelta(seconds=110)
+        )
+
+    def test_email_is_dead_lettered_after_max_attempts(self):
+        rejected = MailService.enqueue("Commande", "-", ["x@rejet.example.com"])
+
+        for _ in range(3):
+            self.make_due()
+            self.assertEqual(MailService.deliver_batch(), (0, 1))
+
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.status, "dead")
+        self.assertEqual(rejected.attempts, 3)
+        self.make_due()
+        self.assertEqual(MailService.deliver_batch(), (0, 0))
+
+    def test_claimed_emails_are_skipped_until_the_lease_expires(self):
+        MailService.enqueue("Commande", "-", ["client@example.com"])
+
+        self.assertEqual(len(MailService.claim_batch(10)), 1)
+        self.assertEqual(MailService.claim_batch(10), [])
+        self.make_due()
+        self.assertEqual(len(MailService.claim_batch(10)), 1)
+
+    @override_settings(EMAIL_BACKEND="payments.tests.test_mail.UnreachableBackend")
+    def test_unreachable_backend_fails_the_whole_batch(self):
+        MailService.enqueue("Commande", "-", ["a@example.com"])
+        MailService.enqueue("Commande", "-", ["b@example.com"])
+
+        self.assertEqual(MailService.deliver_batch(), (0, 2))
+        self.assertEqual(
+            list(OutgoingEmail.objects.values_list("status", "attempts")),
+            [("pending", 1), ("pending", 1)],
+        )
@@ -0,0 +1,364 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from payments.models import (
+    Notification,
+    NotificationArchive,
+    NotificationCounter,
+    NotificationPreference,
+    OutgoingEmail,
+)
+from payments.services import NotificationService
+
+from .factories import make_user
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("client", "client@example.com", "-")
+        self.client.force_login(self.user)
+
+    def test_disabled_stream_returns_no_content(self):
+        response = self.client.get("/payments/notifications/stream/")
+        self.assertEqual(response.status_code, 204)
+
+    @override_settings(NOTIFICATION_STREAM_ENABLED=True)
+    def test_stream_is_not_served_under_wsgi(self):
+        # The test client goes through the WSGI handler, like runserver
+        response = self.client.get("/payments/notifications/stream/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+
+    def test_dashboard_does_not_connect_when_disabled(self):
+        self.client.force_login(self.staff_user())
+        response = self.client.get("/accounts/admin/dashboard/")
+        self.assertContains(response, 'id="notificationsBadge"')
+        self.assertNotContains(response, "new EventSource(")
+
+    @override_settings(NOTIFICATION_STREAM_ENABLED=True)
+    def test_dashboard_connects_when_enabled(self):
+        self.client.force_login(self.staff_user())
+        response = self.client.get("/accounts/admin/dashboard/")
+        self.assertContains(response, "new EventSource(")
+
+    def staff_user(self):
+        # The notifications dropdown is part of the admin dashboard
+        return User.objects.create_superuser("admin", "admin@example.com", "-")
+
+
+class NotifyStaffTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instant = make_user("admin", is_staff=True)
+        self.digest = make_user("gerant", is_staff=True)
+        make_user("ancien", is_staff=True, is_active=False)
+        self.customer = make_user("client")
+        NotificationPreference.objects.create(
+            user=self.digest, notification_type="order_created", delivery="daily"
+        )
+        self.clear_notifications()
+
+    def clear_notifications(self):
+        # Creating users notifies the staff already registered
+        Notification.objects.all().delete()
+        OutgoingEmail.objects.all().delete()
+        NotificationService.recount_unread(User.objects.values_list("id", flat=True))
+
+    def test_fan_out_respects_delivery_preferences(self):
+        notifications = NotificationService.notify_staff(
+            "order_created", "Nouvelle commande", "CMD-1"
+        )
+
+        self.assertEqual(
+            sorted((n.user_id, n.digest_pending) for n in notifications),
+            [(self.instant.pk, False), (self.digest.pk, True)],
+        )
+        self.assertEqual(
+            list(OutgoingEmail.objects.values_list("recipients", flat=True)),
+            [["admin@example.com"]],
+        )
+        self.assertEqual(
+            dict(
+                NotificationCounter.objects.exclude(user__is_active=False).values_list(
+                    "user_id", "unread_count"
+                )
+            ),
+            {self.instant.pk: 1, self.digest.pk: 1, self.customer.pk: 0},
+        )
+
+    def test_preferences_only_apply_to_their_type(self):
+        NotificationService.notify_staff("contact_message", "Message", "-")
+
+        self.assertEqual(
+            sorted(OutgoingEmail.objects.values_list("recipients", flat=True)),
+            [["admin@example.com"], ["gerant@example.com"]],
+        )
+        self.assertFalse(Notification.objects.filter(digest_pending=True).exists())
+
+    def test_without_email_nothing_waits_for_a_digest(self):
+        NotificationService.notify_staff(
+            "order_created", "Nouvelle commande", "CMD-1", email=False
+        )
+
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertFalse(Notification.objects.filter(digest_pending=True).exists())
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_query_count_does_not_grow_with_staff(self):
+        def notify():
+            NotificationService.invalidate_staff_recipients()
+            with CaptureQueriesContext(connection) as queries:
+                NotificationService.notify_staff("order_created", "Commande", "-")
+            return len(queries)
+
+        few = notify()
+        for i in range(10):
+            make_user(f"renfort{i}", is_staff=True)
+        self.clear_notifications()
+        self.assertEqual(notify(), few)
+        self.assertEqual(Notification.objects.count(), 12)
+
+
+class DigestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = make_user("gerant", is_staff=True)
+        self.night_shift = make_user("garde", is_staff=True)
+        Notification.objects.all().delete()
+        self.prefer(self.manager, "order_created", "daily")
+        self.prefer(self.manager, "contact_message", "daily")
+        self.prefer(self.manager, "complaint_created", "hourly")
+        self.prefer(self.night_shift, "order_created", "hourly")
+
+    def prefer(self, user, notification_type, delivery):
+        NotificationPreference.objects.create(
+            user=user, notification_type=notification_type, delivery=delivery
+        )
+
+    def notify(self, user, notification_type, count):
+        now = timezone.now()
+        for i in range(count):
+            notification = Notification.objects.create(
+                user=user,
+                notification_type=notification_type,
+                title="-",
+                message=f"{notification_type} {i}",
+                digest_pending=True,
+            )
+            # created_at is auto_now_add: one minute apart, the last one newest
+            Notification.objects.filter(pk=notification.pk).update(
+                created_at=now - timedelta(minutes=count - i)
+            )
+
+    def test_one_email_per_recipient_grouped_by_type(self):
+        self.notify(self.manager, "order_created", 5)
+        self.notify(self.manager, "contact_message", 1)
+        self.notify(self.manager, "complaint_created", 2)
+        self.notify(self.night_shift, "order_created", 1)
+
+        self.assertEqual(NotificationService.send_digests("daily"), 1)
+
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipients, ["gerant@example.com"])
+        self.assertTrue(email.subject.endswith("Résumé quotidien : 6 notification(s)"))
+        self.assertIn("Commande créée (5)", email.body)
+        self.assertIn("  - order_created 4\n", email.body)
+        self.assertNotIn("order_created 1\n", email.body)
+        self.assertIn("... et 2 autre(s)", email.body)
+        self.assertIn("Nouveau message de contact (1)", email.body)
+        self.assertNotIn("Réclamation", email.body)
+
+    def test_digest_is_sent_once(self):
+        self.notify(self.manager, "order_created", 2)
+        self.notify(self.manager, "complaint_created", 1)
+
+        self.assertEqual(NotificationService.send_digests("daily"), 1)
+        self.assertEqual(NotificationService.send_digests("daily"), 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+        # Other frequencies keep their pending notifications
+        self.assertEqual(
+            list(
+                Notification.objects.filter(digest_pending=True).values_list(
+                    "notification_type", flat=True
+                )
+            ),
+            ["complaint_created"],
+        )
+        self.assertEqual(NotificationService.send_digests("hourly"), 1)
+
+    def test_switching_back_to_instant_drops_pending_events(self):
+        self.notify(self.manager, "order_created", 2)
+
+        NotificationService.set_preferences(self.manager, {"order_created": "instant"})
+
+        self.assertEqual(NotificationService.send_digests("daily"), 0)
+        self.assertFalse(Notification.objects.filter(digest_pending=True).exists())
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("client")
+        self.other = make_user("voisin")
+        self.notifications = [
+            NotificationService.create_notification(
+                self.user, "order_created", "-", f"Commande {i}"
+            )
+            for i in range(4)
+        ]
+        NotificationService.create_notification(self.other, "order_created", "-", "-")
+
+    def assertCounterIsExact(self, user, expected):
+        self.assertEqual(NotificationService.get_navbar_data(user)[0], expected)
+        counter = NotificationCounter.objects.get(user=user)
+        self.assertEqual(counter.unread_count, expected)
+        self.assertEqual(user.notifications.filter(is_read=False).count(), expected)
+
+    def test_creation_counts(self):
+        self.assertCounterIsExact(self.user, 4)
+        self.assertCounterIsExact(self.other, 1)
+
+    def test_mark_as_read(self):
+        ids = [notification.pk for notification in self.notifications[:2]]
+        self.assertEqual(NotificationService.get_navbar_data(self.user)[0], 4)
+
+        # The cached navbar is replaced once the change is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(NotificationService.mark_as_read(ids, self.user), 2)
+            # Already read, or someone else's: not counted twice
+            self.assertEqual(NotificationService.mark_as_read(ids, self.user), 0)
+            self.assertEqual(NotificationService.mark_as_read(ids, self.other), 0)
+
+        self.assertCounterIsExact(self.user, 2)
+        self.assertCounterIsExact(self.other, 1)
+
+    def test_mark_all_as_read(self):
+        self.assertEqual(NotificationService.get_navbar_data(self.user)[0], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService.mark_all_as_read(self.user)
+
+        self.assertCounterIsExact(self.user, 0)
+        self.assertCounterIsExact(self.other, 1)
+
+    def test_delete(self):
+        self.assertEqual(NotificationService.get_navbar_data(self.user)[0], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService.mark_as_read([self.notifications[0].pk], self.user)
+            self.notifications[0].refresh_from_db()
+            self.notifications[0].delete()
+            self.notifications[1].delete()
+
+        self.assertCounterIsExact(self.user, 2)
+
+    def test_counter_never_goes_below_zero(self):
+        NotificationService.adjust_unread([self.user.pk], -10)
+        self.assertEqual(
+            NotificationCounter.objects.get(user=self.user).unread_count, 0
+        )
+
+    def test_missing_counter_is_rebuilt(self):
+        NotificationCounter.objects.filter(user=self.user).delete()
+        self.assertCounterIsExact(self.user, 4)
+
+        NotificationCounter.objects.filter(user=self.user).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService.create_notification(
+                self.user, "order_created", "-", "-"
+            )
+        self.assertCounterIsExact(self.user, 5)
+
+
+class PruneTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("client")
+        self.now = timezone.now()
+        self.cutoff = self.now - timedelta(days=90)
+        Notification.objects.all().delete()
+        self.old_read = [
+            self.notify(f"Ancienne {i}", days=120 + i, is_read=True) for i in range(5)
+        ]
+        self.old_unread = self.notify("Non lue", days=200)
+        self.recent_read = self.notify("Récente", days=10, is_read=True)
+
+    def notify(self, message, days, is_read=False):
+        notification = NotificationService.create_notification(
+            self.user, "order_shipped", "Commande expédiée", message
+        )
+        if is_read:
+            NotificationService.mark_as_read([notification.pk], self.user)
+        Notification.objects.filter(pk=notification.pk).update(
+            created_at=self.now - timedelta(days=days)
+        )
+        return notification
+
+    def prune(self, chunk_size=2, archive=True):
+        chunks, last_id = [], 0
+        while True:
+            count, last_id = NotificationService.prune_chunk(
+                self.cutoff, chunk_size, after_id=last_id, archive=archive
+            )
+            if not count:
+                return chunks
+            chunks.append(count)
+
+    def test_old_read_notifications_are_archived_then_deleted(self):
+        self.assertEqual(self.prune(), [2, 2, 1])
+
+        self.assertEqual(
+            set(Notification.objects.values_list("pk", flat=True)),
+            {self.old_unread.pk, self.recent_read.pk},
+        )
+        archived = NotificationArchive.objects.order_by("created_at")
+        self.assertEqual(
+            list(archived.values_list("message", "created_at")),
+            [
+                (f"Ancienne {i}", self.now - timedelta(days=120 + i))
+                for i in reversed(range(5))
+            ],
+        )
+        self.assertTrue(
+            all(
+                row.user_id == self.user.pk and row.notification_type == "order_shipped"
+                for row in archived
+            )
+        )
+
+    def test_delete_only_mode_archives_nothing(self):
+        self.assertEqual(self.prune(archive=False), [2, 2, 1])
+
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertFalse(NotificationArchive.objects.exists())
+
+    def test_unread_counter_is_unchanged(self):
+        self.assertEqual(self.user.notification_counter.unread_count, 1)
+
+        self.prune()
+
+        counter = NotificationCounter.objects.get(user=self.user)
+        self.assertEqual(counter.unread_count, 1)
+        self.assertEqual(
+            Notification.objects.filter(user=self.user, is_read=False).count(), 1
+        )
+
+    def test_failed_chunk_keeps_its_rows(self):
+        # The copy and the delete share a transaction: rows are never lost
+        with mock.patch.object(
+            QuerySet, "delete", side_effect=DatabaseError("disque plein")
+        ):
+            with self.assertRaises(DatabaseError):
+                NotificationService.prune_chunk(self.cutoff, 10)
+
+        self.assertFalse(NotificationArchive.objects.exists())
+        self.assertEqual(Notification.objects.count(), 7)
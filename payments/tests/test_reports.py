@@ -0,0 +1,260 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from payments import reports
+from payments.models import Complaint, ComplaintReason
+from payments.services import ReportService
+from products.models import Category, ProductReview
+
+from .factories import make_order, make_product, make_user
+
+
+class CategoryReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("client")
+        self.start_date = timezone.now() - timedelta(days=30)
+        self.start_day = timezone.localdate(self.start_date)
+
+    def add_categories(self, count):
+        """``count`` categories, each with two products sold and reviewed"""
+        first = Category.objects.count()
+        for i in range(first, first + count):
+            category = Category.objects.create(name=f"Catégorie {i}", slug=f"cat-{i}")
+            products = [
+                make_product(f"P{i}-{j}", price="100", category=category)
+                for j in range(2)
+            ]
+            make_order(
+                self.user,
+                [(products[0], None, 1), (products[1], None, 2)],
+                status="paid",
+            )
+            for product in products:
+                ProductReview.objects.create(
+                    product=product, user=self.user, rating=4, title="-", comment="-"
+                )
+
+    def test_category_performance(self):
+        self.add_categories(1)
+        # Pending orders are not sales
+        make_order(self.user, [(make_product("ATTENTE", price="100"), None, 5)])
+
+        self.assertEqual(
+            ReportService.get_category_performance(self.start_day),
+            [
+                {
+                    "product__category__name": "Catégorie 0",
+                    "total_quantity": 3,
+                    "total_revenue": Decimal("300"),
+                    "unique_products": 2,
+                }
+            ],
+        )
+        self.assertEqual(
+            ReportService.get_category_performance(
+                self.start_day, self.start_day + timedelta(days=1)
+            ),
+            [],
+        )
+
+    def test_query_count_does_not_grow_with_categories_and_lines(self):
+        for added in (1, 5):
+            self.add_categories(added)
+            categories = Category.objects.count()
+            with self.subTest(categories=categories):
+                with self.assertNumQueries(2):
+                    rows = ReportService.get_category_performance(self.start_day)
+                with self.assertNumQueries(1):
+                    ratings = ReportService.get_ratings_by_category(self.start_date)
+                self.assertEqual(len(rows), categories)
+                self.assertEqual(len(ratings), categories)
+
+
+class BuildReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def cached_sections(self, context):
+        return {
+            timing["name"] for timing in context["report_timings"] if timing["cached"]
+        }
+
+    def test_sections_are_cached_per_period(self):
+        self.assertEqual(self.cached_sections(reports.build_report(30)), set())
+
+        with self.assertNumQueries(0):
+            context = reports.build_report(30)
+        self.assertEqual(self.cached_sections(context), set(reports._sections))
+
+        # The cohorts do not depend on the period
+        self.assertEqual(self.cached_sections(reports.build_report(7)), {"cohorts"})
+
+    def test_refresh_recomputes_every_section(self):
+        reports.build_report(30)
+        self.assertEqual(
+            self.cached_sections(reports.build_report(30, refresh=True)), set()
+        )
+
+    def test_refresh_section(self):
+        timing = reports.refresh_section("cohorts")
+
+        self.assertFalse(timing["cached"])
+        self.assertIn("reports:cohorts", cache)
+        self.assertEqual(self.cached_sections(reports.build_report(90)), {"cohorts"})
+        with self.assertRaises(ValueError):
+            reports.refresh_section("financial")
+
+    def test_cache_timeout_follows_the_settings(self):
+        with override_settings(REPORT_CACHE_TIMEOUT=10, COHORT_REPORT_CACHE_TIMEOUT=20):
+            self.assertEqual(reports.cache_timeout("financial"), 10)
+            self.assertEqual(reports.cache_timeout("cohorts"), 20)
+        with override_settings(COHORT_REPORT_CACHE_TIMEOUT=40):
+            self.assertEqual(reports.cache_timeout("cohorts"), 40)
+
+    def test_parse_period(self):
+        for value, period in [
+            ("7", 7),
+            ("365", 365),
+            (None, 30),
+            ("abc", 30),
+            ("12", 30),
+            ("-7", 30),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(reports.parse_period(value), period)
+
+
+class ResolutionStatsTests(TestCase):
+    # Hours to resolve, with the reason and handler of each complaint
+    DURATIONS = [
+        (1, "Colis abîmé", "alice"),
+        (2, "Colis abîmé", "alice"),
+        (3, "Colis abîmé", "bruno"),
+        (4, "Retard", "bruno"),
+        (10, None, None),
+    ]
+
+    def setUp(self):
+        cache.clear()
+        user = make_user("client")
+        order = make_order(user)
+        handlers = {name: make_user(name) for name in ("alice", "bruno")}
+        reasons = {}
+        self.start_date = timezone.now() - timedelta(days=7)
+        created_at = self.start_date + timedelta(days=1)
+        for hours, reason, handler in self.DURATIONS:
+            if reason and reason not in reasons:
+                reasons[reason] = ComplaintReason.objects.create(name=reason)
+            complaint = Complaint.objects.create(
+                user=user,
+                order=order,
+                description="-",
+                reason=reasons.get(reason),
+                handled_by=handlers.get(handler),
+            )
+            Complaint.objects.filter(pk=complaint.pk).update(
+                status="resolved",
+                created_at=created_at,
+                resolved_at=created_at + timedelta(hours=hours),
+            )
+        # Neither still open nor created before the period
+        Complaint.objects.create(user=user, order=order, description="-")
+        old = Complaint.objects.create(user=user, order=order, description="-")
+        Complaint.objects.filter(pk=old.pk).update(
+            status="resolved",
+            created_at=self.start_date - timedelta(days=1),
+            resolved_at=self.start_date,
+        )
+
+    def rounded(self, stats):
+        def round_row(row):
+            return {
+                key: round(value, 6) if isinstance(value, float) else value
+                for key, value in row.items()
+            }
+
+        return {
+            **round_row({k: v for k, v in stats.items() if not k.startswith("by_")}),
+            "by_reason": [round_row(row) for row in stats["by_reason"]],
+            "by_handler": [round_row(row) for row in stats["by_handler"]],
+        }
+
+    def test_known_durations(self):
+        # Linear interpolation: the p90 of 1, 2, 3, 4, 10 is 4 + 0.6 * 6
+        self.assertEqual(
+            self.rounded(ReportService.get_resolution_stats(self.start_date)),
+            {
+                "count": 5,
+                "mean_hours": 4.0,
+                "median_hours": 3.0,
+                "p90_hours": 7.6,
+                "by_reason": [
+                    {
+                        "reason__name": "Colis abîmé",
+                        "count": 3,
+                        "mean_hours": 2.0,
+                        "median_hours": 2.0,
+                        "p90_hours": 2.8,
+                    },
+                    {
+                        "reason__name": "Retard",
+                        "count": 1,
+                        "mean_hours": 4.0,
+                        "median_hours": 4.0,
+                        "p90_hours": 4.0,
+                    },
+                    {
+                        "reason__name": None,
+                        "count": 1,
+                        "mean_hours": 10.0,
+                        "median_hours": 10.0,
+                        "p90_hours": 10.0,
+                    },
+                ],
+                "by_handler": [
+                    {
+                        "handled_by__username": "alice",
+                        "count": 2,
+                        "mean_hours": 1.5,
+                        "median_hours": 1.5,
+                        "p90_hours": 1.9,
+                    },
+                    {
+                        "handled_by__username": "bruno",
+                        "count": 2,
+                        "mean_hours": 3.5,
+                        "median_hours": 3.5,
+                        "p90_hours": 3.9,
+                    },
+                    {
+                        "handled_by__username": None,
+                        "count": 1,
+                        "mean_hours": 10.0,
+                        "median_hours": 10.0,
+                        "p90_hours": 10.0,
+                    },
+                ],
+            },
+        )
+
+    def test_empty_range(self):
+        stats = ReportService.get_resolution_stats(timezone.now())
+
+        self.assertEqual(stats["count"], 0)
+        self.assertIsNone(stats["median_hours"])
+        self.assertEqual((stats["by_reason"], stats["by_handler"]), ([], []))
+
+    @skipUnless(connection.vendor == "postgresql", "percentile_cont is PostgreSQL's")
+    def test_percentile_cont_matches_the_numpy_fallback(self):
+        in_sql = ReportService.get_resolution_stats(self.start_date)
+        with mock.patch.object(connection, "vendor", "sqlite"):
+            in_numpy = ReportService.get_resolution_stats(self.start_date)
+
+        self.assertEqual(self.rounded(in_sql), self.rounded(in_numpy))
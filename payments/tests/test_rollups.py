@@ -0,0 +1,161 @@
+import importlib
+from decimal import Decimal
+
+from django.apps import apps
+from django.core.cache import cache
+from django.test import TestCase
+
+from payments.models import (
+    DailyCategorySales,
+    DailyProductSales,
+    DailySalesByStatus,
+    Order,
+    OrderItem,
+)
+from payments.services import SalesRollupService
+
+from .factories import make_order, make_product, make_user
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("client")
+        self.gloves = make_product("GANTS", price="500")
+        self.masks = make_product("MASQUES", price="200")
+
+    def product_row(self, product):
+        return (
+            DailyProductSales.objects.filter(product=product)
+            .values("order_count", "quantity", "revenue")
+            .first()
+        )
+
+    def assertInStep(self):
+        self.assertEqual(SalesRollupService.reconcile(), 0)
+
+    def test_created_order_counts_once_per_product(self):
+        make_order(
+            self.user,
+            [(self.gloves, None, 2), (self.gloves, None, 1), (self.masks, None, 1)],
+            status="paid",
+        )
+
+        self.assertEqual(
+            self.product_row(self.gloves),
+            {"order_count": 1, "quantity": 3, "revenue": Decimal("1500")},
+        )
+        self.assertEqual(self.product_row(self.masks)["order_count"], 1)
+        self.assertEqual(DailySalesByStatus.objects.get(status="paid").item_count, 4)
+        self.assertInStep()
+
+    def test_status_change_moves_the_lines(self):
+        order = make_order(self.user, [(self.gloves, None, 2), (self.gloves, None, 1)])
+        self.assertIsNone(self.product_row(self.gloves))
+
+        order.status = "paid"
+        order.save()
+        self.assertEqual(self.product_row(self.gloves)["order_count"], 1)
+        self.assertInStep()
+
+        SalesRollupService.update_status(Order.objects.filter(pk=order.pk), "rejected")
+        self.assertEqual(self.product_row(self.gloves)["order_count"], 0)
+        self.assertInStep()
+
+    def test_line_edits(self):
+        order = make_order(
+            self.user,
+            [(self.gloves, None, 2), (self.gloves, None, 1)],
+            status="paid",
+        )
+        first, second = order.items.order_by("pk")
+
+        first.quantity = 5
+        first.save()
+        self.assertEqual(self.product_row(self.gloves)["quantity"], 6)
+        self.assertInStep()
+
+        # The order still has a line of gloves
+        first.product = self.masks
+        first.save()
+        self.assertEqual(self.product_row(self.gloves)["order_count"], 1)
+        self.assertEqual(self.product_row(self.masks)["order_count"], 1)
+        self.assertInStep()
+
+        second.delete()
+        self.assertEqual(self.product_row(self.gloves)["order_count"], 0)
+        self.assertInStep()
+
+    def test_deleting_one_of_two_lines_keeps_the_order_counted(self):
+        order = make_order(
+            self.user,
+            [(self.gloves, None, 2), (self.gloves, None, 1)],
+            status="paid",
+        )
+
+        order.items.order_by("pk").first().delete()
+
+        self.assertEqual(
+            self.product_row(self.gloves),
+            {"order_count": 1, "quantity": 1, "revenue": Decimal("500")},
+        )
+        self.assertInStep()
+
+    def test_deleted_order_takes_its_lines_along(self):
+        make_order(self.user, [(self.gloves, None, 1)], status="paid")
+        order = make_order(
+            self.user,
+            [(self.gloves, None, 2), (self.gloves, None, 1)],
+            status="paid",
+        )
+
+        order.delete()
+
+        self.assertEqual(
+            self.product_row(self.gloves),
+            {"order_count": 1, "quantity": 1, "revenue": Decimal("500")},
+        )
+        self.assertEqual(DailySalesByStatus.objects.get(status="paid").order_count, 1)
+        self.assertInStep()
+
+    def test_line_added_through_a_stale_order_uses_the_stored_status(self):
+        order = make_order(self.user, [(self.masks, None, 1)])
+        SalesRollupService.update_status(Order.objects.filter(pk=order.pk), "paid")
+
+        # order.status is still "pending_confirmation" in memory
+        OrderItem.objects.create(
+            order=order, product=self.gloves, quantity=1, price=Decimal("500")
+        )
+
+        self.assertEqual(self.product_row(self.gloves)["order_count"], 1)
+        self.assertFalse(
+            DailySalesByStatus.objects.filter(
+                status="pending_confirmation", item_count__gt=0
+            ).exists()
+        )
+        self.assertInStep()
+
+
+class BackfillMigrationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = make_user("client")
+        gloves = make_product("GANTS", price="500")
+        make_order(user, [(gloves, None, 2), (gloves, None, 1)], status="delivered")
+        make_order(user, [(gloves, None, 4)])
+
+    def test_rollups_are_rebuilt_from_the_orders(self):
+        DailyProductSales.objects.all().delete()
+        DailySalesByStatus.objects.update(order_count=99)
+
+        migration = importlib.import_module(
+            "payments.migrations.0017_backfill_sales_rollups"
+        )
+        migration.build_sales_rollups(apps, None)
+
+        self.assertEqual(
+            list(DailyProductSales.objects.values("order_count", "quantity")),
+            [{"order_count": 1, "quantity": 3}],
+        )
+        self.assertEqual(DailyCategorySales.objects.get().revenue, Decimal("1500"))
+        self.assertEqual(SalesRollupService.reconcile(), 0)
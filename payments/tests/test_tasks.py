@@ -0,0 +1,190 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from payments.models import DeferredTask, Order, ShippingType
+from payments.signals import handle_order_creation_and_status
+from payments.tasks import LEASE_SECONDS, deferred, enqueue, run_due_tasks, run_task
+
+from .factories import make_order, make_user
+
+calls = []
+
+
+@deferred
+def record_call(sender, instance, created, **kwargs):
+    calls.append((instance.pk, instance.name, created))
+
+
+@deferred
+def fail_after_writing(sender, instance, created, **kwargs):
+    ShippingType.objects.filter(pk=instance.pk).update(name="Modifié")
+    raise ValueError("transporteur indisponible")
+
+
+@deferred
+def read_own_task(sender, instance, created, **kwargs):
+    calls.extend(DeferredTask.objects.values_list("attempts", "next_attempt_at").get())
+
+
+def task_name(handler):
+    return f"{__name__}.{handler.__name__}"
+
+
+@override_settings(DEFERRED_TASKS_MAX_ATTEMPTS=3, DEFERRED_TASKS_BACKOFF_SECONDS=30)
+class RunTaskTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.shipping_type = ShippingType.objects.create(
+            name="Express", estimated_days=1, cost=Decimal("900")
+        )
+
+    def enqueue(self, handler):
+        return enqueue(
+            task_name(handler),
+            model="payments.ShippingType",
+            pk=self.shipping_type.pk,
+            created=False,
+        )
+
+    def make_due(self, task):
+        DeferredTask.objects.filter(pk=task.pk).update(next_attempt_at=timezone.now())
+
+    def test_handler_gets_the_current_row(self):
+        task = self.enqueue(record_call)
+        ShippingType.objects.filter(pk=self.shipping_type.pk).update(name="Express 24h")
+
+        self.assertIs(run_task(task.pk), True)
+
+        self.assertEqual(calls, [(self.shipping_type.pk, "Express 24h", False)])
+        self.assertFalse(DeferredTask.objects.exists())
+
+    def test_deleted_row_is_skipped(self):
+        task = self.enqueue(record_call)
+        self.shipping_type.delete()
+
+        self.assertIs(run_task(task.pk), True)
+        self.assertEqual(calls, [])
+        self.assertFalse(DeferredTask.objects.exists())
+
+    def test_claimed_task_is_leased(self):
+        task = self.enqueue(record_call)
+        # Another runner claimed it and is still within its lease
+        DeferredTask.objects.filter(pk=task.pk).update(
+            attempts=1, next_attempt_at=timezone.now() + timedelta(seconds=60)
+        )
+
+        self.assertIsNone(run_task(task.pk))
+        self.assertEqual(run_due_tasks(), (0, 0))
+        self.assertEqual(calls, [])
+
+        # The lease ran out: that runner died, the task is retried
+        self.make_due(task)
+        self.assertIs(run_task(task.pk), True)
+        self.assertEqual(len(calls), 1)
+
+    def test_running_task_is_leased(self):
+        task = self.enqueue(read_own_task)
+        started = timezone.now()
+
+        self.assertIs(run_task(task.pk), True)
+
+        # What the row looked like to other runners while the handler ran
+        attempts, next_attempt_at = calls
+        self.assertEqual(attempts, 1)
+        self.assertGreaterEqual(
+            next_attempt_at, started + timedelta(seconds=LEASE_SECONDS)
+        )
+
+    def test_failure_is_retried_with_backoff_then_marked_failed(self):
+        task = self.enqueue(fail_after_writing)
+
+        before = timezone.now()
+        self.assertIs(run_task(task.pk), False)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("pending", 1))
+        self.assertEqual(task.last_error, "ValueError: transporteur indisponible")
+        self.assertGreaterEqual(task.next_attempt_at, before + timedelta(seconds=30))
+        # The handler's write was rolled back with the failed attempt
+        self.shipping_type.refresh_from_db()
+        self.assertEqual(self.shipping_type.name, "Express")
+        # Not due before the backoff
+        self.assertIsNone(run_task(task.pk))
+
+        self.make_due(task)
+        before = timezone.now()
+        self.assertIs(run_task(task.pk), False)
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 2)
+        self.assertGreaterEqual(task.next_attempt_at, before + timedelta(seconds=60))
+
+        self.make_due(task)
+        self.assertIs(run_task(task.pk), False)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("failed", 3))
+
+        self.make_due(task)
+        self.assertIsNone(run_task(task.pk))
+        self.assertEqual(run_due_tasks(), (0, 0))
+
+    def test_unknown_handler_fails(self):
+        task = enqueue("payments.signals.disparu", model="payments.ShippingType", pk=1)
+
+        self.assertIs(run_task(task.pk), False)
+        task.refresh_from_db()
+        self.assertIn("LookupError", task.last_error)
+
+    def test_run_due_tasks(self):
+        for _ in range(3):
+            self.enqueue(record_call)
+        self.enqueue(fail_after_writing)
+        later = self.enqueue(record_call)
+        DeferredTask.objects.filter(pk=later.pk).update(
+            next_attempt_at=timezone.now() + timedelta(hours=1)
+        )
+
+        self.assertEqual(run_due_tasks(batch_size=2), (2, 0))
+        self.assertEqual(run_due_tasks(), (1, 1))
+        self.assertEqual(run_due_tasks(), (0, 0))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(DeferredTask.objects.count(), 2)
+
+
+class DeferredReceiverTests(TestCase):
+    handler = "payments.signals.handle_order_creation_and_status"
+
+    def setUp(self):
+        cache.clear()
+        self.order = make_order(make_user("client"))
+
+    def queued(self):
+        return DeferredTask.objects.filter(handler=self.handler).count()
+
+    def test_only_saves_that_change_the_status_enqueue(self):
+        self.assertEqual(self.queued(), 1)
+
+        self.order.save()
+        self.order.tracking_number = "YAL-0001"
+        self.order.save()
+        Order.objects.get(pk=self.order.pk).save()
+        self.assertEqual(self.queued(), 1)
+
+        self.order.status = "confirmed"
+        self.order.save()
+        self.assertEqual(self.queued(), 2)
+        self.order.save()
+        self.assertEqual(self.queued(), 2)
+
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = "rejected"
+        order.save()
+        self.assertEqual(self.queued(), 3)
+
+    def test_raw_saves_enqueue_nothing(self):
+        handle_order_creation_and_status(
+            sender=Order, instance=self.order, created=True, raw=True
+        )
+        self.assertEqual(self.queued(), 1)
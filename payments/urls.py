@@ -7,6 +7,9 @@ urlpatterns = [
     path("cart/", views.cart, name="cart"),
     path("add-to-cart/", views.add_to_cart, name="add_to_cart"),
     path("update-cart/", views.update_cart, name="update_cart"),
+    path("cart/batch/", views.batch_update_cart, name="batch_update_cart"),
+    path("cart/import/", views.cart_import, name="cart_import"),
+    path("order/<int:order_id>/reorder/", views.reorder, name="reorder"),
     path(
         "remove-from-cart/<int:item_id>/",
         views.remove_from_cart,
@@ -50,4 +53,14 @@ urlpatterns = [
         views.mark_all_notifications_read,
         name="mark_all_notifications_read",
     ),
+    path(
+        "notifications/stream/",
+        views.notification_stream,
+        name="notification_stream",
+    ),
+    path(
+        "notifications/preferences/",
+        views.notification_preferences,
+        name="notification_preferences",
+    ),
 ]
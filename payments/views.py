@@ -2,16 +2,21 @@ from django.shortcuts import render, redirect, get_object_or_404
 
 
 from django.views.decorators.http import require_POST
+import asyncio
 import json
+import uuid
 
 
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
-from products.models import Product, ProductVariant
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.wsgi import WSGIRequest
+from asgiref.sync import sync_to_async
 from .models import *
 from .forms import *
 from .services import *
+from .events import broker, notification_event
 
 
 @login_required
@@ -26,9 +31,8 @@ def cart(request):
     # Calculate tax
     from pages.models import SiteInformation
 
-    site_info = SiteInformation.get_instance()
     subtotal = cart.get_total_price()
-    tax_amount = subtotal * site_info.tva_rate
+    tax_amount = subtotal * SiteInformation.get_tva_rate()
     total = subtotal + tax_amount
 
     context = {
@@ -46,83 +50,36 @@ def cart(request):
 def add_to_cart(request):
     try:
         data = json.loads(request.body)
-        product_id = data.get("product_id")
-        variant_id = data.get("variant_id")
-        quantity = int(data.get("quantity", 1))
-
-        product = Product.objects.get(id=product_id)
-        variant = None
-
-        # Get variant if specified
-        if variant_id:
-
-            variant = ProductVariant.objects.get(id=variant_id, product=product)
-        else:
-            # Auto-select cheapest variant if no variant specified
-
-            available_variants = ProductVariant.objects.filter(
-                product=product, is_active=True, stock_quantity__gt=0
-            )
-            if available_variants.exists():
-                # Get cheapest variant
-                variant = min(available_variants, key=lambda v: v.get_total_price())
-
-        # Check stock
-        if variant:
-            if variant.stock_quantity < quantity:
-                return JsonResponse(
-                    {
-                        "success": False,
-                        "message": f"Stock insuffisant. Seulement {variant.stock_quantity} disponible(s)",
-                    }
-                )
-        else:
-            if product.stock_quantity < quantity:
-                return JsonResponse(
-                    {
-                        "success": False,
-                        "message": f"Stock insuffisant. Seulement {product.stock_quantity} disponible(s)",
-                    }
-                )
-
-        cart, created = Cart.objects.get_or_create(user=request.user)
-
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product, variant=variant, defaults={"quantity": quantity}
+        outcome = CartService.apply_operations(
+            request.user,
+            [
+                {
+                    "product_id": data.get("product_id"),
+                    "variant_id": data.get("variant_id"),
+                    "quantity": data.get("quantity", 1),
+                    "mode": "add",
+                }
+            ],
         )
+        result = outcome["results"][0]
 
-        if not created:
-            new_quantity = cart_item.quantity + quantity
-
-            # Check stock for updated quantity
-            max_stock = variant.stock_quantity if variant else product.stock_quantity
-            if new_quantity > max_stock:
-                return JsonResponse(
-                    {
-                        "success": False,
-                        "message": f"Impossible d'ajouter {quantity}. Stock maximum: {max_stock}",
-                    }
-                )
-
-            cart_item.quantity = new_quantity
-            cart_item.save()
+        if not result["success"]:
+            return JsonResponse({"success": False, "message": result["message"]})
 
         # Build success message
         message = "Produit ajouté au panier"
-        if variant and not variant_id:  # Auto-selected variant
-            message = f"Variante '{variant.variant_value}' ajoutée au panier"
+        if result["auto_selected_variant"]:
+            message = f"Variante '{result['auto_selected_variant']}' ajoutée au panier"
 
         return JsonResponse(
             {
                 "success": True,
                 "message": message,
-                "cart_count": cart.get_total_items(),
-                "cart_total": str(cart.get_total_price()),
+                "cart_count": outcome["cart_count"],
+                "cart_total": str(outcome["cart_total"]),
             }
         )
 
-    except Product.DoesNotExist:
-        return JsonResponse({"success": False, "message": "Produit non trouvé"})
     except Exception as e:
         return JsonResponse({"success": False, "message": str(e)})
 
@@ -132,33 +89,123 @@ def add_to_cart(request):
 def update_cart(request):
     try:
         data = json.loads(request.body)
-        cart_item_id = data.get("cart_item_id")
-        quantity = int(data.get("quantity", 1))
+        outcome = CartService.apply_operations(
+            request.user,
+            [
+                {
+                    "cart_item_id": data.get("cart_item_id"),
+                    "quantity": data.get("quantity", 1),
+                }
+            ],
+        )
+        result = outcome["results"][0]
+
+        if not result["success"]:
+            return JsonResponse({"success": False, "message": result["message"]})
 
-        cart_item = CartItem.objects.get(id=cart_item_id, cart__user=request.user)
+        return JsonResponse(
+            {
+                "success": True,
+                "cart_total": str(outcome["cart_total"]),
+                "item_total": str(result["item_total"]),
+            }
+        )
 
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
-        else:
-            cart_item.delete()
+    except Exception as e:
+        return JsonResponse({"success": False, "message": str(e)})
 
-        cart = cart_item.cart
+
+@login_required
+@require_POST
+def batch_update_cart(request):
+    """Apply several cart line changes in a single request"""
+    try:
+        data = json.loads(request.body)
+        operations = data.get("operations")
+        if not isinstance(operations, list) or not operations:
+            return JsonResponse(
+                {"success": False, "message": "Aucune opération fournie"}
+            )
+        if len(operations) > CartService.MAX_OPERATIONS:
+            return JsonResponse(
+                {
+                    "success": False,
+                    "message": f"Maximum {CartService.MAX_OPERATIONS} opérations par requête",
+                }
+            )
+
+        outcome = CartService.apply_operations(request.user, operations)
+        results = outcome["results"]
+        for result in results:
+            if "item_total" in result:
+                result["item_total"] = str(result["item_total"])
 
         return JsonResponse(
             {
                 "success": True,
-                "cart_total": str(cart.get_total_price()),
-                "item_total": str(cart_item.get_total_price()) if quantity > 0 else "0",
+                "results": results,
+                "errors": sum(1 for result in results if not result["success"]),
+                "cart_count": outcome["cart_count"],
+                "cart_total": str(outcome["cart_total"]),
             }
         )
 
-    except CartItem.DoesNotExist:
-        return JsonResponse({"success": False, "message": "Cart item not found"})
     except Exception as e:
         return JsonResponse({"success": False, "message": str(e)})
 
 
+@login_required
+def cart_import(request):
+    """Bulk add products to the cart from a CSV of SKUs and quantities"""
+    report = None
+    if request.method == "POST":
+        form = CartImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                outcome = CartService.import_csv(
+                    request.user, form.cleaned_data["file"]
+                )
+            except ValueError as e:
+                form.add_error("file", str(e))
+            else:
+                report = outcome["report"]
+                added = sum(1 for line in report if line["success"])
+                if added:
+                    messages.success(request, f"{added} ligne(s) ajoutée(s) au panier.")
+                if added < len(report):
+                    messages.warning(
+                        request,
+                        f"{len(report) - added} ligne(s) n'ont pas pu être ajoutée(s).",
+                    )
+                form = CartImportForm()
+    else:
+        form = CartImportForm()
+
+    return render(
+        request, "payments/cart_import.html", {"form": form, "report": report}
+    )
+
+
+@login_required
+@require_POST
+def reorder(request, order_id):
+    """Add the items of a previous order to the cart"""
+    order = get_object_or_404(Order, id=order_id, user=request.user)
+    outcome = CartService.reorder(request.user, order)
+    results = outcome["results"]
+    added = sum(1 for result in results if result["success"])
+
+    if added:
+        messages.success(
+            request, f"{added} article(s) de la commande {order.order_id} ajouté(s)."
+        )
+    for result in results:
+        if not result["success"]:
+            messages.warning(request, result["message"])
+
+    return redirect("payments:cart")
+
+
 @login_required
 def remove_from_cart(request, item_id):
     try:
@@ -177,10 +224,7 @@ def remove_from_cart(request, item_id):
 @login_required
 def checkout(request):
     cart = get_object_or_404(Cart, user=request.user)
-
-    if not cart.items.exists():
-        messages.warning(request, "Your cart is empty.")
-        return redirect("payments:cart")
+    shortfalls = []
 
     if request.method == "POST":
         form = CheckoutForm(request.POST)
@@ -196,44 +240,54 @@ def checkout(request):
                 "shipping_zip": form.cleaned_data["shipping_zip"],
             }
 
-            order = OrderService.create_order_from_cart(
-                user=request.user, cart=cart, shipping_data=shipping_data
-            )
-
-            # Handle order note if provided
-            note_content = form.cleaned_data.get("order_note")
-            if note_content:
-                order_note = OrderNote.objects.create(
-                    order=order, content=note_content, created_by=request.user
+            # Replayed submissions return the order created by the first one
+            try:
+                order, created = CheckoutService.place_order(
+                    user=request.user,
+                    cart=cart,
+                    key=form.cleaned_data["idempotency_key"],
+                    shipping_data=shipping_data,
+                    note_content=form.cleaned_data.get("order_note"),
+                    files=files,
                 )
-
-                # Handle attachments
-                for file in files:
-                    OrderNoteAttachment.objects.create(
-                        order_note=order_note,
-                        file=file,
-                        file_name=file.name,
-                        file_type=file.content_type,
+            except InsufficientStock as e:
+                # Nothing was written; show the form again with the shortfalls
+                shortfalls = e.shortfalls
+                messages.error(request, str(e))
+            else:
+                if order is None:
+                    messages.warning(request, "Your cart is empty.")
+                    return redirect("payments:cart")
+
+                if created:
+                    messages.success(
+                        request,
+                        f"Order {order.order_id} placed successfully! Awaiting admin confirmation.",
+                    )
+                else:
+                    messages.info(
+                        request, f"Order {order.order_id} was already placed."
                     )
+                return redirect("accounts:dashboard")
 
-            messages.success(
-                request,
-                f"Order {order.order_id} placed successfully! Awaiting admin confirmation.",
-            )
-            return redirect("accounts:dashboard")
+    if not cart.items.exists():
+        messages.warning(request, "Your cart is empty.")
+        return redirect("payments:cart")
 
-    else:
+    if request.method != "POST":
         # Pre-fill with user profile data
-        initial = {}
+        initial = {"idempotency_key": uuid.uuid4()}
         if hasattr(request.user, "profile"):
             profile = request.user.profile
-            initial = {
-                "shipping_address": profile.address,
-                "shipping_city": profile.city,
-                "shipping_state": profile.state,
-                "shipping_zip": profile.zip_code,
-                "billing_same": True,
-            }
+            initial.update(
+                {
+                    "shipping_address": profile.address,
+                    "shipping_city": profile.city,
+                    "shipping_state": profile.state,
+                    "shipping_zip": profile.zip_code,
+                    "billing_same": True,
+                }
+            )
         form = CheckoutForm(initial=initial)
 
     # Get active shipping types for display
@@ -244,7 +298,12 @@ def checkout(request):
     return render(
         request,
         "payments/checkout.html",
-        {"form": form, "cart": cart, "shipping_types": shipping_types},
+        {
+            "form": form,
+            "cart": cart,
+            "shipping_types": shipping_types,
+            "shortfalls": shortfalls,
+        },
     )
 
 
@@ -383,12 +442,132 @@ def mark_notification_read(request, notification_id):
     notification = get_object_or_404(
         Notification, id=notification_id, user=request.user
     )
-    notification.is_read = True
-    notification.save()
+    NotificationService.mark_as_read([notification.id], request.user)
     return JsonResponse({"success": True})
 
 
+def _new_notifications(user_id, after_id):
+    """Notifications created after ``after_id``, as stream events"""
+    return [
+        notification_event(notification)
+        for notification in Notification.objects.filter(
+            user_id=user_id, id__gt=after_id
+        ).order_by("id")[:50]
+    ]
+
+
+def _latest_notification_id(user_id):
+    return (
+        Notification.objects.filter(user_id=user_id)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+        or 0
+    )
+
+
+async def notification_stream(request):
+    """Stream the user's new notifications as Server-Sent Events.
+
+    Events come from the in-process broker; with
+    ``NOTIFICATION_STREAM_POLL_INTERVAL`` set, the database is also polled
+    so events written by other worker processes arrive too. Reconnecting
+    clients send ``Last-Event-ID`` and get what they missed.
+
+    Unless ``NOTIFICATION_STREAM_ENABLED`` is set, and always under WSGI,
+    the view answers 204, which tells ``EventSource`` not to reconnect: a
+    WSGI worker would otherwise be held by the endless response.
+    """
+    if not getattr(settings, "NOTIFICATION_STREAM_ENABLED", False) or isinstance(
+        request, WSGIRequest
+    ):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    heartbeat = getattr(settings, "NOTIFICATION_STREAM_HEARTBEAT", 15)
+    poll_interval = getattr(settings, "NOTIFICATION_STREAM_POLL_INTERVAL", 0)
+    timeout = min(heartbeat, poll_interval) if poll_interval else heartbeat
+    last_event_id = request.headers.get("Last-Event-ID", "")
+
+    def format_event(event):
+        return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event)}\n\n"
+
+    async def events():
+        queue = broker.subscribe(user.id)
+        try:
+            # Everything after this point reaches the client, either from the
+            # queue or from the database
+            if last_event_id.isdigit():
+                last_id = int(last_event_id)
+                missed = await sync_to_async(_new_notifications)(user.id, last_id)
+            else:
+                last_id = 0
+                if poll_interval:
+                    last_id = await sync_to_async(_latest_notification_id)(user.id)
+                missed = []
+
+            yield "retry: 5000\n\n"
+            for event in missed:
+                last_id = event["id"]
+                yield format_event(event)
+
+            # Pushed events never postpone the next poll or heartbeat
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), max(deadline - loop.time(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    event = None
+
+                if event is not None:
+                    if event["id"] > last_id:
+                        last_id = event["id"]
+                        yield format_event(event)
+                    continue
+
+                deadline = loop.time() + timeout
+                polled = []
+                if poll_interval:
+                    polled = await sync_to_async(_new_notifications)(user.id, last_id)
+                for event in polled:
+                    last_id = event["id"]
+                    yield format_event(event)
+                if not polled:
+                    yield ": heartbeat\n\n"
+        finally:
+            broker.unsubscribe(user.id, queue)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 @login_required
 def mark_all_notifications_read(request):
     NotificationService.mark_all_as_read(request.user)
     return JsonResponse({"success": True})
+
+
+@login_required
+@user_passes_test(lambda user: user.is_staff)
+def notification_preferences(request):
+    """Choose instant emails or an hourly/daily digest per notification type"""
+    preferences = NotificationService.get_preferences(request.user)
+
+    if request.method == "POST":
+        form = NotificationPreferenceForm(request.POST, preferences=preferences)
+        if form.is_valid():
+            NotificationService.set_preferences(request.user, form.cleaned_data)
+            messages.success(request, "Préférences de notification enregistrées.")
+            return redirect("payments:notification_preferences")
+    else:
+        form = NotificationPreferenceForm(preferences=preferences)
+
+    return render(request, "payments/notification_preferences.html", {"form": form})
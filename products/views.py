@@ -5,11 +5,10 @@ from django.http import JsonResponse
 from django.core.paginator import Paginator
 from django.db.models import Q, Avg, Count, Min, Max
 from django.urls import reverse
-from django.core.mail import send_mail
-from django.conf import settings
 from django.contrib.auth.models import User
 import json
 
+from payments.services import MailService
 from .models import Product, Category, Brand, ProductReview, ProductQuestion, Wishlist
 from .forms import ProductReviewForm, ProductQuestionForm
 
@@ -253,21 +252,11 @@ def toggle_wishlist(request):
 
 
 def send_admin_notification(subject, message):
-    """Send email notification to all superusers"""
-    try:
-        admin_emails = list(
-            User.objects.filter(is_superuser=True).values_list("email", flat=True)
-        )
-        if admin_emails:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=admin_emails,
-                fail_silently=True,
-            )
-    except Exception as e:
-        print(f"Error sending admin notification: {e}")
+    """Queue an email notification to all superusers"""
+    admin_emails = list(
+        User.objects.filter(is_superuser=True).values_list("email", flat=True)
+    )
+    MailService.enqueue(subject=subject, body=message, recipients=admin_emails)
 
 
 @login_required
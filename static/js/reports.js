@@ -643,6 +643,73 @@ document.addEventListener("DOMContentLoaded", function () {
     });
   }
 
+  // 9. COHORT RETENTION CURVES
+  const cohortCtx = document.getElementById("cohortRetentionChart");
+  if (cohortCtx && window.reportData.cohortCurves) {
+    const curves = window.reportData.cohortCurves;
+    const palette = [
+      colors.primary,
+      colors.success,
+      colors.warning,
+      colors.info,
+      colors.danger,
+    ];
+
+    new Chart(cohortCtx, {
+      type: "line",
+      data: {
+        labels: curves[0].retention.map((_, month) => `M${month}`),
+        datasets: curves.map((curve, index) => ({
+          label: curve.label,
+          data: curve.retention,
+          borderColor: palette[index % palette.length],
+          backgroundColor: palette[index % palette.length],
+          borderWidth: index === 0 ? 3 : 2,
+          tension: 0.3,
+          spanGaps: false,
+          pointRadius: 3,
+        })),
+      },
+      options: {
+        responsive: true,
+        maintainAspectRatio: false,
+        plugins: {
+          legend: {
+            display: true,
+            position: "top",
+          },
+          tooltip: {
+            backgroundColor: "rgba(0, 0, 0, 0.8)",
+            padding: 12,
+            callbacks: {
+              label: function (context) {
+                return `${context.dataset.label}: ${context.parsed.y}%`;
+              },
+            },
+          },
+        },
+        scales: {
+          y: {
+            beginAtZero: true,
+            ticks: {
+              callback: function (value) {
+                return value + "%";
+              },
+            },
+            grid: {
+              color: "rgba(0, 0, 0, 0.05)",
+            },
+          },
+          x: {
+            grid: {
+              display: false,
+            },
+          },
+        },
+      },
+    });
+  }
+
   // Add animation on tab switch
   const tabLinks = document.querySelectorAll('[data-bs-toggle="tab"]');
   tabLinks.forEach((link) => {